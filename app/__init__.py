@@ -1 +1,4 @@
+from app.startup import load_environment
 
+# Every module reads its settings from the environment when it is imported, so .env is loaded first
+load_environment()
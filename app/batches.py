@@ -0,0 +1,184 @@
+import os
+import json
+import time
+import uuid
+import hashlib
+import zipfile
+import logging
+from typing import Any, Dict, List, Optional
+
+from fastapi import HTTPException
+
+logger = logging.getLogger(__name__)
+
+BATCHES_DIR = os.getenv("BATCHES_DIR", os.path.join("data", "batches"))
+# Largest accepted batch upload in bytes, all files and ZIP archives together
+MAX_BATCH_UPLOAD_SIZE = int(os.getenv("MAX_BATCH_UPLOAD_SIZE", str(1024 * 1024 * 1024)))
+# Most PDFs in one batch, counting the ones inside ZIP archives
+MAX_BATCH_DOCUMENTS = int(os.getenv("MAX_BATCH_DOCUMENTS", "200"))
+
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+def expand_zip(zip_path: str, upload_dir: str, max_size: int, max_documents: int) -> List[Dict[str, Any]]:
+    """Copy every PDF in a ZIP archive to a temporary file in ``upload_dir``.
+
+    Members are copied in chunks while their SHA-256 is computed, and a member
+    that turns out larger than ``max_size`` bytes once decompressed rejects
+    the archive with 413, whatever its header claims. Other members, like
+    folders or macOS resource forks, are skipped. Returns the same file
+    entries as ``receive_upload``; the caller owns the temporary files.
+    """
+    files: List[Dict[str, Any]] = []
+    try:
+        with zipfile.ZipFile(zip_path) as archive:
+            for member in archive.infolist():
+                filename = os.path.basename(member.filename)
+                if member.is_dir() or not filename.lower().endswith(".pdf") or "__MACOSX" in member.filename:
+                    continue
+                if len(files) >= max_documents:
+                    raise HTTPException(status_code=413, detail=f"A batch may contain at most {max_documents} PDFs")
+                path = os.path.join(upload_dir, f".{uuid.uuid4()}.part")
+                entry = {"field": "file", "filename": filename, "path": path, "size": 0}
+                files.append(entry)
+                digest = hashlib.sha256()
+                with archive.open(member) as source, open(path, "wb") as target:
+                    while True:
+                        chunk = source.read(COPY_CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        entry["size"] += len(chunk)
+                        if entry["size"] > max_size:
+                            raise HTTPException(status_code=413, detail=f"{filename} exceeds the {max_size} byte limit")
+                        digest.update(chunk)
+                        target.write(chunk)
+                entry["sha256"] = digest.hexdigest()
+    except BaseException as e:
+        for entry in files:
+            if os.path.exists(entry["path"]):
+                os.remove(entry["path"])
+        if isinstance(e, (zipfile.BadZipFile, RuntimeError, NotImplementedError)):
+            # Corrupt, encrypted or unsupported archives
+            raise HTTPException(status_code=400, detail=f"Could not read ZIP archive: {str(e)}")
+        raise
+    return files
+
+
+class BatchStore:
+    """Batches of documents translated together, one ``batch.json`` per batch.
+
+    A batch only records its documents and the jobs translating each of their
+    languages, progress is always read from the jobs, so any worker can
+    report it.
+    """
+
+    def __init__(self, batches_dir: str = BATCHES_DIR):
+        self.batches_dir = batches_dir
+        os.makedirs(batches_dir, exist_ok=True)
+
+    def _path(self, batch_id: str) -> str:
+        return os.path.join(self.batches_dir, f"{batch_id}.json")
+
+    def create(self, target_languages: List[str], documents: List[Dict[str, Any]]) -> Dict[str, Any]:
+        batch = {
+            "batch_id": str(uuid.uuid4()),
+            "target_languages": list(target_languages),
+            "documents": documents,
+            "created_at": time.time(),
+        }
+        path = self._path(batch["batch_id"])
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(batch, f)
+        os.replace(tmp_path, path)
+        return batch
+
+    def get(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        # Batch ids are looked up as file names, anything but a UUID is unknown
+        try:
+            uuid.UUID(batch_id)
+        except ValueError:
+            return None
+        path = self._path(batch_id)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+
+def batch_status(statuses: List[str]) -> str:
+    """Overall status of a batch from the statuses of its documents"""
+    if any(status in ("queued", "running") for status in statuses):
+        return "running"
+    failed = statuses.count("failed")
+    if not failed:
+        return "completed"
+    return "failed" if failed == len(statuses) else "partially_failed"
+
+
+def document_jobs(document: Dict[str, Any]) -> Dict[str, str]:
+    """Job translating each language of a batch document, batches from before per-language jobs have one"""
+    return document.get("jobs") or {"": document["job_id"]}
+
+
+def _language_progress(job: Dict[str, Any], language: str) -> Dict[str, Any]:
+    # A job translating several languages reports each of them once it started
+    for name, progress in (job.get("languages") or {}).items():
+        if name.lower() == language.lower():
+            return progress
+    # The one job of a batch from before per-language jobs reports all its languages together
+    languages = max(1, len(job.get("target_languages") or [None])) if language else 1
+    total_pages = job.get("total_pages")
+    return {
+        "progress": job.get("progress", 0),
+        "completed_pages": job.get("completed_pages", 0) // languages,
+        "total_pages": total_pages // languages if total_pages is not None else None,
+    }
+
+
+def summarize_batch(batch: Dict[str, Any], jobs: Dict[str, Optional[Dict[str, Any]]]) -> Dict[str, Any]:
+    """Progress of every document of a batch and of the batch as a whole.
+
+    A document's languages may be translated by different jobs, e.g. when
+    another job of the same document was already running, so its progress
+    is the mean of its languages' progress, each read from the job
+    translating it. Batch progress is the mean of the document progress, so
+    it moves as soon as any document does, even before the page counts of
+    the others are known. ``total_pages`` is only set once every document was
+    extracted.
+    """
+    documents = []
+    for document in batch["documents"]:
+        languages = []
+        for language, job_id in document_jobs(document).items():
+            job = jobs.get(job_id) or {}
+            progress = _language_progress(job, language) if job else {}
+            languages.append((job, progress))
+        statuses = [job.get("status", "failed") for job, _ in languages]
+        errors = [job.get("error") if job else "Job not found" for job, _ in languages]
+        totals = [progress.get("total_pages") for _, progress in languages]
+        documents.append(dict(
+            document,
+            status="running" if "running" in statuses or "queued" in statuses else
+            "failed" if "failed" in statuses else "completed",
+            progress=sum(progress.get("progress", 0) for _, progress in languages) / len(languages),
+            completed_pages=sum(progress.get("completed_pages", 0) for _, progress in languages),
+            total_pages=sum(totals) if None not in totals else None,
+            error=next((error for error in errors if error), None),
+        ))
+
+    statuses = [document["status"] for document in documents]
+    totals = [document["total_pages"] for document in documents]
+    return {
+        "batch_id": batch["batch_id"],
+        "target_languages": batch["target_languages"],
+        "status": batch_status(statuses),
+        "progress": sum(document["progress"] for document in documents) / len(documents) if documents else 100,
+        "total_documents": len(documents),
+        "completed_documents": statuses.count("completed"),
+        "failed_documents": statuses.count("failed"),
+        "completed_pages": sum(document["completed_pages"] for document in documents),
+        "total_pages": sum(totals) if None not in totals else None,
+        "documents": documents,
+        "created_at": batch["created_at"],
+    }
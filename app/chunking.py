@@ -0,0 +1,212 @@
+import os
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+# Estimated input tokens sent to the model in one request
+REQUEST_TOKEN_BUDGET = int(os.getenv("REQUEST_TOKEN_BUDGET", "1200"))
+# Context window of the model, shared by the prompt and the completion
+MODEL_CONTEXT_TOKENS = int(os.getenv("MODEL_CONTEXT_TOKENS", "4096"))
+# Tokens reserved for the system prompt and message framing
+PROMPT_OVERHEAD_TOKENS = 100
+# Smallest completion budget ever requested
+MIN_COMPLETION_TOKENS = 256
+
+SEGMENT_MARKER = "<<<SEGMENT {number}>>>"
+SEGMENT_MARKER_PATTERN = re.compile(r"^[ \t]*<<<SEGMENT (\d+)>>>[ \t]*$", re.MULTILINE)
+# A complete marker line inside a stream, with the newlines around it, or only the one after it at a line start
+_STREAM_MARKER_PATTERN = re.compile(r"\n[ \t]*<<<SEGMENT (\d+)>>>[ \t]*\n")
+_STREAM_MARKER_AT_LINE_START_PATTERN = re.compile(r"(?:^|\n)[ \t]*<<<SEGMENT (\d+)>>>[ \t]*\n")
+_MARKER_PREFIX = "<<<SEGMENT "
+
+# Boundaries tried in order when a text is over budget, each keeps its separator
+_SPLIT_PATTERNS = [
+    re.compile(r"(?<=\n)[ \t]*\n"),                        # paragraphs
+    re.compile(r"(?<=\n)"),                                # lines
+    re.compile(r"(?<=[.!?\u3002\uff01\uff1f])\s+"),        # sentences
+    re.compile(r"(?<=\s)"),                                # words
+]
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate: ~4 ASCII characters per token, one token per other character"""
+    ascii_chars = sum(1 for char in text if ord(char) < 128)
+    return (ascii_chars + 3) // 4 + (len(text) - ascii_chars)
+
+
+def completion_budget(input_tokens: int, max_tokens: int) -> int:
+    """Return the max_tokens to request so prompt and completion fit the context window"""
+    available = MODEL_CONTEXT_TOKENS - PROMPT_OVERHEAD_TOKENS - input_tokens
+    return max(MIN_COMPLETION_TOKENS, min(max_tokens, available))
+
+
+def _split_on(text: str, pattern) -> List[str]:
+    parts, start = [], 0
+    for match in pattern.finditer(text):
+        if match.end() > start:
+            parts.append(text[start:match.end()])
+            start = match.end()
+    if start < len(text):
+        parts.append(text[start:])
+    return parts
+
+
+def split_text(text: str, budget: int = REQUEST_TOKEN_BUDGET) -> List[str]:
+    """Split text into parts under the token budget at the coarsest possible boundary.
+
+    Joining the returned parts gives back the original text exactly.
+    """
+    if estimate_tokens(text) <= budget:
+        return [text]
+
+    for pattern in _SPLIT_PATTERNS:
+        pieces = _split_on(text, pattern)
+        if len(pieces) > 1:
+            break
+    else:
+        # No boundary at all, cut at the character level
+        size = max(1, budget * 4)
+        return [text[i:i + size] for i in range(0, len(text), size)]
+
+    parts: List[str] = []
+    current = ""
+    for piece in pieces:
+        if current and estimate_tokens(current + piece) > budget:
+            parts.append(current)
+            current = ""
+        if estimate_tokens(piece) > budget:
+            # A single paragraph or sentence is still too long, split it further
+            parts.extend(split_text(piece, budget))
+        else:
+            current += piece
+    if current:
+        parts.append(current)
+    return parts
+
+
+def restore_whitespace(original: str, translated: str) -> str:
+    """Give a translated part the leading and trailing whitespace of its source part"""
+    if not original.strip():
+        return original
+    leading = original[:len(original) - len(original.lstrip())]
+    trailing = original[len(original.rstrip()):]
+    return leading + translated.strip() + trailing
+
+
+def plan_requests(texts: List[str], budget: int = REQUEST_TOKEN_BUDGET) -> Dict[str, Any]:
+    """Plan the model requests needed to translate ``texts``.
+
+    Oversized texts are split into parts and small texts are packed together,
+    each request staying under the token budget. Returns the requests as lists
+    of part ids, the text of every part, and for every input text the ids of
+    the parts that must be joined to rebuild it.
+    """
+    parts: List[str] = []
+    parts_by_text: List[List[int]] = []
+    for text in texts:
+        ids = []
+        for part in split_text(text, budget):
+            ids.append(len(parts))
+            parts.append(part)
+        parts_by_text.append(ids)
+
+    requests: List[List[int]] = []
+    current: List[int] = []
+    current_tokens = 0
+    for part_id, part in enumerate(parts):
+        tokens = estimate_tokens(part) + estimate_tokens(SEGMENT_MARKER.format(number=len(current) + 1))
+        if current and current_tokens + tokens > budget:
+            requests.append(current)
+            current, current_tokens = [], 0
+        current.append(part_id)
+        current_tokens += tokens
+    if current:
+        requests.append(current)
+
+    return {"requests": requests, "parts": parts, "parts_by_text": parts_by_text}
+
+
+def pack_texts(texts: List[str]) -> str:
+    """Join texts into one request body with numbered marker lines"""
+    return "\n".join(
+        f"{SEGMENT_MARKER.format(number=number)}\n{text}" for number, text in enumerate(texts, start=1)
+    )
+
+
+def unpack_texts(packed: str, count: int) -> Optional[List[str]]:
+    """Split a packed translation back into its texts, or None if the markers did not survive"""
+    matches = list(SEGMENT_MARKER_PATTERN.finditer(packed))
+    if [int(match.group(1)) for match in matches] != list(range(1, count + 1)):
+        return None
+    if packed[:matches[0].start()].strip():
+        return None
+    texts = []
+    for index, match in enumerate(matches):
+        end = matches[index + 1].start() if index + 1 < len(matches) else len(packed)
+        text = packed[match.end():end]
+        # Drop the newline that follows the marker and the one before the next marker
+        if text.startswith("\n"):
+            text = text[1:]
+        if index + 1 < len(matches) and text.endswith("\n"):
+            text = text[:-1]
+        texts.append(text)
+    return texts
+
+
+class PackedStreamSplitter:
+    """Split a streamed packed translation into per-text deltas as marker lines arrive.
+
+    Text that might still turn out to be the start of a marker line is held
+    back until the next delta decides it. The deltas for each text add up to
+    what ``unpack_texts`` returns for the complete response.
+    """
+
+    def __init__(self, count: int):
+        self.count = count
+        self.current: Optional[int] = None
+        self.buffer = ""
+        # Whether the buffer starts a line, text already passed on may have ended mid-line
+        self.at_line_start = True
+
+    def feed(self, delta: str) -> List[Tuple[int, str]]:
+        """Add streamed text and return the (text index, delta) pairs it completes"""
+        self.buffer += delta
+        out: List[Tuple[int, str]] = []
+        while True:
+            pattern = _STREAM_MARKER_AT_LINE_START_PATTERN if self.at_line_start else _STREAM_MARKER_PATTERN
+            match = pattern.search(self.buffer)
+            if match is None:
+                break
+            before = self.buffer[:match.start()]
+            if self.current is not None and before:
+                out.append((self.current, before))
+            number = int(match.group(1))
+            if 1 <= number <= self.count:
+                self.current = number - 1
+            self.buffer = self.buffer[match.end():]
+            self.at_line_start = True
+
+        if self.current is not None:
+            safe = self._safe_length()
+            if safe:
+                out.append((self.current, self.buffer[:safe]))
+                self.at_line_start = self.buffer[safe - 1] == "\n"
+                self.buffer = self.buffer[safe:]
+        return out
+
+    def flush(self) -> List[Tuple[int, str]]:
+        """Return whatever is still held back once the stream has ended"""
+        out = []
+        if self.current is not None and self.buffer:
+            out.append((self.current, self.buffer))
+        self.buffer = ""
+        return out
+
+    def _safe_length(self) -> int:
+        # Only the last line can still become a marker line
+        newline = self.buffer.rfind("\n")
+        tail = self.buffer[newline + 1:].lstrip(" \t")
+        if tail and not _MARKER_PREFIX.startswith(tail[:len(_MARKER_PREFIX)]):
+            return len(self.buffer)
+        if len(tail) > len(_MARKER_PREFIX) + 12:
+            return len(self.buffer)
+        return max(newline, 0)
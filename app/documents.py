@@ -0,0 +1,133 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DOCUMENTS_DB_PATH = os.getenv("DOCUMENTS_DB_PATH", os.path.join("data", "documents.sqlite3"))
+
+
+class DocumentStore:
+    """SQLite index of uploaded documents and their extracted pages, addressable by content hash"""
+
+    def __init__(self, path: str = DOCUMENTS_DB_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS documents (
+                file_id TEXT PRIMARY KEY,
+                sha256 TEXT NOT NULL,
+                filename TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                total_pages INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS documents_sha256 ON documents (sha256)")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS pages (
+                file_id TEXT NOT NULL,
+                page_number INTEGER NOT NULL,
+                content TEXT NOT NULL,
+                PRIMARY KEY (file_id, page_number)
+            )"""
+        )
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS revisions (
+                file_id TEXT PRIMARY KEY,
+                previous_file_id TEXT NOT NULL,
+                diff TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )"""
+        )
+
+    def add_pages(self, file_id: str, pages: List[Dict[str, Any]]):
+        """Store extracted pages of a document that is still being extracted"""
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO pages VALUES (?, ?, ?)",
+                [(file_id, page["page_number"], page["content"]) for page in pages],
+            )
+
+    def register(self, file_id: str, sha256: str, filename: str, size: int, total_pages: int):
+        """Register a document once all of its pages were stored with ``add_pages``"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (file_id, sha256, filename, size, total_pages, now, now),
+            )
+
+    def get(self, file_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM documents WHERE file_id = ?", (file_id,)).fetchone()
+        return dict(row) if row else None
+
+    def find_by_hash(self, sha256: str) -> Optional[Dict[str, Any]]:
+        """Return the most recent document with exactly this content"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM documents WHERE sha256 = ? ORDER BY created_at DESC LIMIT 1", (sha256,)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def list(self) -> List[Dict[str, Any]]:
+        """Return every document, least recently accessed first"""
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM documents ORDER BY accessed_at").fetchall()
+        return [dict(row) for row in rows]
+
+    def get_pages(self, file_id: str, page_from: int = 1, page_to: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Return the extracted pages from ``page_from`` to ``page_to``, both inclusive"""
+        with self._lock:
+            rows = self._conn.execute(
+                """SELECT page_number, content FROM pages
+                   WHERE file_id = ? AND page_number BETWEEN ? AND ?
+                   ORDER BY page_number""",
+                (file_id, page_from, page_to if page_to is not None else 2 ** 31),
+            ).fetchall()
+        return [{"page_number": row["page_number"], "content": row["content"]} for row in rows]
+
+    def set_revision(self, file_id: str, previous_file_id: str, diff: Dict[str, Any]):
+        """Link a document to the previous revision it was diffed with"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO revisions VALUES (?, ?, ?, ?)",
+                (file_id, previous_file_id, json.dumps(diff), time.time()),
+            )
+
+    def get_revision(self, file_id: str) -> Optional[Dict[str, Any]]:
+        """Return the previous revision of a document and the page diff against it"""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM revisions WHERE file_id = ?", (file_id,)).fetchone()
+        if row is None:
+            return None
+        return dict(json.loads(row["diff"]), previous_file_id=row["previous_file_id"])
+
+    def touch(self, file_id: str):
+        with self._lock:
+            self._conn.execute("UPDATE documents SET accessed_at = ? WHERE file_id = ?", (time.time(), file_id))
+
+    def delete(self, file_id: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM pages WHERE file_id = ?", (file_id,))
+            self._conn.execute("DELETE FROM revisions WHERE file_id = ?", (file_id,))
+            self._conn.execute("DELETE FROM documents WHERE file_id = ?", (file_id,))
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM pages")
+            self._conn.execute("DELETE FROM revisions")
+            self._conn.execute("DELETE FROM documents")
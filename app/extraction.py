@@ -0,0 +1,202 @@
+import os
+import signal
+import asyncio
+import logging
+import multiprocessing
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from app.scheduler import FairLimiter
+
+logger = logging.getLogger(__name__)
+
+# Worker processes used for PDF text extraction
+EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Seconds one page may take before its text is given up on
+EXTRACTION_PAGE_TIMEOUT = float(os.getenv("EXTRACTION_PAGE_TIMEOUT", "20"))
+# Fewest pages extracted by one worker task, every task has to parse the PDF structure again
+EXTRACTION_CHUNK_PAGES = int(os.getenv("EXTRACTION_CHUNK_PAGES", "16"))
+# Most pages extracted by one worker task, so a long PDF is never held in memory as a few huge chunks
+EXTRACTION_MAX_CHUNK_PAGES = int(os.getenv("EXTRACTION_MAX_CHUNK_PAGES", "256"))
+
+_pool: Optional[ProcessPoolExecutor] = None
+# One slot per worker, taken in turn by the files being extracted so a long PDF never queues ahead of the rest
+_slots = FairLimiter(EXTRACTION_WORKERS)
+
+
+class PageTimeout(Exception):
+    pass
+
+
+def _on_alarm(signum, frame):
+    raise PageTimeout()
+
+
+@contextmanager
+def _time_limit(seconds: float):
+    """Raise ``PageTimeout`` in a worker process stuck in the pure Python parser for ``seconds``.
+
+    The alarm is not available on Windows, there the parser is never interrupted.
+    """
+    use_alarm = seconds > 0 and hasattr(signal, "setitimer")
+    if use_alarm:
+        signal.signal(signal.SIGALRM, _on_alarm)
+        signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+def _count_pages(file_path: str, timeout: float = EXTRACTION_PAGE_TIMEOUT) -> int:
+    # PyPDF2 is only needed in the worker processes, the server never imports it
+    import PyPDF2
+
+    with open(file_path, "rb") as f:
+        try:
+            with _time_limit(timeout):
+                return len(PyPDF2.PdfReader(f).pages)
+        except PageTimeout:
+            raise PageTimeout(f"Reading the page count timed out after {timeout:g}s") from None
+
+
+def _extract_range(file_path: str, start: int, end: int, page_timeout: float) -> List[Dict[str, Any]]:
+    """Extract pages ``start`` to ``end`` (0-based, end exclusive) inside a worker process"""
+    import PyPDF2
+
+    pages = []
+    with open(file_path, "rb") as f:
+        try:
+            # Parsing the document structure can hang on a malformed PDF as much as a single page
+            with _time_limit(page_timeout):
+                pdf_reader = PyPDF2.PdfReader(f)
+        except PageTimeout:
+            error = f"Reading the PDF timed out after {page_timeout:g}s"
+            return [{"page_number": page_num + 1, "content": "", "error": error} for page_num in range(start, end)]
+        for page_num in range(start, end):
+            page = {"page_number": page_num + 1, "content": ""}
+            try:
+                with _time_limit(page_timeout):
+                    page["content"] = pdf_reader.pages[page_num].extract_text() or ""
+            except PageTimeout:
+                page["error"] = f"Text extraction timed out after {page_timeout:g}s"
+            except Exception as e:
+                page["error"] = f"Text extraction failed: {str(e)}"
+            pages.append(page)
+    return pages
+
+
+def _warm_up_worker():
+    # Imported only to have it loaded before the first upload needs it
+    import PyPDF2  # noqa: F401
+
+
+async def warm_up_extraction():
+    """Start every extraction worker and load PyPDF2 in it"""
+    loop = asyncio.get_running_loop()
+    pool = get_extraction_pool()
+    await asyncio.gather(*[loop.run_in_executor(pool, _warm_up_worker) for _ in range(EXTRACTION_WORKERS)])
+
+
+def get_extraction_pool() -> ProcessPoolExecutor:
+    """Return the process pool for extraction, created on first use"""
+    global _pool
+    if _pool is None:
+        # Spawned workers do not inherit the event loop, sockets or SQLite handles of the server
+        _pool = ProcessPoolExecutor(max_workers=EXTRACTION_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def _replace_broken_pool(pool: ProcessPoolExecutor):
+    # Only the first task to notice replaces the pool, the others already run in the new one
+    global _pool
+    if _pool is pool:
+        _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+async def _run_in_pool(function, *args):
+    """Run a function in the extraction pool, once more in a new pool if the old one broke.
+
+    A worker that dies, e.g. killed for running out of memory on a malformed
+    PDF, breaks the whole pool and every task in it fails. The pool is
+    replaced and the failed tasks run again, so only the document that keeps
+    killing its worker fails.
+    """
+    loop = asyncio.get_running_loop()
+    for attempt in range(2):
+        pool = get_extraction_pool()
+        try:
+            return await loop.run_in_executor(pool, function, *args)
+        except BrokenProcessPool:
+            _replace_broken_pool(pool)
+            if attempt:
+                raise
+
+
+def close_extraction_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+async def iter_pages(file_path: str, chunk_pages: int = EXTRACTION_CHUNK_PAGES,
+                     page_timeout: float = EXTRACTION_PAGE_TIMEOUT) -> AsyncIterator[Dict[str, Any]]:
+    """Extract the text of a PDF in worker processes and yield its pages in order.
+
+    The page range is split into about two chunks per worker, at most
+    ``EXTRACTION_MAX_CHUNK_PAGES`` pages each, that the pool works on in
+    parallel. Only two chunks per worker are extracted ahead of the consumer,
+    so memory stays bounded however long the PDF is. Chunks of files
+    extracted at the same time take the workers in turn. Pages are yielded
+    as soon as every earlier chunk is done. A page that times out or fails is
+    yielded with empty content and an ``error``.
+    """
+    async def run(function, *args):
+        async with _slots.slot(file_path):
+            return await _run_in_pool(function, *args)
+
+    total = await run(_count_pages, file_path, page_timeout)
+    chunk_pages = max(chunk_pages, min(-(-total // (EXTRACTION_WORKERS * 2)), EXTRACTION_MAX_CHUNK_PAGES))
+
+    starts = iter(range(0, total, chunk_pages))
+    futures: deque = deque()
+
+    def schedule():
+        while len(futures) < EXTRACTION_WORKERS * 2:
+            start = next(starts, None)
+            if start is None:
+                return
+            futures.append(asyncio.ensure_future(
+                run(_extract_range, file_path, start, min(start + chunk_pages, total), page_timeout)
+            ))
+
+    schedule()
+    try:
+        while futures:
+            pages = await futures.popleft()
+            schedule()
+            for page in pages:
+                if "error" in page:
+                    logger.warning(f"Page {page['page_number']} of {file_path}: {page['error']}")
+                yield page
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+async def iter_page_windows(file_path: str, window_pages: int) -> AsyncIterator[List[Dict[str, Any]]]:
+    """Extract a PDF like ``iter_pages`` and yield its pages in lists of at most ``window_pages``"""
+    window: List[Dict[str, Any]] = []
+    async for page in iter_pages(file_path):
+        window.append(page)
+        if len(window) >= window_pages:
+            yield window
+            window = []
+    if window:
+        yield window
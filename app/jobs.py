@@ -0,0 +1,406 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+import logging
+import traceback
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app.state import InProcessBackend, StateBackend
+
+logger = logging.getLogger(__name__)
+
+JOBS_DIR = os.getenv("JOBS_DIR", os.path.join("data", "jobs"))
+# Seconds a worker owns a job without renewing it, after that another worker resumes the job
+JOB_LEASE_TTL = float(os.getenv("JOB_LEASE_TTL", "30"))
+
+# Seconds between two checks for jobs of workers that died, which also renew the leases of running jobs
+JOB_WATCH_INTERVAL = 2
+
+ACTIVE_STATUSES = ("queued", "running")
+# Attempts, 50 ms apart, to take the lease for creating the job of a file
+CREATE_LEASE_ATTEMPTS = 100
+
+
+class JobBusyError(Exception):
+    """Raised when another worker holds the lease for creating a file's job for too long"""
+
+
+def _write_job_file(path: str, text: str):
+    # Write to a temporary file first so a crash never leaves a half-written job.json
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+class CheckpointWriter:
+    """Write the checkpoints of one job from a thread, one fsync per batch of pages.
+
+    ``add`` only queues a finished page together with the job state to save.
+    One flush at a time appends every queued page to ``pages.jsonl``, fsyncs
+    once and rewrites ``job.json``, so the event loop never waits on the disk
+    and a burst of pages costs a single fsync. Pages still queued when the
+    process dies are translated again on resume.
+    """
+
+    def __init__(self, job_dir: str):
+        self.pages_path = os.path.join(job_dir, "pages.jsonl")
+        self.job_path = os.path.join(job_dir, "job.json")
+        self.lines: List[str] = []
+        self.job_text: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def add(self, page: Dict[str, Any], job: Dict[str, Any]):
+        self.lines.append(json.dumps(page) + "\n")
+        # Serialized now, the job keeps changing on the event loop while the thread writes
+        self.job_text = json.dumps(job)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._flush())
+
+    def _write(self, lines: List[str], job_text: Optional[str]):
+        if lines:
+            with open(self.pages_path, "a", encoding="utf-8") as f:
+                f.writelines(lines)
+                f.flush()
+                os.fsync(f.fileno())
+        if job_text is not None:
+            _write_job_file(self.job_path, job_text)
+
+    async def _flush(self):
+        while self.lines or self.job_text is not None:
+            lines, self.lines = self.lines, []
+            job_text, self.job_text = self.job_text, None
+            await asyncio.to_thread(self._write, lines, job_text)
+
+    async def flush(self):
+        """Wait until every queued page is on disk"""
+        if self._task is not None:
+            await self._task
+
+    def discard(self):
+        """Stop writing, e.g. once another worker owns the job; queued pages are redone"""
+        self.lines = []
+        self.job_text = None
+        if self._task is not None:
+            self._task.cancel()
+
+
+class CheckpointedPages:
+    """Pages a job finished before it stopped, read back from its ``pages.jsonl`` when they are needed.
+
+    Only the page numbers and the offsets of their lines are held in memory,
+    ``load`` reads the contents of one window of pages at a time, so resuming
+    a long job costs no more memory than running it.
+    """
+
+    def __init__(self, path: str, offsets: Optional[Dict[str, Dict[int, int]]] = None):
+        self.path = path
+        self.offsets = offsets or {}
+
+    def __len__(self) -> int:
+        return sum(len(pages) for pages in self.offsets.values())
+
+    def count(self, language: str) -> int:
+        return len(self.offsets.get(language, {}))
+
+    def load(self, language: str, page_from: int, page_to: int) -> Dict[int, str]:
+        """Return the contents of the checkpointed pages from ``page_from`` to ``page_to`` by page number"""
+        pages = self.offsets.get(language, {})
+        offsets = {number: pages[number] for number in range(page_from, page_to + 1) if number in pages}
+        contents: Dict[int, str] = {}
+        if not offsets:
+            return contents
+        with open(self.path, "rb") as f:
+            for page_number, offset in offsets.items():
+                f.seek(offset)
+                contents[page_number] = json.loads(f.readline())["content"]
+        return contents
+
+
+class JobManager:
+    """Run translation jobs in the background and checkpoint every finished page to disk.
+
+    Each job lives in ``JOBS_DIR/<job_id>/``: ``job.json`` holds its status and
+    ``pages.jsonl`` gets one line per translated page, fsynced in batches by a
+    ``CheckpointWriter`` outside the event loop. A job that was queued or running when the process
+    stopped is picked up again by ``resume_incomplete`` and skips every page
+    already in its checkpoint.
+
+    With several worker processes the job directory and ``state`` are shared.
+    A worker runs a job only while it holds the job's lease, so a job is never
+    run twice. The jobs of a worker that died are resumed by another one
+    within ``JOB_WATCH_INTERVAL`` seconds when it ran on the same host, its
+    leases are given up with the process, otherwise once their lease
+    expired. Active jobs are indexed in ``state`` so every worker can find
+    them.
+    """
+
+    def __init__(self, runner: Callable[[Dict[str, Any], CheckpointedPages, Callable], Awaitable[Dict[str, Any]]],
+                 jobs_dir: str = JOBS_DIR, state: Optional[StateBackend] = None, lease_ttl: float = JOB_LEASE_TTL):
+        self.runner = runner
+        self.jobs_dir = jobs_dir
+        self.state = state or InProcessBackend()
+        self.lease_ttl = lease_ttl
+        # Jobs run by this process, any other job is read from its job.json
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+        self.tasks: Dict[str, asyncio.Task] = {}
+        self._watchdog: Optional[asyncio.Task] = None
+        self.attached = 0
+        os.makedirs(jobs_dir, exist_ok=True)
+
+    def _job_dir(self, job_id: str) -> str:
+        return os.path.join(self.jobs_dir, job_id)
+
+    def _save(self, job: Dict[str, Any]):
+        job["updated_at"] = time.time()
+        _write_job_file(os.path.join(self._job_dir(job["job_id"]), "job.json"), json.dumps(job))
+
+    def _load(self, job_id: str) -> Optional[Dict[str, Any]]:
+        path = os.path.join(self._job_dir(job_id), "job.json")
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def create(self, file_id: str, target_languages: List[str], stream: bool = False,
+               document: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Record a new queued job translating a file into one or more languages and start it
+
+        ``document`` holds the hash, name and size of a file that was stored but
+        not extracted yet, the job extracts and registers it first.
+        """
+        job_id = str(uuid.uuid4())
+        os.makedirs(self._job_dir(job_id), exist_ok=True)
+        job = {
+            "job_id": job_id,
+            "file_id": file_id,
+            "target_language": target_languages[0],
+            "target_languages": list(target_languages),
+            "languages": {},
+            "stream": stream,
+            "document": document,
+            "status": "queued",
+            "progress": 0,
+            "completed_pages": 0,
+            "total_pages": None,
+            "error": None,
+            "result": None,
+            "created_at": time.time(),
+        }
+        self._save(job)
+        # Lease before indexing, so no other worker takes the new job for an abandoned one
+        self.state.acquire_lease(f"job:{job_id}", self.lease_ttl)
+        self.state.set(f"job:{job_id}", {"file_id": file_id, "target_languages": job["target_languages"]})
+        self.start(job)
+        return job
+
+    async def create_or_attach(self, file_id: str, target_languages: List[str], stream: bool = False,
+                               document: Optional[Dict[str, Any]] = None
+                               ) -> Tuple[Dict[str, Any], bool, Dict[str, str]]:
+        """Leave every requested language an active job already translates to that job, create one for the rest
+
+        Requests are shared per file and language: a double click, a second
+        tab or an overlapping request with more languages never starts a
+        second job writing the same export. A job is only created for the
+        languages no active job covers. While it checks and creates, a worker
+        holds a short lease on the file, so two workers never both create a
+        job. Returns the new job, or the job translating the first language
+        when every language is covered, whether that job already existed, and
+        the id of the job translating each requested language.
+        """
+        lease = f"create:{file_id}"
+        # The lease is only held while a job is looked up and recorded, wait for another worker to finish that
+        for _ in range(CREATE_LEASE_ATTEMPTS):
+            if self.state.acquire_lease(lease, 5):
+                break
+            await asyncio.sleep(0.05)
+        else:
+            # Creating without the lease could start a second job for the same file
+            raise JobBusyError(f"Another translation of {file_id} is being started, try again")
+        try:
+            covering: Dict[str, Dict[str, Any]] = {}
+            for job_id, entry in self._active_index().items():
+                languages = {language.lower() for language in entry["target_languages"]}
+                wanted = [language for language in target_languages
+                          if language.lower() in languages and language.lower() not in covering]
+                if entry["file_id"] != file_id or not wanted:
+                    continue
+                job = self.get(job_id)
+                if job is not None and job["status"] in ACTIVE_STATUSES:
+                    for language in wanted:
+                        covering[language.lower()] = job
+
+            missing = [language for language in target_languages if language.lower() not in covering]
+            if covering:
+                self.attached += 1
+                logger.info(
+                    f"Attached translation request for {file_id} to running jobs for "
+                    f"{', '.join(sorted(covering))}"
+                )
+            if missing:
+                job, attached = self.create(file_id, missing, stream=stream, document=document), False
+            else:
+                job, attached = covering[target_languages[0].lower()], True
+            jobs = {language: covering.get(language.lower(), job)["job_id"] for language in target_languages}
+            return job, attached, jobs
+        finally:
+            self.state.release_lease(lease)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        if job_id in self.jobs:
+            return self.jobs[job_id]
+        # Another worker may be running the job, its job.json is the current state
+        return self._load(job_id)
+
+    def _active_index(self) -> Dict[str, Dict[str, Any]]:
+        return {key.split(":", 1)[1]: entry for key, entry in self.state.items("job:").items()}
+
+    def find_active(self, file_id: str, target_language: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Return the queued or running job for a file, optionally for one language"""
+        for job_id, entry in self._active_index().items():
+            if entry["file_id"] != file_id:
+                continue
+            languages = [language.lower() for language in entry["target_languages"]]
+            if target_language is not None and target_language.lower() not in languages:
+                continue
+            job = self.get(job_id)
+            if job is not None and job["status"] in ACTIVE_STATUSES:
+                return job
+        return None
+
+    def active_file_ids(self) -> List[str]:
+        """Return the files that have a queued or running job in any worker"""
+        return list({entry["file_id"] for entry in self._active_index().values()})
+
+    def update(self, job: Dict[str, Any], **fields):
+        job.update(fields)
+        self._save(job)
+
+    def load_checkpoint(self, job: Dict[str, Any]) -> CheckpointedPages:
+        """Return the pages a job already finished, their contents stay on disk until they are loaded"""
+        job_id = job["job_id"]
+        offsets: Dict[str, Dict[int, int]] = {}
+        path = os.path.join(self._job_dir(job_id), "pages.jsonl")
+        if not os.path.exists(path):
+            return CheckpointedPages(path, offsets)
+        with open(path, "rb") as f:
+            offset = 0
+            for line in f:
+                line_offset, offset = offset, offset + len(line)
+                try:
+                    page = json.loads(line)
+                except ValueError:
+                    # A torn last line from a crash mid-write, the page is simply redone
+                    logger.warning(f"Ignoring incomplete checkpoint line for job {job_id}")
+                    continue
+                # Pages checkpointed before jobs had several languages carry no language
+                language = page.get("language", job["target_language"])
+                offsets.setdefault(language, {})[page["page_number"]] = line_offset
+        return CheckpointedPages(path, offsets)
+
+    def start(self, job: Dict[str, Any]):
+        """Run a job in this process, the caller holds its lease"""
+        self.jobs[job["job_id"]] = job
+        self.tasks[job["job_id"]] = asyncio.create_task(self._run(job))
+
+    async def _run(self, job: Dict[str, Any]):
+        job_id = job["job_id"]
+        writer = CheckpointWriter(self._job_dir(job_id))
+        try:
+            completed_pages = self.load_checkpoint(job)
+            if completed_pages:
+                logger.info(f"Resuming job {job_id} after {len(completed_pages)} checkpointed pages")
+            self.update(job, status="running")
+
+            def checkpoint(page, completed, total, **fields):
+                job.update(
+                    completed_pages=completed,
+                    total_pages=total,
+                    progress=(completed / total) * 100 if total else 100,
+                    updated_at=time.time(),
+                    **fields
+                )
+                writer.add(page, job)
+
+            result = await self.runner(job, completed_pages, checkpoint)
+            # The final state must not be overwritten by a progress update still being written
+            await writer.flush()
+            self.update(job, status="completed", progress=100, result=result)
+        except asyncio.CancelledError:
+            # Leave the job as running so it is resumed on the next start
+            writer.discard()
+            raise
+        except Exception as e:
+            logger.error(f"Translation job {job_id} failed: {str(e)}")
+            logger.error(traceback.format_exc())
+            try:
+                await writer.flush()
+            except Exception as flush_error:
+                logger.error(f"Writing the checkpoint of job {job_id} failed: {str(flush_error)}")
+            self.update(job, status="failed", error=getattr(e, "detail", None) or str(e))
+        finally:
+            self.tasks.pop(job_id, None)
+            self.jobs.pop(job_id, None)
+            if job["status"] not in ACTIVE_STATUSES:
+                self.state.delete(f"job:{job_id}")
+            self.state.release_lease(f"job:{job_id}")
+
+    def _resume(self, job_ids: List[str], indexed: bool = False) -> List[str]:
+        resumed = []
+        for job_id in job_ids:
+            if job_id in self.tasks:
+                continue
+            job = self._load(job_id)
+            if job is None or job["status"] not in ACTIVE_STATUSES:
+                if indexed:
+                    # Entry of a job whose worker died between finishing it and updating the index
+                    self.state.delete(f"job:{job_id}")
+                continue
+            # Another worker holding the lease is already running the job
+            if not self.state.acquire_lease(f"job:{job_id}", self.lease_ttl):
+                continue
+            self.state.set(f"job:{job_id}", {
+                "file_id": job["file_id"],
+                "target_languages": job.get("target_languages") or [job["target_language"]],
+            })
+            self.start(job)
+            resumed.append(job_id)
+        if resumed:
+            logger.info(f"Resumed {len(resumed)} unfinished translation jobs")
+        return resumed
+
+    def resume_incomplete(self) -> List[str]:
+        """Restart every job that was queued or running when the process stopped"""
+        return self._resume(sorted(os.listdir(self.jobs_dir)))
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(min(self.lease_ttl / 3, JOB_WATCH_INTERVAL))
+            try:
+                for job_id, task in list(self.tasks.items()):
+                    if not self.state.acquire_lease(f"job:{job_id}", self.lease_ttl):
+                        # The lease ran out, e.g. after a long stall, and another worker took over
+                        logger.warning(f"Lost the lease of job {job_id}, stopping it here")
+                        task.cancel()
+                # Take over the active jobs of workers that stopped renewing their leases
+                self._resume(sorted(self._active_index()), indexed=True)
+            except Exception as e:
+                logger.error(f"Job lease renewal failed: {str(e)}")
+
+    def start_watchdog(self):
+        """Keep the leases of running jobs and pick up jobs of workers that died"""
+        if self._watchdog is None:
+            self._watchdog = asyncio.create_task(self._watch())
+
+    async def shutdown(self):
+        """Cancel running jobs, their checkpoints let them resume on the next start"""
+        if self._watchdog is not None:
+            self._watchdog.cancel()
+            await asyncio.gather(self._watchdog, return_exceptions=True)
+            self._watchdog = None
+        tasks = list(self.tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
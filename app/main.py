@@ -1,24 +1,35 @@
-from fastapi import FastAPI, Request, HTTPException
-from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
-from fastapi.middleware.cors import CORSMiddleware
-import uvicorn
 import os
+import sys
+import asyncio
 import logging
-from dotenv import load_dotenv, find_dotenv
-import openai
+from dotenv import find_dotenv
 
-from app.routers import pdf_router
+# Imported first so the profile covers every import below; importing the package loaded .env
+from app.startup import STARTUP_WARMUP, FirstRequestMiddleware, startup_profile, warm_up
+
+with startup_profile.phase("import fastapi"):
+    from fastapi import FastAPI, Request, HTTPException
+    from fastapi.staticfiles import StaticFiles
+    from fastapi.templating import Jinja2Templates
+    from fastapi.middleware.cors import CORSMiddleware
+    from fastapi.responses import PlainTextResponse
+
+# PyPDF2, ReportLab and aiohttp are imported where they are first used, not here
+with startup_profile.phase("import app"):
+    from app.routers import pdf_router
+    from app.extraction import close_extraction_pool
+    from app.metrics import REGISTRY, LoopLagMonitor, SharedMetrics
+    from app.rendering import close_render_pool
+    from app.scheduler import get_request_scheduler
+    from app.translation_cache import get_translation_cache
+    from app.translation_client import close_translation_client, get_translation_client
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Load environment variables - try to find .env file explicitly
-dotenv_path = find_dotenv()
-if dotenv_path:
-    logger.info(f"Found .env file at: {dotenv_path}")
-    load_dotenv(dotenv_path)
+if startup_profile.dotenv_path:
+    logger.info(f"Found .env file at: {startup_profile.dotenv_path}")
 else:
     logger.warning("No .env file found. Using environment variables from the system.")
 
@@ -33,6 +44,9 @@ else:
 
 app = FastAPI(title="PDF Translator")
 
+# Records when the first request arrived for the startup report
+app.add_middleware(FirstRequestMiddleware)
+
 # Configure CORS
 app.add_middleware(
     CORSMiddleware,
@@ -51,6 +65,86 @@ templates = Jinja2Templates(directory="app/templates")
 # Include routers
 app.include_router(pdf_router.router)
 
+# Values the scheduler, the cache and the job manager already count, read on every scrape
+REGISTRY.gauge("pdf_translator_model_requests_in_flight", "Model requests currently sent to the API",
+               function=lambda: get_request_scheduler().limiter.in_flight)
+REGISTRY.gauge("pdf_translator_model_queue_depth", "Model requests waiting for the rate limits or a concurrency slot",
+               function=lambda: get_request_scheduler().waiting)
+REGISTRY.gauge("pdf_translator_model_concurrency_limit", "Current adaptive limit of model requests in flight",
+               function=lambda: int(get_request_scheduler().limiter.limit), merge="max")
+REGISTRY.counter("pdf_translator_model_requests_total", "Model request attempts",
+                 function=lambda: get_request_scheduler().requests)
+REGISTRY.counter("pdf_translator_model_retries_total", "Model requests retried after a transient error",
+                 function=lambda: get_request_scheduler().retries)
+REGISTRY.counter("pdf_translator_model_throttled_total", "Model requests answered with 429",
+                 function=lambda: get_request_scheduler().throttled)
+REGISTRY.counter("pdf_translator_model_failures_total", "Model requests given up on",
+                 function=lambda: get_request_scheduler().failures)
+REGISTRY.counter("pdf_translator_model_hedges_total", "Duplicate model requests sent because the original was slow",
+                 function=lambda: get_request_scheduler().hedges)
+REGISTRY.counter("pdf_translator_model_hedges_won_total", "Duplicate model requests that answered before the original",
+                 function=lambda: get_request_scheduler().hedges_won)
+REGISTRY.gauge("pdf_translator_model_hedge_delay_seconds",
+               "Seconds after which a slow model request is duplicated, per size group of estimated tokens", ["tokens"],
+               function=lambda: {(bucket,): delay for bucket, delay in get_request_scheduler().hedge_delays().items()},
+               merge="max")
+REGISTRY.counter("pdf_translator_cache_hits_total", "Translation cache lookups that found a translation",
+                 function=lambda: get_translation_cache().hits)
+REGISTRY.counter("pdf_translator_cache_misses_total", "Translation cache lookups that found nothing",
+                 function=lambda: get_translation_cache().misses)
+REGISTRY.counter("pdf_translator_websocket_dropped_total", "Progress subscribers dropped for falling behind",
+                 function=lambda: pdf_router.progress.dropped)
+REGISTRY.counter("pdf_translator_model_requests_coalesced_total", "Model calls that joined an identical call in flight",
+                 function=lambda: get_translation_client().flights.coalesced)
+REGISTRY.counter("pdf_translator_jobs_attached_total", "Translation requests that joined a running job",
+                 function=lambda: pdf_router.job_manager.attached)
+REGISTRY.gauge("pdf_translator_jobs_running", "Translation jobs running",
+               function=lambda: len(pdf_router.job_manager.tasks))
+
+# Adds up the metrics of every worker process
+shared_metrics = SharedMetrics(pdf_router.state)
+loop_lag_monitor = LoopLagMonitor()
+
+warmup_task = None
+
+@app.on_event("startup")
+async def startup():
+    # Start exchanging progress with the other worker processes
+    await pdf_router.state.start()
+    # Pick up translation jobs interrupted by a crash or redeploy
+    pdf_router.job_manager.resume_incomplete()
+    # Renew the leases of running jobs and take over jobs of workers that died
+    pdf_router.job_manager.start_watchdog()
+    # Evict old documents in the background
+    pdf_router.storage_manager.start()
+    # Share this worker's metrics with the others
+    shared_metrics.start()
+    loop_lag_monitor.start()
+    startup_profile.ready()
+    # Load the worker pools and the HTTP client in the background instead of on the first request
+    global warmup_task
+    if STARTUP_WARMUP:
+        warmup_task = asyncio.create_task(warm_up())
+
+@app.on_event("shutdown")
+async def shutdown():
+    if warmup_task is not None:
+        warmup_task.cancel()
+        await asyncio.gather(warmup_task, return_exceptions=True)
+    # Stop running jobs, their checkpoints let them resume on the next start
+    await pdf_router.job_manager.shutdown()
+    await pdf_router.storage_manager.stop()
+    await shared_metrics.stop()
+    await loop_lag_monitor.stop()
+    # Flush the last progress messages to the other workers
+    await pdf_router.state.close()
+    # Close the pooled HTTP connections to the OpenAI API
+    await close_translation_client()
+    # Stop the PDF text extraction workers
+    close_extraction_pool()
+    # Stop the PDF export rendering workers
+    close_render_pool()
+
 @app.get("/")
 async def home(request: Request):
     return templates.TemplateResponse("index.html", {"request": request})
@@ -67,9 +161,22 @@ async def status():
     return {
         "status": "operational",
         "api_key_status": api_key_status,
-        "translation_available": api_key
+        "translation_available": api_key,
+        "translation_cache": get_translation_cache().stats(),
+        "request_scheduler": get_request_scheduler().stats(),
+        "progress": pdf_router.progress.stats()
     }
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus metrics of every worker process"""
+    return PlainTextResponse(shared_metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/startup")
+async def startup_report():
+    """Where the time to start this worker went, from process start to the first request"""
+    return dict(startup_profile.report(), modules_loaded=len(sys.modules))
+
 @app.get("/api/env-check")
 async def env_check():
     """Debug endpoint to check environment variables"""
@@ -95,4 +202,6 @@ async def env_check():
     }
 
 if __name__ == "__main__":
+    import uvicorn
+
     uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
@@ -0,0 +1,326 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import functools
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Seconds between two snapshots a worker shares with the other workers
+METRICS_SHARE_INTERVAL = float(os.getenv("METRICS_SHARE_INTERVAL", "5"))
+# Seconds between two probes of the event loop's responsiveness
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.1"))
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Metric:
+    """A named metric with one sample per combination of label values"""
+
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 function: Optional[Callable[[], Any]] = None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        # Read at collection time instead of being updated, for values other objects already count.
+        # With labels it returns the samples keyed by the tuple of their label values
+        self.function = function
+        self.samples: Dict[Tuple[str, ...], Any] = {}
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """The current samples as plain JSON, keyed by the JSON list of their label values"""
+        if self.function is not None:
+            try:
+                value = self.function()
+                if self.labelnames:
+                    samples = {json.dumps([str(label) for label in key]): sample for key, sample in value.items()}
+                else:
+                    samples = {json.dumps([]): value}
+            except Exception as e:
+                logger.error(f"Could not collect metric {self.name}: {str(e)}")
+                samples = {}
+        else:
+            samples = {json.dumps(list(key)): value for key, value in self.samples.items()}
+        return {"type": self.type, "help": self.documentation, "labels": list(self.labelnames), "samples": samples}
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self.samples[key] = self.samples.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """A value that goes up and down.
+
+    Gauges are added up over the workers like counters, unless they are a
+    setting or an estimate every worker keeps for itself, like a limit or a
+    delay: those are registered with ``merge="max"`` and report the highest.
+    """
+
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 function: Optional[Callable[[], Any]] = None, merge: str = "sum"):
+        super().__init__(name, documentation, labelnames, function)
+        if merge not in ("sum", "max"):
+            raise ValueError(f"{name} cannot be merged with {merge}")
+        self.merge = merge
+
+    def snapshot(self) -> Dict[str, Any]:
+        snapshot = super().snapshot()
+        snapshot["merge"] = self.merge
+        return snapshot
+
+    def set(self, value: float, **labels):
+        self.samples[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self.samples[key] = self.samples.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    """Sample counts per bucket plus the sum and count of every observation"""
+
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        # Per-bucket counts followed by the sum and the count, made cumulative when rendered
+        sample = self.samples.get(key)
+        if sample is None:
+            sample = self.samples[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                sample[i] += 1
+                break
+        else:
+            sample[len(self.buckets)] += 1
+        sample[-2] += value
+        sample[-1] += 1
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        """Observe the time spent in the block, also when it raises"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def snapshot(self) -> Dict[str, Any]:
+        snapshot = super().snapshot()
+        snapshot["buckets"] = list(self.buckets)
+        return snapshot
+
+
+class Registry:
+    """Every metric of the process, rendered in the Prometheus text format"""
+
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = (), **kwargs) -> Counter:
+        return self.register(Counter(name, documentation, labelnames, **kwargs))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = (), **kwargs) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames, **kwargs))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (), **kwargs) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, **kwargs))
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        return {name: metric.snapshot() for name, metric in self.metrics.items()}
+
+
+def merge_snapshots(snapshots: List[Dict[str, Dict[str, Any]]]) -> Dict[str, Dict[str, Any]]:
+    """Add up the snapshots of several worker processes, gauges merged with ``max`` take the highest value"""
+    merged: Dict[str, Dict[str, Any]] = {}
+    for snapshot in snapshots:
+        for name, metric in snapshot.items():
+            target = merged.setdefault(name, dict(metric, samples={}))
+            for key, value in metric["samples"].items():
+                if key not in target["samples"]:
+                    target["samples"][key] = list(value) if isinstance(value, list) else value
+                elif isinstance(value, list):
+                    target["samples"][key] = [a + b for a, b in zip(target["samples"][key], value)]
+                elif metric.get("merge") == "max":
+                    target["samples"][key] = max(target["samples"][key], value)
+                else:
+                    target["samples"][key] += value
+    return merged
+
+
+def render(snapshot: Dict[str, Dict[str, Any]]) -> str:
+    """Format a snapshot in the Prometheus text exposition format"""
+    lines = []
+    for name, metric in snapshot.items():
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        for key, value in metric["samples"].items():
+            values = json.loads(key)
+            if metric["type"] != "histogram":
+                lines.append(f"{name}{_format_labels(metric['labels'], values)} {_format_value(value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip(list(metric["buckets"]) + [float("inf")], value):
+                cumulative += count
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{name}_bucket{_format_labels(metric['labels'], values, le)} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(metric['labels'], values)} {_format_value(value[-2])}")
+            lines.append(f"{name}_count{_format_labels(metric['labels'], values)} {value[-1]}")
+    return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "pdf_translator_stage_seconds", "Time spent in each processing stage", ["stage"]
+)
+PROMPT_TOKENS = REGISTRY.counter(
+    "pdf_translator_prompt_tokens_total", "Prompt tokens sent to the model API", ["model"]
+)
+COMPLETION_TOKENS = REGISTRY.counter(
+    "pdf_translator_completion_tokens_total", "Completion tokens returned by the model API", ["model"]
+)
+WEBSOCKET_CONNECTIONS = REGISTRY.gauge(
+    "pdf_translator_websocket_connections", "Open progress WebSocket connections"
+)
+EVENT_LOOP_LAG = REGISTRY.histogram(
+    "pdf_translator_event_loop_lag_seconds", "How much later than scheduled a timer on the event loop fired",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+)
+
+
+def timed(stage: str):
+    """Decorator observing the run time of a function, sync or async, as ``stage``"""
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with STAGE_SECONDS.time(stage=stage):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with STAGE_SECONDS.time(stage=stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class LoopLagMonitor:
+    """Measure how long the event loop is blocked by sleeping and timing the wake-up"""
+
+    def __init__(self, interval: float = LOOP_LAG_INTERVAL):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def _loop(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            EVENT_LOOP_LAG.observe(max(0.0, time.perf_counter() - started - self.interval))
+
+    def start(self):
+        if self._task is None and self.interval > 0:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+class SharedMetrics:
+    """Serve the metrics of every worker process from whichever one is scraped.
+
+    Each worker stores a snapshot of its registry in the state backend every
+    ``interval`` seconds. A scrape adds the live metrics of the scraped worker
+    to the latest snapshots of the others; snapshots of workers that stopped
+    updating them are dropped.
+    """
+
+    def __init__(self, state, registry: Registry = REGISTRY, interval: float = METRICS_SHARE_INTERVAL):
+        self.state = state
+        self.registry = registry
+        self.interval = interval
+        self.key = f"metrics:{state.node_id}"
+        self._task: Optional[asyncio.Task] = None
+
+    def render(self) -> str:
+        snapshots = [self.registry.snapshot()]
+        now = time.time()
+        for key, entry in self.state.items("metrics:").items():
+            if key == self.key:
+                continue
+            if now - entry["updated_at"] > self.interval * 3:
+                self.state.delete(key)
+                continue
+            snapshots.append(entry["metrics"])
+        return render(merge_snapshots(snapshots))
+
+    async def _loop(self):
+        while True:
+            try:
+                self.state.set(self.key, {"updated_at": time.time(), "metrics": self.registry.snapshot()})
+            except Exception as e:
+                logger.error(f"Could not share metrics: {str(e)}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        self.state.delete(self.key)
@@ -0,0 +1,181 @@
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Callable, Dict, Optional, Set, Tuple
+
+from fastapi import WebSocket
+
+logger = logging.getLogger(__name__)
+
+# Messages buffered for one client before it is considered too slow and dropped
+PROGRESS_QUEUE_SIZE = int(os.getenv("PROGRESS_QUEUE_SIZE", "256"))
+# Times per second the queued messages are flushed to one client, messages arriving in between are coalesced
+PROGRESS_MAX_RATE = float(os.getenv("PROGRESS_MAX_RATE", "10"))
+
+
+def coalesce_key(message: Dict[str, Any]) -> Optional[Tuple]:
+    """Key of the queued message a new one supersedes or extends, None if it must be sent as it is"""
+    status = message.get("status")
+    if status == "delta":
+        return ("delta", message.get("language"), message.get("page"))
+    # Plain progress updates only matter in their latest state per language; pages with streamed content do not
+    if status == "translating" or (status == "page_completed" and "content" not in message):
+        return (status, message.get("language"))
+    return None
+
+
+class ProgressSender:
+    """Deliver progress messages to one WebSocket without ever blocking the sender.
+
+    ``send`` only appends to a bounded queue that a background task drains
+    at most ``max_rate`` times per second. While a message waits, a newer
+    progress update replaces it and further text deltas of the same page are
+    appended to it, so a burst of updates turns into a few messages. Once
+    the queue is half full it is flushed right away, and a client whose
+    queue still overflows is disconnected.
+    """
+
+    def __init__(self, websocket: WebSocket, max_queue: int = PROGRESS_QUEUE_SIZE,
+                 max_rate: float = PROGRESS_MAX_RATE):
+        self.websocket = websocket
+        self.max_queue = max_queue
+        self.interval = 1.0 / max_rate if max_rate > 0 else 0.0
+        self.queue: deque = deque()
+        self.pending: Dict[Tuple, Dict[str, Any]] = {}
+        self.closed = False
+        self.sent = 0
+        self.coalesced = 0
+        self._ready = asyncio.Event()
+        self._urgent = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    def send(self, message: Dict[str, Any]) -> bool:
+        """Queue a message, returns False if the client was dropped"""
+        if self.closed:
+            return False
+        key = coalesce_key(message)
+        queued = self.pending.get(key) if key is not None else None
+        if queued is not None:
+            self.coalesced += 1
+            if key[0] == "delta":
+                queued["text"] += message["text"]
+                return True
+            # The newer update moves to the end, behind the messages queued since the old one
+            self.queue.remove(queued)
+            del self.pending[key]
+        if len(self.queue) >= self.max_queue:
+            logger.warning("Dropping slow WebSocket client, progress queue is full")
+            asyncio.create_task(self.close())
+            return False
+        # Copy so later merges never modify a message shared with another subscriber
+        message = dict(message)
+        self.queue.append(message)
+        if key is not None:
+            self.pending[key] = message
+        self._ready.set()
+        if len(self.queue) >= self.max_queue // 2:
+            # Messages that cannot be coalesced are piling up, do not wait for the next flush
+            self._urgent.set()
+        return True
+
+    async def _run(self):
+        try:
+            while not self.closed:
+                await self._ready.wait()
+                self._ready.clear()
+                self._urgent.clear()
+                started = time.monotonic()
+                while self.queue:
+                    message = self.queue.popleft()
+                    key = coalesce_key(message)
+                    if key is not None and self.pending.get(key) is message:
+                        del self.pending[key]
+                    await self.websocket.send_json(message)
+                    self.sent += 1
+                # Let the next burst of updates collect, and coalesce, before sending again
+                delay = self.interval - (time.monotonic() - started)
+                if delay > 0:
+                    try:
+                        await asyncio.wait_for(self._urgent.wait(), timeout=delay)
+                    except asyncio.TimeoutError:
+                        pass
+        except Exception as e:
+            logger.warning(f"WebSocket send failed: {str(e)}")
+            self.closed = True
+
+    async def close(self):
+        if self.closed and self._task.done():
+            return
+        self.closed = True
+        self._task.cancel()
+        try:
+            await self.websocket.close()
+        except Exception:
+            pass
+
+
+class ProgressBroadcaster:
+    """Fan the progress of each document out to every WebSocket subscribed to it.
+
+    A document has any number of subscribers, each with its own
+    ``ProgressSender``. This process subscribes to a document's channel on the
+    state backend once, for its first subscriber, and publishing only hands
+    the message to the backend, so a translation never waits on a client.
+    Subscribers that fall behind are dropped from the fan-out right away.
+    """
+
+    def __init__(self, state, sender_factory: Callable[[WebSocket], ProgressSender] = ProgressSender):
+        self.state = state
+        self.sender_factory = sender_factory
+        self.subscribers: Dict[str, Set[ProgressSender]] = {}
+        self._unsubscribe: Dict[str, Callable[[], None]] = {}
+        self.dropped = 0
+
+    @staticmethod
+    def channel(file_id: str) -> str:
+        return f"progress:{file_id}"
+
+    def publish(self, file_id: str, message: Dict[str, Any]):
+        self.state.publish(self.channel(file_id), message)
+
+    def _deliver(self, file_id: str, message: Dict[str, Any]):
+        for sender in list(self.subscribers.get(file_id, ())):
+            if not sender.send(message):
+                self.dropped += 1
+                self._remove(file_id, sender)
+
+    def subscribe(self, file_id: str, websocket: WebSocket) -> ProgressSender:
+        """Start delivering the progress of a document to a WebSocket"""
+        sender = self.sender_factory(websocket)
+        if file_id not in self.subscribers:
+            self.subscribers[file_id] = set()
+            self._unsubscribe[file_id] = self.state.subscribe(
+                self.channel(file_id), lambda message: self._deliver(file_id, message)
+            )
+        self.subscribers[file_id].add(sender)
+        return sender
+
+    def _remove(self, file_id: str, sender: ProgressSender):
+        senders = self.subscribers.get(file_id)
+        if senders is None:
+            return
+        senders.discard(sender)
+        if not senders:
+            del self.subscribers[file_id]
+            self._unsubscribe.pop(file_id)()
+
+    async def unsubscribe(self, file_id: str, sender: ProgressSender):
+        self._remove(file_id, sender)
+        await sender.close()
+
+    def subscriber_count(self) -> int:
+        return sum(len(senders) for senders in self.subscribers.values())
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "documents": len(self.subscribers),
+            "subscribers": self.subscriber_count(),
+            "dropped": self.dropped,
+        }
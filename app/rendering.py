@@ -0,0 +1,330 @@
+import os
+import time
+import glob
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+from xml.sax.saxutils import escape
+
+from app.metrics import STAGE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Worker processes rendering PDF exports
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", "2"))
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _render_page(path: str, page_number: int, content: str) -> float:
+    """Render one translated page to its own PDF file inside a worker process, returns the seconds it took"""
+    started = time.perf_counter()
+    from reportlab.lib.pagesizes import letter
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+
+    doc = SimpleDocTemplate(
+        path,
+        pagesize=letter,
+        rightMargin=72,
+        leftMargin=72,
+        topMargin=72,
+        bottomMargin=72
+    )
+    styles = getSampleStyleSheet()
+    heading_style = ParagraphStyle(
+        'Heading',
+        parent=styles['Heading1'],
+        fontSize=16
+    )
+    normal_style = styles['Normal']
+
+    elements = [Paragraph(f"Page {page_number}", heading_style), Spacer(1, 10)]
+    for line in content.split('\n'):
+        # Empty lines become vertical space, everything else a paragraph of plain text
+        if not line.strip():
+            elements.append(Spacer(1, 6))
+        else:
+            elements.append(Paragraph(escape(line), normal_style))
+    doc.build(elements)
+    return time.perf_counter() - started
+
+
+def _merge(paths: List[str], output_path: str):
+    """Concatenate the rendered pages into the final export.
+
+    The pages are copied one file at a time straight into the output, their
+    objects renumbered on the way, so memory does not grow with the page
+    count the way it does with ``PdfWriter``, which holds every page until
+    the end. Only the byte offsets and page numbers are kept.
+    """
+    import PyPDF2
+    from PyPDF2.generic import ArrayObject, DictionaryObject, IndirectObject, NameObject, NumberObject
+
+    # Objects 1 and 2 are the catalog and the page tree, written once every page is
+    offsets: List[int] = [0, 0]
+    kids = ArrayObject()
+
+    def new_number() -> int:
+        offsets.append(0)
+        return len(offsets)
+
+    tmp_path = output_path + ".tmp"
+    with open(tmp_path, "wb") as out:
+        def write_object(number, obj):
+            offsets[number - 1] = out.tell()
+            out.write(f"{number} 0 obj\n".encode())
+            obj.write_to_stream(out, None)
+            out.write(b"\nendobj\n")
+
+        out.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        for path in paths:
+            reader = PyPDF2.PdfReader(path)
+            # Object of this file by (number, generation) -> number in the output
+            numbers: Dict[Tuple[int, int], int] = {}
+            queue: List[Tuple[int, IndirectObject]] = []
+
+            def renumber(obj):
+                if isinstance(obj, IndirectObject):
+                    key = (obj.idnum, obj.generation)
+                    if key not in numbers:
+                        numbers[key] = new_number()
+                        queue.append((numbers[key], obj))
+                    return IndirectObject(numbers[key], 0, None)
+                if isinstance(obj, DictionaryObject):
+                    for key, value in list(obj.items()):
+                        obj[key] = renumber(value)
+                elif isinstance(obj, ArrayObject):
+                    for index, value in enumerate(obj):
+                        obj[index] = renumber(value)
+                return obj
+
+            for page in reader.pages:
+                # The page objects carry their inherited attributes, only the parent has to change
+                number = new_number()
+                reference = page.indirect_reference
+                numbers[(reference.idnum, reference.generation)] = number
+                page.pop(NameObject("/Parent"), None)
+                renumber(page)
+                page[NameObject("/Parent")] = IndirectObject(2, 0, None)
+                write_object(number, page)
+                kids.append(IndirectObject(number, 0, None))
+            while queue:
+                number, reference = queue.pop()
+                write_object(number, renumber(reference.get_object()))
+
+        write_object(2, DictionaryObject({
+            NameObject("/Type"): NameObject("/Pages"),
+            NameObject("/Kids"): kids,
+            NameObject("/Count"): NumberObject(len(kids)),
+        }))
+        write_object(1, DictionaryObject({
+            NameObject("/Type"): NameObject("/Catalog"),
+            NameObject("/Pages"): IndirectObject(2, 0, None),
+        }))
+        xref = out.tell()
+        out.write(f"xref\n0 {len(offsets) + 1}\n0000000000 65535 f \n".encode())
+        for offset in offsets:
+            out.write(f"{offset:010d} 00000 n \n".encode())
+        out.write(f"trailer\n<< /Size {len(offsets) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode())
+    os.replace(tmp_path, output_path)
+
+
+def _observe_render(future: asyncio.Future):
+    # The worker measures the rendering itself, time spent queued behind other pages is not included
+    if not future.cancelled() and future.exception() is None:
+        STAGE_SECONDS.observe(future.result(), stage="pdf_render_page")
+
+
+def _warm_up_worker():
+    # Imported only to have them loaded before the first export needs them
+    import PyPDF2  # noqa: F401
+    import reportlab.platypus  # noqa: F401
+
+
+async def warm_up_rendering():
+    """Start every render worker and load ReportLab in it"""
+    loop = asyncio.get_running_loop()
+    pool = get_render_pool()
+    await asyncio.gather(*[loop.run_in_executor(pool, _warm_up_worker) for _ in range(RENDER_WORKERS)])
+
+
+def get_render_pool() -> ProcessPoolExecutor:
+    """Return the process pool for PDF rendering, created on first use"""
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=RENDER_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def _replace_broken_pool(pool: ProcessPoolExecutor):
+    # Only the first task to notice replaces the pool, the others already run in the new one
+    global _pool
+    if _pool is pool:
+        _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+async def _run_in_pool(function, *args):
+    """Run a function in the render pool, once more in a new pool if the old one broke.
+
+    A dead worker breaks the whole pool and fails the pages of every export
+    being rendered. The pool is replaced and the failed pages render again,
+    so only the export whose page keeps killing its worker fails.
+    """
+    loop = asyncio.get_running_loop()
+    for attempt in range(2):
+        pool = get_render_pool()
+        try:
+            return await loop.run_in_executor(pool, function, *args)
+        except BrokenProcessPool:
+            _replace_broken_pool(pool)
+            if attempt:
+                raise
+
+
+def close_render_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+class _RenderState:
+    """Pages of one translation version: the numbers added so far and the renders still running"""
+
+    def __init__(self):
+        self.page_numbers: Set[int] = set()
+        self.rendering: Set[asyncio.Future] = set()
+        self.error: Optional[BaseException] = None
+
+    def render_done(self, future: asyncio.Future):
+        # Finished renders are dropped right away, only the first failure is kept for finish
+        self.rendering.discard(future)
+        if not future.cancelled() and future.exception() is not None and self.error is None:
+            self.error = future.exception()
+
+
+class PdfRenderer:
+    """Render PDF exports in worker processes while a translation is still running.
+
+    Every translated page is rendered as soon as it is added, and ``finish``
+    only has to merge the rendered pages. Exports are named after the
+    translation version they were rendered from, so a new translation never
+    serves an old PDF. Older versions are deleted once a newer one is done.
+
+    At most ``window_pages`` pages of a version wait for or are in a worker
+    at a time, ``add_page`` waits for one of them to finish beyond that. Only
+    the numbers of the rendered pages are kept until ``finish``, so memory
+    stays bounded however long the document is, and a translation never runs
+    ahead of its rendering by more than a window.
+    """
+
+    def __init__(self, export_dir: str, window_pages: int = 50):
+        self.export_dir = export_dir
+        self.window_pages = max(1, window_pages)
+        self.pending: Dict[Tuple[str, str, int], _RenderState] = {}
+        self.finishing: Dict[Tuple[str, str, int], asyncio.Task] = {}
+
+    def _prefix(self, file_id: str, language: str) -> str:
+        return os.path.join(self.export_dir, f"{file_id}_{language.lower()}")
+
+    def pdf_path(self, file_id: str, language: str, version: int) -> str:
+        return f"{self._prefix(file_id, language)}.v{version}.pdf"
+
+    def _page_path(self, file_id: str, language: str, version: int, page_number: int) -> str:
+        return f"{self._prefix(file_id, language)}.v{version}.page{page_number}.pdf"
+
+    async def add_page(self, file_id: str, language: str, version: int, page_number: int, content: str):
+        """Start rendering a translated page in the background once fewer than ``window_pages`` are rendering"""
+        key = (file_id, language.lower(), version)
+        state = self.pending.setdefault(key, _RenderState())
+        while len(state.rendering) >= self.window_pages:
+            await asyncio.wait(state.rendering, return_when=asyncio.FIRST_COMPLETED)
+        future = asyncio.ensure_future(_run_in_pool(
+            _render_page, self._page_path(file_id, language, version, page_number), page_number, content
+        ))
+        future.add_done_callback(_observe_render)
+        future.add_done_callback(state.render_done)
+        state.rendering.add(future)
+        state.page_numbers.add(page_number)
+
+    async def finish(self, file_id: str, language: str, version: int) -> str:
+        """Merge the rendered pages of a translation version into its export"""
+        key = (file_id, language.lower(), version)
+        if key not in self.finishing:
+            self.finishing[key] = asyncio.create_task(self._finish(key))
+        # A download waiting for the same export must not cancel the merge for everyone else
+        return await asyncio.shield(self.finishing[key])
+
+    async def _finish(self, key: Tuple[str, str, int]) -> str:
+        file_id, language, version = key
+        state = self.pending.pop(key, None) or _RenderState()
+        page_paths = [self._page_path(file_id, language, version, number) for number in sorted(state.page_numbers)]
+        try:
+            await asyncio.gather(*state.rendering)
+            if state.error is not None:
+                raise state.error
+            output_path = self.pdf_path(file_id, language, version)
+            with STAGE_SECONDS.time(stage="pdf_merge"):
+                await _run_in_pool(_merge, page_paths, output_path)
+        finally:
+            self.finishing.pop(key, None)
+            for path in page_paths:
+                if os.path.exists(path):
+                    os.remove(path)
+        # Rendered pages and exports of earlier versions are stale now
+        self._remove_old_versions(file_id, language, version)
+        return output_path
+
+    def discard(self, file_id: str, language: str, version: int):
+        """Drop the rendered pages of a translation version that will not be finished"""
+        key = (file_id, language.lower(), version)
+        state = self.pending.pop(key, None)
+        if state is None or not state.page_numbers:
+            return
+        page_paths = [self._page_path(file_id, language, version, number) for number in state.page_numbers]
+
+        async def remove_when_rendered():
+            await asyncio.gather(*state.rendering, return_exceptions=True)
+            for path in page_paths:
+                if os.path.exists(path):
+                    os.remove(path)
+
+        asyncio.create_task(remove_when_rendered())
+
+    def _remove_old_versions(self, file_id: str, language: str, version: int):
+        prefix = glob.escape(self._prefix(file_id, language))
+        for path in glob.glob(f"{prefix}.v*.pdf"):
+            path_version = os.path.basename(path).split(".v", 1)[1].split(".", 1)[0]
+            if path_version.isdigit() and int(path_version) < version:
+                try:
+                    os.remove(path)
+                except OSError as e:
+                    logger.error(f"Error deleting old export {path}: {str(e)}")
+
+    async def render(self, file_id: str, language: str, version: int,
+                     load_pages: Callable[[], Iterable[Dict]]) -> str:
+        """Return the PDF export of a translation version, rendering it if it is not ready yet"""
+        path = self.pdf_path(file_id, language, version)
+        if os.path.exists(path):
+            return path
+        key = (file_id, language.lower(), version)
+        if key not in self.pending and key not in self.finishing:
+            # Pages are added inside the finishing task, a concurrent download waits for the same export
+            self.finishing[key] = asyncio.create_task(self._render(key, load_pages))
+        return await self.finish(file_id, language, version)
+
+    async def _render(self, key: Tuple[str, str, int], load_pages: Callable[[], Iterable[Dict]]) -> str:
+        file_id, language, version = key
+        try:
+            for page in load_pages():
+                await self.add_page(file_id, language, version, page["page_number"], page["content"])
+        except BaseException:
+            self.finishing.pop(key, None)
+            self.discard(file_id, language, version)
+            raise
+        return await self._finish(key)
@@ -0,0 +1,158 @@
+import os
+import re
+import difflib
+import logging
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Similarity from which a changed page is paired with the previous page it was most likely edited from
+REVISION_MATCH_THRESHOLD = float(os.getenv("REVISION_MATCH_THRESHOLD", "0.5"))
+# Pages before and after its expected position a changed page is compared with
+REVISION_MATCH_WINDOW = 8
+
+NUMBER = re.compile(r"\d+")
+WHITESPACE = re.compile(r"\s+")
+
+
+def _page_key(content: str) -> str:
+    # Text reflowed over other lines is the same page
+    return WHITESPACE.sub(" ", content).strip()
+
+
+def _nearest(candidates: List[int], expected: int) -> int:
+    return min(candidates, key=lambda index: abs(index - expected))
+
+
+def diff_pages(previous_pages: List[Dict[str, Any]], pages: List[Dict[str, Any]],
+               threshold: float = REVISION_MATCH_THRESHOLD) -> Dict[str, Any]:
+    """Match the pages of a revised document with the pages of its previous revision.
+
+    Pages are compared by their text with whitespace collapsed:
+
+    - runs of identical pages are aligned in order, so pages inserted or
+      removed elsewhere only shift them, and identical pages that moved are
+      matched wherever they are; both are ``unchanged``
+    - pages that differ only in their numbers, like the page numbers after an
+      inserted page, are ``renumbered`` and carry both lists of numbers
+    - any other page is ``changed`` and paired with the most similar previous
+      page near its position when the two are at least ``threshold`` similar,
+      or ``added`` when none is
+
+    Returns the match of every page by page number, the previous pages that
+    were removed and the count of every kind of page.
+    """
+    previous_keys = [_page_key(page["content"]) for page in previous_pages]
+    keys = [_page_key(page["content"]) for page in pages]
+    matches: Dict[int, Dict[str, Any]] = {}
+    used = set()
+    # Index in the previous revision each page would have if it was not changed
+    expected = list(range(len(pages)))
+
+    def pair(i, j, status, similarity=1.0):
+        used.add(i)
+        matches[pages[j]["page_number"]] = {
+            "status": status,
+            "previous_page": previous_pages[i]["page_number"],
+            "similarity": round(similarity, 3),
+        }
+
+    matcher = difflib.SequenceMatcher(None, previous_keys, keys, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        for j in range(j1, j2):
+            expected[j] = i1 + (j - j1)
+        if tag == "equal":
+            for offset in range(i2 - i1):
+                pair(i1 + offset, j1 + offset, "unchanged")
+
+    def unmatched():
+        return [j for j in range(len(pages)) if pages[j]["page_number"] not in matches]
+
+    # Identical pages that moved
+    by_key: Dict[str, List[int]] = {}
+    for i, key in enumerate(previous_keys):
+        if i not in used:
+            by_key.setdefault(key, []).append(i)
+    for j in unmatched():
+        candidates = [i for i in by_key.get(keys[j], []) if i not in used]
+        if candidates:
+            pair(_nearest(candidates, expected[j]), j, "unchanged")
+
+    # Pages whose text only differs in numbers
+    by_masked: Dict[str, List[int]] = {}
+    for i, key in enumerate(previous_keys):
+        if i not in used:
+            by_masked.setdefault(NUMBER.sub("#", key), []).append(i)
+    for j in unmatched():
+        candidates = [i for i in by_masked.get(NUMBER.sub("#", keys[j]), []) if i not in used]
+        if candidates:
+            i = _nearest(candidates, expected[j])
+            pair(i, j, "renumbered")
+            matches[pages[j]["page_number"]].update(
+                previous_numbers=NUMBER.findall(previous_keys[i]),
+                numbers=NUMBER.findall(keys[j]),
+            )
+
+    # Edited pages, compared only with the unmatched previous pages around their position
+    for j in unmatched():
+        best, best_ratio = None, threshold
+        low, high = expected[j] - REVISION_MATCH_WINDOW, expected[j] + REVISION_MATCH_WINDOW
+        for i in range(max(0, low), min(len(previous_pages), high + 1)):
+            if i in used:
+                continue
+            matcher = difflib.SequenceMatcher(None, previous_keys[i], keys[j], autojunk=False)
+            if matcher.real_quick_ratio() < best_ratio or matcher.quick_ratio() < best_ratio:
+                continue
+            ratio = matcher.ratio()
+            if ratio >= best_ratio:
+                best, best_ratio = i, ratio
+        if best is not None:
+            pair(best, j, "changed", best_ratio)
+        else:
+            matches[pages[j]["page_number"]] = {"status": "added", "previous_page": None, "similarity": 0.0}
+
+    counts = {status: 0 for status in ("unchanged", "renumbered", "changed", "added")}
+    for match in matches.values():
+        counts[match["status"]] += 1
+    removed = [previous_pages[i]["page_number"] for i in range(len(previous_pages)) if i not in used]
+    return {"pages": matches, "removed": removed, "stats": dict(counts, removed=len(removed))}
+
+
+def renumber(content: str, previous_numbers: List[str], numbers: List[str]) -> Optional[str]:
+    """Put the new numbers of a renumbered page into the translation of its previous revision.
+
+    Returns None unless the translation kept exactly the numbers of the
+    previous page in the same order, then the page has to be translated.
+    """
+    found = list(NUMBER.finditer(content))
+    if [match.group() for match in found] != previous_numbers:
+        return None
+    pieces = []
+    position = 0
+    for match, number in zip(found, numbers):
+        pieces.append(content[position:match.start()])
+        pieces.append(number)
+        position = match.end()
+    pieces.append(content[position:])
+    return "".join(pieces)
+
+
+def reuse_translations(revision: Dict[str, Any], previous_translation: Dict[int, str]) -> Dict[int, str]:
+    """Translations of the pages of a revision that can be taken over from the previous one.
+
+    ``previous_translation`` maps the previous revision's page numbers to
+    their translated content. Returns the reusable translation by page number
+    of the revision, every other page has to be translated.
+    """
+    reused = {}
+    for page_number, match in revision["pages"].items():
+        content = previous_translation.get(match["previous_page"])
+        if content is None:
+            continue
+        if match["status"] == "unchanged":
+            reused[int(page_number)] = content
+        elif match["status"] == "renumbered":
+            content = renumber(content, match["previous_numbers"], match["numbers"])
+            if content is not None:
+                reused[int(page_number)] = content
+    return reused
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException, BackgroundTasks, WebSocket, WebSocketDisconnect, Query
+from fastapi import APIRouter, Form, HTTPException, BackgroundTasks, WebSocket, WebSocketDisconnect, Query, Request
 from fastapi.responses import JSONResponse, FileResponse
 from fastapi.encoders import jsonable_encoder
 import os
@@ -8,18 +8,29 @@ import logging
 import traceback
 import json
 import asyncio
-import shutil
-from dotenv import load_dotenv, find_dotenv
+from contextlib import ExitStack
 from typing import List, Dict, Any, Optional
-import markdown2
-import openai
-import PyPDF2
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, PageBreak
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.enums import TA_CENTER, TA_LEFT
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
+
+from app.batches import MAX_BATCH_DOCUMENTS, MAX_BATCH_UPLOAD_SIZE, BatchStore, document_jobs, expand_zip, summarize_batch
+from app.chunking import (
+    PackedStreamSplitter, completion_budget, estimate_tokens, pack_texts, restore_whitespace, split_text, unpack_texts
+)
+from app.documents import DocumentStore
+from app.extraction import iter_page_windows
+from app.jobs import JobBusyError, JobManager
+from app.metrics import STAGE_SECONDS, WEBSOCKET_CONNECTIONS, timed
+from app.progress import ProgressBroadcaster
+from app.rendering import PdfRenderer
+from app.revisions import diff_pages, reuse_translations
+from app.scheduler import current_flow
+from app.segmentation import combine_stats
+from app.state import get_state_backend
+from app.storage import StorageManager
+from app.translation_cache import get_translation_cache, make_cache_key
+from app.translation_client import PROMPT_VERSION, get_translation_client
+from app.translation_store import TranslationStore
+from app.translation_engine import OrderedPageWriter, ProgressTracker, StreamingPageWriter, translate_languages
+from app.uploads import MAX_UPLOAD_SIZE, file_sha256, receive_upload
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -27,122 +38,185 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api", tags=["pdf"])
 
-# Ensure environment variables are loaded
-dotenv_path = find_dotenv()
-if dotenv_path:
-    load_dotenv(dotenv_path)
-    logger.info(f"PDF Router: Loaded .env from {dotenv_path}")
-
-# Initialize OpenAI API key
-openai.api_key = os.getenv("OPENAI_API_KEY")
-logger.info(f"PDF Router: API key status: {'Set' if openai.api_key else 'Not set'}")
-if openai.api_key:
-    logger.info(f"PDF Router: API key starts with: {openai.api_key[:5]}...")
-
 # Temporary storage for uploaded files and translations
 UPLOAD_DIR = "uploads"
 EXPORT_DIR = "exports"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 os.makedirs(EXPORT_DIR, exist_ok=True)
 
-# Store translations in memory (in a production app, use a database)
-translations_cache = {}
-# Store active translation tasks
-active_translations = {}
-active_connections = {}
+# Most pages returned by a single page request
+MAX_PAGES_PER_REQUEST = int(os.getenv("MAX_PAGES_PER_REQUEST", "50"))
+# Pages of a document held in memory at once while it is extracted, translated and exported
+PIPELINE_WINDOW_PAGES = int(os.getenv("PIPELINE_WINDOW_PAGES", "50"))
 
-async def cleanup_files():
-    """Delete all files in uploads and exports directories"""
-    try:
-        # Clean uploads directory
-        if os.path.exists(UPLOAD_DIR):
-            for filename in os.listdir(UPLOAD_DIR):
-                file_path = os.path.join(UPLOAD_DIR, filename)
-                try:
-                    if os.path.isfile(file_path):
-                        os.unlink(file_path)
-                    elif os.path.isdir(file_path):
-                        shutil.rmtree(file_path)
-                except Exception as e:
-                    logger.error(f"Error deleting file {file_path}: {str(e)}")
-        
-        # Clean exports directory
-        if os.path.exists(EXPORT_DIR):
-            for filename in os.listdir(EXPORT_DIR):
-                file_path = os.path.join(EXPORT_DIR, filename)
-                try:
-                    if os.path.isfile(file_path):
-                        os.unlink(file_path)
-                    elif os.path.isdir(file_path):
-                        shutil.rmtree(file_path)
-                except Exception as e:
-                    logger.error(f"Error deleting file {file_path}: {str(e)}")
-        
-        # Clear the translations cache
-        translations_cache.clear()
-        
-        # Close any active WebSocket connections
-        for file_id in list(active_connections.keys()):
-            try:
-                await active_connections[file_id].close()
-                del active_connections[file_id]
-            except Exception as e:
-                logger.error(f"Error closing WebSocket for {file_id}: {str(e)}")
-        
-        logger.info("Cleaned up all existing files and connections")
-    except Exception as e:
-        logger.error(f"Error during cleanup: {str(e)}")
+# Uploaded documents and their extracted pages, indexed by content hash
+document_store = DocumentStore()
+
+# Translated pages of every document, the exports are rendered from here
+translation_store = TranslationStore()
+# Renders PDF exports in worker processes while pages are being translated
+pdf_renderer = PdfRenderer(EXPORT_DIR, window_pages=PIPELINE_WINDOW_PAGES)
+# Progress messages and the index of running jobs, shared by every worker process
+state = get_state_backend()
+# Documents uploaded together and the jobs translating them
+batch_store = BatchStore()
+
+def forget_document(file_id):
+    """Drop the translations of a document whose files were evicted"""
+    translation_store.delete(file_id)
+
+# Evicts documents by age and disk usage instead of wiping everything on each upload
+storage_manager = StorageManager(
+    document_store,
+    UPLOAD_DIR,
+    EXPORT_DIR,
+    busy_files=lambda: job_manager.active_file_ids(),
+    on_evict=forget_document,
+    state=state
+)
+
+# Every WebSocket following a file, in this and the other worker processes, gets its progress
+progress = ProgressBroadcaster(state)
+
+def notify(file_id, message):
+    """Publish a progress message to the WebSockets of a file in every worker, never waiting on a client"""
+    progress.publish(file_id, message)
+
+def page_range(page_from, page_to, total_pages):
+    """Clamp a requested page range to the document and the per-request limit"""
+    if page_to is not None and page_to < page_from:
+        raise HTTPException(status_code=400, detail="page_to must not be smaller than page_from")
+    # Page 1 of an empty document is still a valid, empty window
+    if total_pages is not None and page_from > max(total_pages, 1):
+        raise HTTPException(status_code=416, detail=f"page_from is past the last page ({total_pages})")
+    last_page = page_from + MAX_PAGES_PER_REQUEST - 1
+    if page_to is not None:
+        last_page = min(last_page, page_to)
+    if total_pages is not None:
+        last_page = min(last_page, total_pages)
+    return page_from, last_page
+
+def pages_response(pages, page_from, page_to, total_pages):
+    """A window of pages with the cursor of the next window"""
+    return {
+        "page_from": page_from,
+        "page_to": page_to,
+        "total_pages": total_pages,
+        "next_page": page_to + 1 if total_pages is not None and page_to < total_pages else None,
+        "pages": pages
+    }
+
+def upload_response(file_id, total_pages, filename, duplicate, revision=None):
+    """Metadata of an uploaded document with only its first page, the rest is loaded on demand"""
+    return {
+        "file_id": file_id,
+        "total_pages": total_pages,
+        "pages": document_store.get_pages(file_id, 1, 1),
+        "pages_url": f"/api/documents/{file_id}/pages",
+        "filename": filename,
+        "duplicate": duplicate,
+        "revision": revision
+    }
+
+async def link_revision(file_id, previous_file_id):
+    """Diff a document with its previous revision so the pages they share reuse its translations"""
+    if not previous_file_id or previous_file_id == file_id:
+        return None
+    diff = await asyncio.to_thread(
+        diff_pages, document_store.get_pages(previous_file_id), document_store.get_pages(file_id)
+    )
+    document_store.set_revision(file_id, previous_file_id, diff)
+    logger.info(f"Linked {file_id} to previous revision {previous_file_id}: {diff['stats']}")
+    return dict(diff["stats"], previous_file_id=previous_file_id)
+
+def stored_revision(file_id):
+    """The revision link a stored document already has, summarized like ``link_revision`` does"""
+    revision = document_store.get_revision(file_id)
+    if revision is None:
+        return None
+    return dict(revision["stats"], previous_file_id=revision["previous_file_id"])
+
+def revision_translations(revision, language, page_from, page_to):
+    """Translated pages of a document's previous revision that carry over to its pages ``page_from`` to ``page_to``"""
+    previous_file_id = revision["previous_file_id"]
+    translation = translation_store.get(previous_file_id, language)
+    if translation is None or translation["status"] != "completed":
+        return {}
+    matches = {
+        page_number: match for page_number, match in revision["pages"].items()
+        if page_from <= int(page_number) <= page_to and match["status"] in ("unchanged", "renumbered")
+    }
+    previous_numbers = [match["previous_page"] for match in matches.values()]
+    if not previous_numbers:
+        return {}
+    # Only the previous pages these pages came from are loaded, usually a window of about the same size
+    pages = translation_store.get_pages(previous_file_id, language, min(previous_numbers), max(previous_numbers))
+    return reuse_translations({"pages": matches}, {page["page_number"]: page["content"] for page in pages})
 
 @router.post("/upload")
-async def upload_pdf(file: UploadFile = File(...)):
-    """Upload a PDF file and extract text content page by page"""
+async def upload_pdf(request: Request):
+    """Upload a PDF file and extract text content page by page
+    
+    With a ``previous_file_id`` form field the upload is a new revision of
+    that document. Its pages are diffed with the previous ones, and pages
+    that did not change are not translated again but take over the
+    translations of the previous revision.
+    """
     try:
+        # Create upload directory if it doesn't exist
+        os.makedirs(UPLOAD_DIR, exist_ok=True)
+        os.makedirs(EXPORT_DIR, exist_ok=True)
+        
+        # Stream the body to disk, hashing it on the way
+        with STAGE_SECONDS.time(stage="upload_read"):
+            upload = await receive_upload(request, UPLOAD_DIR)
+        uploaded = [f for f in upload["files"] if f["field"] == "file"]
+        for extra in upload["files"]:
+            if extra not in uploaded[:1]:
+                os.remove(extra["path"])
+        if not uploaded:
+            raise HTTPException(status_code=400, detail="No file uploaded")
+        upload_file = uploaded[0]
+        
+        previous_file_id = upload["fields"].get("previous_file_id") or None
+        if previous_file_id and document_store.get(previous_file_id) is None:
+            os.remove(upload_file["path"])
+            raise HTTPException(status_code=404, detail="Previous revision not found")
+        
         # Check if the file is a PDF
-        if not file.filename.lower().endswith('.pdf'):
+        if not upload_file["filename"].lower().endswith('.pdf'):
+            os.remove(upload_file["path"])
             raise HTTPException(status_code=400, detail="File must be a PDF")
         
+        # An identical file that is still stored is reused together with its extracted pages
+        existing = document_store.find_by_hash(upload_file["sha256"])
+        if existing and os.path.exists(os.path.join(UPLOAD_DIR, f"{existing['file_id']}.pdf")):
+            os.remove(upload_file["path"])
+            file_id = existing["file_id"]
+            document_store.touch(file_id)
+            logger.info(f"Upload of {upload_file['filename']} matches stored document {file_id}")
+            # The document is shared with its first uploader, whose revision link is kept as it is
+            revision = stored_revision(file_id) or await link_revision(file_id, previous_file_id)
+            
+            return upload_response(file_id, existing["total_pages"], upload_file["filename"], duplicate=True, revision=revision)
+        
         # Generate a unique ID for the file
         file_id = str(uuid.uuid4())
         
-        # Create upload directory if it doesn't exist
-        os.makedirs(UPLOAD_DIR, exist_ok=True)
-        os.makedirs(EXPORT_DIR, exist_ok=True)
-        
-        # Clean up existing files
-        await cleanup_files()
-        
         # Save the file
         file_path = os.path.join(UPLOAD_DIR, f"{file_id}.pdf")
-        with open(file_path, "wb") as f:
-            content = await file.read()
-            f.write(content)
+        os.replace(upload_file["path"], file_path)
         
         # Extract text from PDF
         try:
-            pages_content = []
-            with open(file_path, "rb") as f:
-                pdf_reader = PyPDF2.PdfReader(f)
-                for page_num in range(len(pdf_reader.pages)):
-                    page = pdf_reader.pages[page_num]
-                    text = page.extract_text()
-                    pages_content.append({
-                        "page_number": page_num + 1,
-                        "content": text
-                    })
-            
-            # Store in cache
-            translations_cache[file_id] = {
-                "original": pages_content,
-                "translations": {},
-                "filename": file.filename
-            }
+            # Remember the document by its content hash
+            total_pages = await extract_document(
+                file_id, file_path, upload_file["sha256"], upload_file["filename"], upload_file["size"]
+            )
+            storage_manager.request_sweep()
+            revision = await link_revision(file_id, previous_file_id)
             
-            return {
-                "file_id": file_id,
-                "total_pages": len(pages_content),
-                "pages": pages_content,
-                "filename": file.filename
-            }
+            return upload_response(file_id, total_pages, upload_file["filename"], duplicate=False, revision=revision)
         except Exception as e:
             logger.error(f"Error processing PDF: {str(e)}")
             logger.error(traceback.format_exc())
@@ -150,24 +224,55 @@ async def upload_pdf(file: UploadFile = File(...)):
             if os.path.exists(file_path):
                 os.remove(file_path)
             raise HTTPException(status_code=500, detail=f"Error processing PDF: {str(e)}")
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error uploading PDF: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error processing PDF: {str(e)}")
 
+@router.get("/documents/{file_id}/pages")
+async def get_document_pages(file_id: str, page_from: int = Query(1, ge=1), page_to: Optional[int] = Query(None, ge=1)):
+    """Get a range of the extracted pages of an uploaded document"""
+    document = document_store.get(file_id)
+    if document is None:
+        raise HTTPException(status_code=404, detail="File not found")
+    document_store.touch(file_id)
+    
+    page_from, page_to = page_range(page_from, page_to, document["total_pages"])
+    response = pages_response(
+        document_store.get_pages(file_id, page_from, page_to), page_from, page_to, document["total_pages"]
+    )
+    response["file_id"] = file_id
+    return response
+
 @router.websocket("/ws/translate/{file_id}")
 async def websocket_translate(websocket: WebSocket, file_id: str):
     await websocket.accept()
     
-    # Store the WebSocket connection in the active connections
-    active_connections[file_id] = websocket
+    # Subscribe to the progress of the file, whichever worker runs its translation;
+    # messages are queued so a slow client never holds up a translation
+    sender = progress.subscribe(file_id, websocket)
+    WEBSOCKET_CONNECTIONS.inc()
     
     # Send a connected message
-    await websocket.send_json({
+    sender.send({
         "status": "connected",
         "message": "WebSocket connection established",
         "file_id": file_id
     })
     
+    # Tell a reconnecting client where its background translation is
+    job = job_manager.find_active(file_id)
+    if job is not None:
+        sender.send({
+            "status": "translating",
+            "message": f"Translation job {job['status']}",
+            "job_id": job["job_id"],
+            "progress": job["progress"],
+            "completed_pages": job["completed_pages"],
+            "total_pages": job["total_pages"]
+        })
+    
     try:
         # Keep the connection open and listen for messages
         while True:
@@ -176,103 +281,65 @@ async def websocket_translate(websocket: WebSocket, file_id: str):
             
             # Handle any client messages if needed
             if data.get("action") == "start_translation":
-                await websocket.send_json({
+                sender.send({
                     "status": "translating",
                     "message": "Starting translation process",
                     "file_id": file_id,
                     "progress": 0
                 })
     except WebSocketDisconnect:
-        # Remove the connection when it's closed
-        if file_id in active_connections:
-            del active_connections[file_id]
         logger.info(f"WebSocket connection closed for file_id: {file_id}")
     except Exception as e:
         logger.error(f"WebSocket error for file_id {file_id}: {str(e)}")
-        if file_id in active_connections:
-            del active_connections[file_id]
+    finally:
+        # Remove the connection when it's closed
+        WEBSOCKET_CONNECTIONS.dec()
+        await progress.unsubscribe(file_id, sender)
 
-async def translate_page(page, target_language, file_id, page_index, total_pages):
-    """Translate a single page and send progress updates via WebSocket"""
-    try:
-        # Skip empty content
-        if not page["content"].strip():
-            logger.warning(f"Page {page['page_number']} has no content to translate")
-            return {
-                "page_number": page["page_number"],
-                "content": ""
-            }
-        
-        # Send progress update
-        if file_id in active_connections:
-            progress_percentage = (page_index / total_pages) * 100
-            await active_connections[file_id].send_json({
-                "status": "translating",
-                "message": f"Translating page {page['page_number']} of {total_pages}",
-                "progress": progress_percentage,
-                "page": page["page_number"],
-                "total_pages": total_pages
-            })
-        
-        # Use OpenAI to translate the text
-        logger.info(f"Translating page {page['page_number']} to {target_language}")
-        response = openai.ChatCompletion.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": f"You are a translator. Translate the following text to {target_language}. Preserve formatting as much as possible."},
-                {"role": "user", "content": page["content"]}
-            ],
-            temperature=0.3,
-            max_tokens=4000
-        )
-        
-        # Extract translated text
-        if hasattr(response.choices[0].message, "content"):
-            translated_text = response.choices[0].message.content
-        else:
-            translated_text = response.choices[0].message["content"]
-        
-        # Send completion update
-        if file_id in active_connections:
-            progress_percentage = ((page_index + 1) / total_pages) * 100
-            await active_connections[file_id].send_json({
-                "status": "page_completed",
-                "message": f"Completed page {page['page_number']} of {total_pages}",
-                "progress": progress_percentage,
-                "page": page["page_number"],
-                "total_pages": total_pages
-            })
-        
-        return {
-            "page_number": page["page_number"],
-            "content": translated_text
-        }
-    except Exception as e:
-        logger.error(f"Error translating page {page['page_number']}: {str(e)}")
-        logger.error(traceback.format_exc())
-        # Send error update
-        if file_id in active_connections:
-            await active_connections[file_id].send_json({
-                "status": "error",
-                "page": page["page_number"],
-                "message": f"Error translating page {page['page_number']}: {str(e)}"
-            })
-        raise e
+def parse_languages(values):
+    """Collect the requested languages from repeated or comma separated values, in order and without duplicates"""
+    languages = []
+    for value in values:
+        for language in (value or "").split(","):
+            language = language.strip()
+            if language and language.lower() not in [known.lower() for known in languages]:
+                languages.append(language)
+    return languages
 
-@router.post("/translate")
-async def translate_document(file_id: str = Form(...), target_language: str = Form(...)):
-    """Translate a PDF document to the target language"""
+@router.post("/translate", status_code=202)
+async def translate_document(
+    file_id: str = Form(...),
+    target_language: Optional[str] = Form(None),
+    target_languages: List[str] = Form([]),
+    stream: bool = Form(False)
+):
+    """Start translating a PDF document to one or more target languages and return the job right away
+    
+    ``target_languages`` may be repeated or comma separated; all languages
+    share one extraction and one concurrency-limited translation run.
+    Languages a running job of the document already translates are left to
+    that job: a request they cover entirely returns it with ``attached``
+    set, otherwise the new job only translates the other languages. ``jobs``
+    maps every requested language to the job translating it.
+    """
     try:
+        languages = parse_languages([target_language] + (target_languages or []))
+        if not languages:
+            raise HTTPException(status_code=400, detail="At least one target language is required")
+        
         # Check if the file exists
         file_path = os.path.join(UPLOAD_DIR, f"{file_id}.pdf")
         if not os.path.exists(file_path):
             raise HTTPException(status_code=404, detail="File not found")
+        document_store.touch(file_id)
         
-        # Start translation process
-        result = await translate_pdf(file_id, target_language)
-        
-        # Return the translation result
-        return result
+        # Start translation process in the background, or join the job already doing the same
+        job, attached, jobs = await job_manager.create_or_attach(file_id, languages, stream=stream)
+        return dict(job_response(job), attached=attached, jobs=jobs)
+    except HTTPException:
+        raise
+    except JobBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         logger.error(f"Error translating document: {str(e)}")
         error_detail = str(e)
@@ -280,138 +347,357 @@ async def translate_document(file_id: str = Form(...), target_language: str = Fo
             error_detail += " - This may be due to an invalid API key or API rate limits."
         raise HTTPException(status_code=500, detail=error_detail)
 
-@router.get("/translate")
-async def get_translation(file_id: str, target_language: str):
-    """Get translation data for a specific file and language"""
+@router.post("/batches", status_code=202)
+async def create_batch(request: Request):
+    """Upload many PDFs, as files or in ZIP archives, and translate all of them in the background
+    
+    Every document gets its own translation job. The jobs run side by side,
+    and extraction workers and model requests are shared out between the
+    documents in turn, so a long document never holds up the short ones.
+    """
+    received = []
     try:
-        # Check if the translation exists in the cache
-        if file_id in translations_cache and target_language in translations_cache[file_id]["translations"]:
-            # Return cached translation
-            return {
-                "file_id": file_id,
-                "target_language": target_language,
-                "pages": translations_cache[file_id]["translations"][target_language],
-                "export_url": f"/api/download/{file_id}?format=md&target_language={target_language.lower()}"
-            }
+        os.makedirs(UPLOAD_DIR, exist_ok=True)
+        with STAGE_SECONDS.time(stage="upload_read"):
+            upload = await receive_upload(request, UPLOAD_DIR, MAX_BATCH_UPLOAD_SIZE)
+        received = list(upload["files"])
         
-        # Check if the markdown file exists
-        md_filename = f"{file_id}_{target_language.lower()}.md"
-        md_path = os.path.join("exports", md_filename)
+        fields = upload["fields"]
+        languages = parse_languages([fields.get("target_language"), fields.get("target_languages")])
+        if not languages:
+            raise HTTPException(status_code=400, detail="At least one target language is required")
+        stream = fields.get("stream", "").lower() in ("1", "true", "yes", "on")
         
-        if os.path.exists(md_path):
-            # Read the markdown file to get the translation
-            with open(md_path, "r", encoding="utf-8") as md_file:
-                content = md_file.read()
-            
-            # Parse the content to extract page translations
-            pages = []
-            current_page = None
-            current_content = []
-            
-            for line in content.split('\n'):
-                if line.startswith('## Page '):
-                    # Save previous page if exists
-                    if current_page is not None:
-                        pages.append({
-                            "page_number": current_page,
-                            "content": '\n'.join(current_content)
-                        })
-                    
-                    # Start new page
-                    try:
-                        current_page = int(line.replace('## Page ', ''))
-                        current_content = []
-                    except ValueError:
-                        current_page = None
-                elif current_page is not None:
-                    current_content.append(line)
+        # Unpack the ZIP archives, their PDFs count towards the document limit
+        files = []
+        for upload_file in upload["files"]:
+            filename = upload_file["filename"].lower()
+            if filename.endswith(".zip"):
+                members = await asyncio.to_thread(
+                    expand_zip, upload_file["path"], UPLOAD_DIR, MAX_UPLOAD_SIZE, MAX_BATCH_DOCUMENTS - len(files)
+                )
+                received.extend(members)
+                files.extend(members)
+            elif filename.endswith(".pdf"):
+                if upload_file["size"] > MAX_UPLOAD_SIZE:
+                    raise HTTPException(status_code=413, detail=f"{upload_file['filename']} exceeds the {MAX_UPLOAD_SIZE} byte limit")
+                files.append(upload_file)
+            else:
+                raise HTTPException(status_code=400, detail="Batch files must be PDFs or ZIP archives of PDFs")
+            if len(files) > MAX_BATCH_DOCUMENTS:
+                raise HTTPException(status_code=413, detail=f"A batch may contain at most {MAX_BATCH_DOCUMENTS} PDFs")
+        if not files:
+            raise HTTPException(status_code=400, detail="No PDF files uploaded")
+        
+        # One job per distinct document, files already stored are reused with their extracted pages
+        documents = []
+        jobs_by_hash = {}
+        for upload_file in files:
+            entry = {"filename": upload_file["filename"]}
+            if upload_file["sha256"] in jobs_by_hash:
+                documents.append(dict(jobs_by_hash[upload_file["sha256"]], **entry, duplicate=True))
+                continue
             
-            # Add the last page
-            if current_page is not None:
-                pages.append({
-                    "page_number": current_page,
-                    "content": '\n'.join(current_content)
+            existing = document_store.find_by_hash(upload_file["sha256"])
+            if existing and os.path.exists(os.path.join(UPLOAD_DIR, f"{existing['file_id']}.pdf")):
+                file_id = existing["file_id"]
+                document_store.touch(file_id)
+                job, _, jobs = await job_manager.create_or_attach(file_id, languages, stream=stream)
+                entry["duplicate"] = True
+            else:
+                # Extracted by its job, so the upload returns before the first page is read
+                file_id = str(uuid.uuid4())
+                os.replace(upload_file["path"], os.path.join(UPLOAD_DIR, f"{file_id}.pdf"))
+                job = job_manager.create(file_id, languages, stream=stream, document={
+                    "sha256": upload_file["sha256"],
+                    "filename": upload_file["filename"],
+                    "size": upload_file["size"]
                 })
-            
-            # Cache the translation
-            if file_id not in translations_cache:
-                translations_cache[file_id] = {"translations": {}}
-            
-            translations_cache[file_id]["translations"][target_language] = pages
-            
-            return {
+                jobs = {language: job["job_id"] for language in languages}
+                entry["duplicate"] = False
+            # Languages a running job of the document already translated are followed in that job
+            jobs_by_hash[upload_file["sha256"]] = {"file_id": file_id, "job_id": job["job_id"], "jobs": jobs}
+            documents.append(dict(entry, **jobs_by_hash[upload_file["sha256"]]))
+        
+        batch = batch_store.create(languages, documents)
+        storage_manager.request_sweep()
+        logger.info(f"Started batch {batch['batch_id']} of {len(documents)} documents")
+        return batch_response(batch)
+    except HTTPException:
+        raise
+    except JobBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error creating batch: {str(e)}")
+        logger.error(traceback.format_exc())
+        raise HTTPException(status_code=500, detail=f"Error creating batch: {str(e)}")
+    finally:
+        # Files that were not moved into place, e.g. duplicates and the ZIP archives themselves
+        for upload_file in received:
+            if os.path.exists(upload_file["path"]):
+                os.remove(upload_file["path"])
+
+@router.get("/batches/{batch_id}")
+async def get_batch(batch_id: str):
+    """Get the progress of every document of a batch and of the whole batch"""
+    batch = batch_store.get(batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return batch_response(batch)
+
+def batch_response(batch):
+    """Public view of a batch with the current progress of its jobs"""
+    job_ids = {job_id for document in batch["documents"] for job_id in document_jobs(document).values()}
+    response = summarize_batch(batch, {job_id: job_manager.get(job_id) for job_id in job_ids})
+    for document in response["documents"]:
+        document["status_url"] = f"/api/jobs/{document['job_id']}"
+    response["status_url"] = f"/api/batches/{batch['batch_id']}"
+    return response
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Get the status of a translation job"""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job_response(job)
+
+def job_response(job):
+    """Public view of a translation job"""
+    return {
+        "job_id": job["job_id"],
+        "file_id": job["file_id"],
+        "target_language": job["target_language"],
+        "target_languages": job_languages(job),
+        "status": job["status"],
+        "progress": job["progress"],
+        "completed_pages": job["completed_pages"],
+        "total_pages": job["total_pages"],
+        "languages": job.get("languages", {}),
+        "error": job["error"],
+        "result": job["result"],
+        "status_url": f"/api/jobs/{job['job_id']}"
+    }
+
+@router.get("/translate")
+async def get_translation(file_id: str, target_language: str, page_from: int = Query(1, ge=1), page_to: Optional[int] = Query(None, ge=1)):
+    """Get a range of the translated pages of a file, at most MAX_PAGES_PER_REQUEST at a time"""
+    try:
+        # A partial export must not be served or cached while its job is still running
+        job = job_manager.find_active(file_id, target_language)
+        if job is not None:
+            raise HTTPException(status_code=409, detail=f"Translation in progress (job {job['job_id']})")
+        document_store.touch(file_id)
+        
+        # Read the finished pages from the translation store
+        translation = translation_store.get(file_id, target_language)
+        if translation is not None and translation["status"] == "completed":
+            total_pages = translation["total_pages"]
+            page_from, page_to = page_range(page_from, page_to, total_pages)
+            response = pages_response(
+                translation_store.get_pages(file_id, target_language, page_from, page_to), page_from, page_to, total_pages
+            )
+            response.update({
                 "file_id": file_id,
                 "target_language": target_language,
-                "pages": pages,
                 "export_url": f"/api/download/{file_id}?format=md&target_language={target_language.lower()}"
-            }
+            })
+            return response
         
         raise HTTPException(status_code=404, detail="Translation not found")
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error getting translation: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error retrieving translation: {str(e)}")
 
-def extract_text_from_pdf(file_path):
-    """Extract text from a PDF file page by page."""
+@timed("extraction")
+async def extract_document(file_id, file_path, sha256, filename, size):
+    """Extract text from a PDF file page by page and register it in the document store.
+    
+    Pages are stored a window at a time as they are extracted, so a long PDF
+    is never held in memory as a whole. Returns the page count.
+    """
     try:
-        pages_content = []
-        with open(file_path, "rb") as f:
-            pdf_reader = PyPDF2.PdfReader(f)
-            for page_num in range(len(pdf_reader.pages)):
-                page = pdf_reader.pages[page_num]
-                text = page.extract_text()
-                pages_content.append({
-                    "page_number": page_num + 1,
-                    "content": text
-                })
-        return pages_content
-    except Exception as e:
-        logger.error(f"Error extracting text from PDF: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Error extracting text from PDF: {str(e)}")
+        total_pages = 0
+        async for pages in iter_page_windows(file_path, PIPELINE_WINDOW_PAGES):
+            await asyncio.to_thread(document_store.add_pages, file_id, pages)
+            total_pages += len(pages)
+        await asyncio.to_thread(document_store.register, file_id, sha256, filename, size, total_pages)
+        return total_pages
+    except BaseException:
+        # Drop the pages stored so far, the document was never registered
+        document_store.delete(file_id)
+        raise
 
-def translate_text(text, target_language):
-    """Translate text to the target language using OpenAI API."""
+async def translate_text(text, target_language, on_delta=None):
+    """Translate text to the target language using the shared OpenAI client.
+    
+    With ``on_delta`` the response is streamed and passed on piece by piece.
+    """
     try:
         # Check if the text is empty
         if not text or text.strip() == "":
             return "No content to translate."
         
-        # Get API key from environment
-        api_key = os.getenv("OPENAI_API_KEY")
-        if not api_key:
-            raise ValueError("OpenAI API key is not set")
-        
-        # Set the API key for the older OpenAI client style
-        openai.api_key = api_key
-        
-        # Use OpenAI API to translate the text (older API style)
-        response = openai.ChatCompletion.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": f"You are a professional translator. Translate the following text to {target_language}. Preserve the formatting and structure as much as possible."},
-                {"role": "user", "content": text}
-            ],
-            temperature=0.3,
-            max_tokens=4000
+        # Return a previous translation of the same text if there is one
+        client = get_translation_client()
+        cache = get_translation_cache()
+        cache_key = make_cache_key(text, target_language, client.model, PROMPT_VERSION)
+        cached = await asyncio.to_thread(cache.get, cache_key)
+        if cached is not None:
+            if on_delta is not None:
+                on_delta(cached)
+            return cached
+        
+        # Send the request through the pooled async client so the event loop is never blocked
+        input_tokens = estimate_tokens(text)
+        result = await client.complete_translation(
+            text,
+            target_language,
+            max_tokens=completion_budget(input_tokens, client.max_tokens),
+            on_delta=on_delta
         )
         
-        # Extract the translated text from the response
-        translated_text = response.choices[0].message["content"]
-        return translated_text
+        # A truncated translation is retried in two halves instead of being returned cut off
+        if result["finish_reason"] == "length":
+            parts = split_text(text, max(1, input_tokens // 2))
+            if len(parts) > 1:
+                logger.warning(f"Translation truncated, retrying as {len(parts)} smaller requests")
+                translated_parts = await asyncio.gather(*[translate_text(part, target_language) for part in parts])
+                return "".join(restore_whitespace(part, translated) for part, translated in zip(parts, translated_parts))
+            logger.warning("Translation truncated by max_tokens and cannot be split further")
+            return result["content"]
+        
+        await asyncio.to_thread(cache.set, cache_key, result["content"])
+        return result["content"]
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error translating text: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error translating text: {str(e)}")
 
-async def translate_pdf(file_id: str, target_language: str):
-    """Translate PDF content to the target language."""
+async def translate_texts(texts, target_language, on_delta=None):
+    """Translate several texts, packing the ones that are not cached into a single request.
+    
+    With ``on_delta`` the request is streamed and every piece of generated text
+    is passed on together with the index of the text it belongs to.
+    """
+    try:
+        client = get_translation_client()
+        cache = get_translation_cache()
+        results = list(texts)
+        
+        # Blank texts are kept as they are and cached texts are never sent again
+        keys = {
+            i: make_cache_key(text, target_language, client.model, PROMPT_VERSION)
+            for i, text in enumerate(texts) if text.strip()
+        }
+        cached_texts = await asyncio.to_thread(cache.get_many, keys.values())
+        missing = []
+        for i in keys:
+            cached = cached_texts.get(keys[i])
+            if cached is not None:
+                results[i] = cached
+                if on_delta is not None:
+                    on_delta(i, cached)
+            else:
+                missing.append(i)
+        
+        def text_delta(i):
+            if on_delta is None:
+                return None
+            return lambda delta: on_delta(i, delta)
+        
+        if len(missing) == 1:
+            results[missing[0]] = await translate_text(texts[missing[0]], target_language, text_delta(missing[0]))
+        elif missing:
+            packed = pack_texts([texts[i] for i in missing])
+            # Route each streamed piece to its text as the marker lines go by
+            splitter = PackedStreamSplitter(len(missing))
+            
+            def split_delta(delta):
+                for position, text_delta_piece in splitter.feed(delta):
+                    on_delta(missing[position], text_delta_piece)
+            
+            packed_delta = split_delta if on_delta is not None else None
+            
+            result = await client.complete_translation(
+                packed,
+                target_language,
+                packed=True,
+                max_tokens=completion_budget(estimate_tokens(packed), client.max_tokens),
+                on_delta=packed_delta
+            )
+            if on_delta is not None:
+                for position, text_delta_piece in splitter.flush():
+                    on_delta(missing[position], text_delta_piece)
+            unpacked = None
+            if result["finish_reason"] != "length":
+                unpacked = unpack_texts(result["content"], len(missing))
+            
+            if unpacked is None:
+                # The markers did not come back intact, translate every text on its own
+                logger.warning(f"Could not split packed translation of {len(missing)} texts, translating them one by one")
+                translated = await asyncio.gather(*[translate_text(texts[i], target_language, text_delta(i)) for i in missing])
+                for i, translated_text in zip(missing, translated):
+                    results[i] = translated_text
+            else:
+                for i, translated_text in zip(missing, unpacked):
+                    results[i] = translated_text
+                await asyncio.to_thread(cache.set_many, {keys[i]: results[i] for i in missing})
+        
+        return results
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error translating texts: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error translating text: {str(e)}")
+
+@timed("translation")
+async def translate_pdf(file_id: str, target_languages: List[str], completed_pages=None, checkpoint=None, stream=False,
+                        document=None):
+    """Translate PDF content to one or more target languages.
+    
+    The pages are extracted once and the requests of every language share
+    one concurrency-limited run. Pages in ``completed_pages``, the
+    checkpoint of a resumed job, are reused as they are and read back one
+    window at a time, and ``checkpoint`` is called with every newly
+    translated page before its progress is reported.
+    With ``stream`` the generated text is sent over the WebSocket and
+    appended to the markdown exports as it arrives. A ``document`` that was
+    stored without being extracted, like the files of a batch, is extracted
+    and registered first.
+    
+    The document is translated ``PIPELINE_WINDOW_PAGES`` pages at a time:
+    only one window of pages and their translations is held in memory, so
+    memory use does not grow with the length of the document. The PDF
+    exports are rendered along, at most one window of pages behind.
+    Boilerplate is deduplicated within a window, repeats in later windows are
+    served by the translation cache.
+    """
+    versions = {}
+    # Model requests of this document take their turn with the other documents being translated
+    current_flow.set(file_id)
     try:
         # Get the file path
         file_path = os.path.join(UPLOAD_DIR, f"{file_id}.pdf")
         if not os.path.exists(file_path):
             raise HTTPException(status_code=404, detail="File not found")
         
-        # Extract text from PDF
-        pdf_text = extract_text_from_pdf(file_path)
+        # Use the pages extracted on upload, only older files are extracted again
+        stored = document_store.get(file_id)
+        if stored is not None:
+            total_pages = stored["total_pages"]
+        elif document is not None:
+            total_pages = await extract_document(
+                file_id, file_path, document["sha256"], document["filename"], document["size"]
+            )
+        else:
+            sha256 = await asyncio.to_thread(file_sha256, file_path)
+            total_pages = await extract_document(
+                file_id, file_path, sha256, os.path.basename(file_path), os.path.getsize(file_path)
+            )
         
         # Check if API key is set
         api_key = os.getenv("OPENAI_API_KEY")
@@ -424,110 +710,248 @@ async def translate_pdf(file_id: str, target_language: str):
             masked_key = api_key[:5] + "..." if len(api_key) > 5 else "invalid_key"
             logger.info(f"API key starts with: {masked_key}")
         
-        # Translate each page
-        translated_pages = []
-        total_pages = len(pdf_text)
-        logger.info(f"Found {total_pages} pages to translate")
+        # Translate the pages concurrently, skipping the ones a previous run finished
+        tracker = ProgressTracker(total_pages * len(target_languages))
+        trackers = {language: ProgressTracker(total_pages) for language in target_languages}
+        reused_pages = {language: 0 for language in target_languages}
+        deduplication = {language: [] for language in target_languages}
+        revision = document_store.get_revision(file_id)
+        for language in target_languages:
+            logger.info(
+                f"Found {total_pages} pages to translate to {language}, "
+                f"{completed_pages.count(language) if completed_pages else 0} already translated"
+            )
+            versions[language] = await asyncio.to_thread(translation_store.start, file_id, language, total_pages)
         
-        # Create a markdown export file
-        export_filename = f"{file_id}_{target_language.lower()}.md"
-        export_path = os.path.join("exports", export_filename)
+        def language_progress():
+            return {
+                language: {
+                    "progress": trackers[language].progress,
+                    "completed_pages": trackers[language].completed_pages,
+                    "total_pages": total_pages
+                }
+                for language in target_languages
+            }
         
-        with open(export_path, "w", encoding="utf-8") as export_file:
-            # Write each page directly without headers
-            for i, page in enumerate(pdf_text):
-                page_number = i + 1
-                logger.info(f"Translating page {page_number} to {target_language}")
-                
+        with ExitStack() as exports:
+            # Pages finish out of order, the writers keep every export in page order
+            writers = {}
+            for language in target_languages:
+                export_path = os.path.join("exports", f"{file_id}_{language.lower()}.md")
+                export_file = exports.enter_context(open(export_path, "w", encoding="utf-8"))
+                writers[language] = StreamingPageWriter(export_file) if stream else OrderedPageWriter(export_file)
+            
+            async def page_done(language, page_number, content):
+                tracker.page_done()
+                trackers[language].page_done()
+                # SQLite writes run off the event loop, the other documents' requests keep going meanwhile
+                await asyncio.to_thread(translation_store.put_page, file_id, language, page_number, content)
+                # Render the PDF export page by page so it is ready when the job is, waits while a window is rendering
+                await pdf_renderer.add_page(file_id, language, versions[language], page_number, content)
+            
+            async def on_page_started(language, page_number):
                 # Send progress update via WebSocket
-                if file_id in active_connections:
-                    progress_percentage = (i / total_pages) * 100
-                    await active_connections[file_id].send_json({
-                        "status": "translating",
-                        "message": f"Translating page {page_number} of {total_pages}",
-                        "progress": progress_percentage,
-                        "page": page_number,
-                        "total_pages": total_pages
-                    })
-                
-                # Translate the page content
-                translated_content = translate_text(page["content"], target_language)
-                
-                # Add to translated pages
-                translated_pages.append({
-                    "page_number": page_number,
-                    "content": translated_content
+                notify(file_id, {
+                    "status": "translating",
+                    "message": f"Translating page {page_number} of {total_pages} to {language}",
+                    "progress": tracker.progress,
+                    "language": language,
+                    "page": page_number,
+                    "total_pages": total_pages
                 })
-                
-                # Write to markdown file - just the page content
-                export_file.write(f"## Page {page_number}\n\n")
-                export_file.write(f"{translated_content}\n\n")
+            
+            async def on_page_done(language, result):
+                await page_done(language, result["page_number"], result["content"])
+                if checkpoint is not None:
+                    checkpoint(
+                        dict(result, language=language),
+                        tracker.completed_pages,
+                        tracker.total_pages,
+                        languages=language_progress()
+                    )
+                with STAGE_SECONDS.time(stage="markdown_write"):
+                    writers[language].add(result["page_number"], result["content"])
                 
                 # Send page completion update via WebSocket
-                if file_id in active_connections:
-                    progress_percentage = ((i + 1) / total_pages) * 100
-                    await active_connections[file_id].send_json({
-                        "status": "page_completed",
-                        "message": f"Completed page {page_number} of {total_pages}",
-                        "progress": progress_percentage,
-                        "page": page_number,
-                        "total_pages": total_pages
-                    })
-        
-        # Generate PDF from markdown - we'll skip this step and let the download endpoint handle it
-        # This way we avoid potential Unicode issues during translation
+                message = {
+                    "status": "page_completed",
+                    "message": f"Completed page {result['page_number']} of {total_pages} in {language}",
+                    "progress": tracker.progress,
+                    "language": language,
+                    "language_progress": trackers[language].progress,
+                    "page": result["page_number"],
+                    "completed_pages": trackers[language].completed_pages,
+                    "total_pages": total_pages
+                }
+                if stream:
+                    # The final text replaces whatever the client assembled from the deltas
+                    message["content"] = result["content"]
+                notify(file_id, message)
+            
+            def on_page_delta(language, page_number, text):
+                writers[language].add_delta(page_number, text)
+                notify(file_id, {
+                    "status": "delta",
+                    "language": language,
+                    "page": page_number,
+                    "text": text
+                })
+            
+            for page_from in range(1, total_pages + 1, PIPELINE_WINDOW_PAGES):
+                page_to = min(total_pages, page_from + PIPELINE_WINDOW_PAGES - 1)
+                pages = await asyncio.to_thread(document_store.get_pages, file_id, page_from, page_to)
+                remaining_pages = {}
+                for language in target_languages:
+                    done = {}
+                    if completed_pages:
+                        # Only this window's checkpointed pages are read back from disk
+                        done = await asyncio.to_thread(completed_pages.load, language, page_from, page_to)
+                    # Pages unchanged since the previous revision take over its translation
+                    if revision is not None:
+                        reused = await asyncio.to_thread(revision_translations, revision, language, page_from, page_to)
+                        for page_number, content in reused.items():
+                            if page_number not in done:
+                                done[page_number] = content
+                                reused_pages[language] += 1
+                    for page_number in sorted(done):
+                        await page_done(language, page_number, done[page_number])
+                        writers[language].add(page_number, done[page_number])
+                    remaining = [page for page in pages if page["page_number"] not in done]
+                    if remaining:
+                        remaining_pages[language] = remaining
+                
+                # Repeated headers, footers and boilerplate are translated only once per language
+                translations = await translate_languages(
+                    remaining_pages,
+                    lambda language, texts, on_delta: translate_texts(texts, language, on_delta),
+                    on_page_started=on_page_started,
+                    on_page_done=on_page_done,
+                    on_page_delta=on_page_delta if stream else None
+                )
+                for language, translation in translations.items():
+                    deduplication[language].append(translation["deduplication"])
+        
+        results = {}
+        for language in target_languages:
+            if revision is not None:
+                logger.info(f"Reused {reused_pages[language]} pages of the previous revision in {language}")
+            
+            # Every page is stored, GET /api/translate can serve the translation now
+            await asyncio.to_thread(translation_store.complete, file_id, language)
+            
+            # Merge the rendered pages, a failure here is retried by the download endpoint
+            try:
+                await pdf_renderer.finish(file_id, language, versions[language])
+            except Exception as e:
+                logger.error(f"Error rendering PDF export: {str(e)}")
+            
+            results[language] = {
+                "total_pages": total_pages,
+                "export_url": f"/api/download/{file_id}?format=md&target_language={language.lower()}",
+                "deduplication": combine_stats(deduplication[language]),
+                "reused_pages": reused_pages[language]
+            }
         
         # Send completion update via WebSocket
-        export_url = f"/api/download/{file_id}?format=md&target_language={target_language.lower()}"
-        if file_id in active_connections:
-            await active_connections[file_id].send_json({
-                "status": "completed",
-                "message": "Translation completed",
-                "progress": 100,
-                "export_url": export_url
-            })
+        first = results[target_languages[0]]
+        notify(file_id, {
+            "status": "completed",
+            "message": "Translation completed",
+            "progress": 100,
+            "export_url": first["export_url"],
+            "exports": {language: result["export_url"] for language, result in results.items()},
+            "deduplication": first["deduplication"]
+        })
         
         return {
             "file_id": file_id,
-            "target_language": target_language,
-            "pages": translated_pages,
-            "export_url": export_url
+            "target_languages": target_languages,
+            "languages": results
         }
     except Exception as e:
         logger.error(f"Error translating PDF: {str(e)}")
+        for language, version in versions.items():
+            pdf_renderer.discard(file_id, language, version)
         
         # Send error update via WebSocket
-        if file_id in active_connections:
-            await active_connections[file_id].send_json({
-                "status": "error",
-                "message": f"Translation error: {str(e)}",
-            })
+        notify(file_id, {
+            "status": "error",
+            "message": f"Translation error: {str(e)}",
+        })
         
         raise HTTPException(status_code=500, detail=f"Translation error: {str(e)}")
 
+async def run_translation_job(job, completed_pages, checkpoint):
+    """Job runner: translate a document and return a summary to store with the job"""
+    result = await translate_pdf(
+        job["file_id"], job_languages(job), completed_pages, checkpoint, stream=job.get("stream", False),
+        document=job.get("document")
+    )
+    languages = {
+        language: {
+            "total_pages": translation["total_pages"],
+            "export_url": translation["export_url"],
+            "deduplication": translation["deduplication"],
+            "reused_pages": translation["reused_pages"]
+        }
+        for language, translation in result["languages"].items()
+    }
+    first = languages[job_languages(job)[0]]
+    return dict(first, languages=languages)
+
+def job_languages(job):
+    """Target languages of a job, jobs from before multi-language jobs have only one"""
+    return job.get("target_languages") or [job["target_language"]]
+
+job_manager = JobManager(run_translation_job, state=state)
+
+def iter_translated_pages(file_id, target_language):
+    """Yield the stored pages of a translation in page order, loading one window at a time"""
+    translation = translation_store.get(file_id, target_language)
+    if translation is None:
+        return
+    for page_from in range(1, translation["total_pages"] + 1, PIPELINE_WINDOW_PAGES):
+        yield from translation_store.get_pages(file_id, target_language, page_from, page_from + PIPELINE_WINDOW_PAGES - 1)
+
+@timed("markdown_export")
+def write_markdown_export(file_id, target_language):
+    """Render the markdown export of a stored translation, returns False if there is none"""
+    pages = iter_translated_pages(file_id, target_language)
+    first = next(pages, None)
+    if first is None:
+        return False
+    export_path = os.path.join(EXPORT_DIR, f"{file_id}_{target_language.lower()}.md")
+    tmp_path = export_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as export_file:
+        writer = OrderedPageWriter(export_file, first_page=first["page_number"])
+        writer.add(first["page_number"], first["content"])
+        for page in pages:
+            writer.add(page["page_number"], page["content"])
+    os.replace(tmp_path, export_path)
+    return True
+
 @router.get("/download/{file_id}")
 async def download_translated_file(file_id: str, format: str = Query("pdf", enum=["md", "pdf"]), target_language: str = None):
     """Download the translated file in markdown or PDF format."""
     try:
+        document_store.touch(file_id)
+        
         # Check if target language is provided
         if not target_language:
-            # Try to find the file by listing the exports directory
-            files = os.listdir("exports")
-            matching_files = [f for f in files if f.startswith(f"{file_id}_")]
-            
-            if not matching_files:
+            # Use the most recently finished translation of the file
+            languages = translation_store.languages(file_id)
+            if not languages:
                 raise HTTPException(status_code=404, detail="Translated file not found")
-            
-            # Use the first matching file
-            md_filename = matching_files[0]
-        else:
-            # Use the provided target language
-            md_filename = f"{file_id}_{target_language.lower()}.md"
+            target_language = languages[0]
         
+        md_filename = f"{file_id}_{target_language.lower()}.md"
         md_path = os.path.join("exports", md_filename)
         
+        # The markdown export is derived from the translation store and rebuilt when it is missing,
+        # outside the event loop since it reads and writes the whole document
         if not os.path.exists(md_path):
-            raise HTTPException(status_code=404, detail=f"Translated file not found: {md_path}")
+            if not await asyncio.to_thread(write_markdown_export, file_id, target_language):
+                raise HTTPException(status_code=404, detail=f"Translated file not found: {md_path}")
         
         # If markdown format is requested, return the markdown file
         if format == "md":
@@ -537,110 +961,43 @@ async def download_translated_file(file_id: str, format: str = Query("pdf", enum
                 media_type="text/markdown"
             )
         
-        # If PDF format is requested, convert markdown to PDF
-        pdf_filename = md_filename.replace(".md", ".pdf")
-        pdf_path = os.path.join("exports", pdf_filename)
-        
-        # Convert markdown to PDF if it doesn't exist yet
-        if not os.path.exists(pdf_path):
-            # Read markdown content
-            with open(md_path, "r", encoding="utf-8") as md_file:
-                md_content = md_file.read()
-            
-            try:
-                # Split the content by page markers
-                pages = []
-                current_page = []
-                
-                # Parse the markdown content
-                lines = md_content.split('\n')
-                
-                for line in lines:
-                    # When we find a page marker, start a new page
-                    if line.startswith('## Page '):
-                        if current_page:  # If we have content for the current page
-                            pages.append(current_page)
-                            current_page = []
-                        current_page = [line]  # Start with the page header
-                    else:
-                        current_page.append(line)
-                
-                # Add the last page if it has content
-                if current_page:
-                    pages.append(current_page)
-                
-                # Create a PDF document with one page per translated page
-                from reportlab.lib.pagesizes import letter
-                from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, PageBreak
-                from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-                from reportlab.lib.enums import TA_CENTER
-                
-                # Create the PDF document
-                doc = SimpleDocTemplate(
-                    pdf_path,
-                    pagesize=letter,
-                    rightMargin=72,
-                    leftMargin=72,
-                    topMargin=72,
-                    bottomMargin=72
-                )
-                
-                # Create styles
-                styles = getSampleStyleSheet()
-                heading_style = ParagraphStyle(
-                    'Heading',
-                    parent=styles['Heading1'],
-                    fontSize=16
-                )
-                normal_style = styles['Normal']
-                
-                # Build content for each page
-                all_content = []
-                
-                for page_content in pages:
-                    page_elements = []
-                    
-                    for i, line in enumerate(page_content):
-                        # Skip empty lines
-                        if not line.strip():
-                            page_elements.append(Spacer(1, 6))
-                            continue
-                        
-                        # Handle page header
-                        if line.startswith('## Page '):
-                            page_elements.append(Paragraph(line[3:], heading_style))
-                            page_elements.append(Spacer(1, 10))
-                        # Regular text
-                        else:
-                            page_elements.append(Paragraph(line, normal_style))
-                    
-                    # Add a page break after each page except the last one
-                    all_content.extend(page_elements)
-                    if page_content != pages[-1]:
-                        all_content.append(PageBreak())
-                
-                # Build the PDF
-                doc.build(all_content)
-                
-            except Exception as e:
-                logger.error(f"Error generating PDF: {str(e)}")
-                # If PDF generation fails, return the markdown file instead
-                return FileResponse(
-                    path=md_path,
-                    filename=md_filename.replace(".md", ".txt"),
-                    media_type="text/plain"
-                )
+        # The PDF export belongs to one translation version and is rendered outside the event loop
+        translation = translation_store.get(file_id, target_language)
+        if translation is None or translation["status"] != "completed":
+            raise HTTPException(status_code=409, detail="Translation in progress")
+        try:
+            pdf_path = await pdf_renderer.render(
+                file_id,
+                target_language,
+                translation["version"],
+                lambda: iter_translated_pages(file_id, target_language)
+            )
+        except Exception as e:
+            logger.error(f"Error generating PDF: {str(e)}")
+            # If PDF generation fails, return the markdown file instead
+            return FileResponse(
+                path=md_path,
+                filename=md_filename.replace(".md", ".txt"),
+                media_type="text/plain"
+            )
         
         # Return the PDF file
         return FileResponse(
             path=pdf_path,
-            filename=pdf_filename,
+            filename=md_filename.replace(".md", ".pdf"),
             media_type="application/pdf"
         )
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error downloading translated file: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error downloading file: {str(e)}")
 
+@router.get("/storage")
+async def get_storage():
+    """Get disk usage and eviction statistics of stored documents"""
+    return storage_manager.stats()
+
 @router.get("/languages")
 async def get_supported_languages():
     """Get a list of languages supported by OpenAI for translation"""
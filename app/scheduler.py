@@ -0,0 +1,389 @@
+import os
+import time
+import random
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from email.utils import parsedate_to_datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+# Account limits of the model API, 0 disables the limit
+OPENAI_RPM_LIMIT = int(os.getenv("OPENAI_RPM_LIMIT", "0"))
+OPENAI_TPM_LIMIT = int(os.getenv("OPENAI_TPM_LIMIT", "0"))
+# Attempts per request before a retryable error is given up on
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "6"))
+# Backoff before the first retry, doubled for every further attempt
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", "1"))
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", "60"))
+# Upper bound of model requests in flight in this process, concurrency adapts below it
+TRANSLATION_MAX_IN_FLIGHT = int(os.getenv("TRANSLATION_MAX_IN_FLIGHT", "16"))
+# Send a duplicate of a request still unanswered after this percentile of the recent latencies of requests
+# of its size, the first answer wins
+HEDGE_REQUESTS = os.getenv("HEDGE_REQUESTS", "0").lower() in ("1", "true", "yes")
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "95"))
+# Most duplicates as a share of all requests sent, caps the extra spend
+HEDGE_MAX_RATIO = float(os.getenv("HEDGE_MAX_RATIO", "0.05"))
+# Latencies of the most recent requests per size the percentile is taken from, no hedging before there are enough
+HEDGE_WINDOW = 200
+HEDGE_MIN_SAMPLES = 20
+
+RETRYABLE_STATUS_CODES = (408, 429, 500, 502, 503, 504)
+
+# Flow the model requests of the current task belong to, set per document so documents share the API fairly
+current_flow: ContextVar[Optional[Hashable]] = ContextVar("current_flow", default=None)
+
+
+def size_bucket(tokens: int) -> int:
+    """Size group of a request of ``tokens`` estimated tokens, the next power of two"""
+    return 1 << max(0, int(tokens) - 1).bit_length()
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait from a Retry-After header, given either as seconds or as an HTTP date"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """Refill ``rate_per_minute`` units per minute up to one minute's worth of burst"""
+
+    def __init__(self, rate_per_minute: int):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(rate_per_minute)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount: float = 1):
+        """Wait until ``amount`` units are available and take them"""
+        if self.rate <= 0:
+            return
+        # A single request larger than the bucket would otherwise wait forever
+        amount = min(amount, self.capacity)
+        # Waiters are served one at a time so a large request is not starved by small ones
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+    def try_acquire(self, amount: float = 1) -> bool:
+        """Take ``amount`` units if they are available right now, ahead of any waiter"""
+        if self.rate <= 0:
+            return True
+        amount = min(amount, self.capacity)
+        self._refill()
+        if self.tokens < amount:
+            return False
+        self.tokens -= amount
+        return True
+
+    def drain(self):
+        """Empty the bucket after the API reported that the limit was hit anyway"""
+        self._refill()
+        self.tokens = 0
+
+
+class FairLimiter:
+    """Concurrency limit that hands free slots to the waiting flows in turn.
+
+    Waiters are queued per flow, e.g. per document, and every free slot goes
+    to the next flow in round-robin order. A flow with hundreds of queued
+    waiters therefore gets no more slots than one with a single waiter, and
+    within a flow waiters are served first come, first served.
+    """
+
+    def __init__(self, limit: float):
+        self.limit = limit
+        self.in_flight = 0
+        self._queues: "OrderedDict[Hashable, Deque[asyncio.Future]]" = OrderedDict()
+
+    @property
+    def waiting(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    @property
+    def flows(self) -> int:
+        return len(self._queues)
+
+    def _has_free_slot(self) -> bool:
+        return self.in_flight < max(1, int(self.limit))
+
+    async def acquire(self, flow: Hashable = None):
+        if not self._queues and self._has_free_slot():
+            self.in_flight += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(flow, deque()).append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was granted just before the waiter was cancelled, pass it on
+                self.release()
+            else:
+                self._discard(flow, future)
+            raise
+
+    def take(self):
+        """Take a slot right away, ahead of the waiters and past the limit if need be"""
+        self.in_flight += 1
+
+    def release(self):
+        self.in_flight -= 1
+        self._grant()
+
+    def _discard(self, flow: Hashable, future: asyncio.Future):
+        queue = self._queues.get(flow)
+        if queue is not None and future in queue:
+            queue.remove(future)
+            if not queue:
+                del self._queues[flow]
+
+    def _grant(self):
+        while self._queues and self._has_free_slot():
+            # The flow served now moves to the back of the rotation
+            flow, queue = self._queues.popitem(last=False)
+            future = queue.popleft()
+            if queue:
+                self._queues[flow] = queue
+            if not future.done():
+                future.set_result(None)
+                self.in_flight += 1
+
+    @asynccontextmanager
+    async def slot(self, flow: Hashable = None) -> AsyncIterator[None]:
+        await self.acquire(flow)
+        try:
+            yield
+        finally:
+            self.release()
+
+
+class AdaptiveLimiter(FairLimiter):
+    """AIMD concurrency limit: grows by one per window of successes, halves on throttling"""
+
+    def __init__(self, max_limit: int, min_limit: int = 1, initial: Optional[int] = None):
+        self.max_limit = max(1, max_limit)
+        self.min_limit = max(1, min(min_limit, self.max_limit))
+        super().__init__(float(initial or self.max_limit))
+        self._last_decrease = 0.0
+
+    def on_success(self):
+        # Additive increase: about one more slot once a full window of requests succeeded
+        self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+        self._grant()
+
+    def on_throttled(self):
+        # Multiplicative decrease, at most once per second so one burst of 429s halves the limit once
+        now = time.monotonic()
+        if now - self._last_decrease < 1.0:
+            return
+        self._last_decrease = now
+        self.limit = max(self.min_limit, self.limit / 2)
+        logger.warning(f"Model API is throttling, concurrency limit lowered to {int(self.limit)}")
+
+
+class RequestScheduler:
+    """Send model requests within the account's rate limits and retry transient failures.
+
+    Every attempt first takes one request from the RPM bucket and its
+    estimated tokens from the TPM bucket, then a slot of the adaptive
+    concurrency limit. Slots are shared out round-robin between the flows in
+    ``current_flow``, so a long document cannot starve the short ones.
+    Retryable errors are retried with exponential backoff
+    and full jitter, or after the server's Retry-After when it sent one.
+
+    With ``hedge`` enabled, an attempt that may be hedged and is still
+    unanswered after the ``hedge_percentile`` of the recent latencies of
+    requests of its size is sent a second time and the first answer wins,
+    the other one is cancelled. Latencies are kept per power of two of the
+    estimated tokens, so long requests are not hedged just for being long.
+    The duplicate skips the fair queue and may go past the concurrency
+    limit, but it never waits for the rate limits and is not sent when they
+    have no capacity left right away. At most ``hedge_max_ratio`` of all
+    requests sent are duplicates, which bounds the overshoot.
+    """
+
+    def __init__(self, rpm: int = OPENAI_RPM_LIMIT, tpm: int = OPENAI_TPM_LIMIT,
+                 max_in_flight: int = TRANSLATION_MAX_IN_FLIGHT, max_retries: int = OPENAI_MAX_RETRIES,
+                 base_delay: float = RETRY_BASE_DELAY, max_delay: float = RETRY_MAX_DELAY,
+                 hedge: bool = HEDGE_REQUESTS, hedge_percentile: float = HEDGE_PERCENTILE,
+                 hedge_max_ratio: float = HEDGE_MAX_RATIO):
+        self.requests_bucket = TokenBucket(rpm)
+        self.tokens_bucket = TokenBucket(tpm)
+        self.limiter = AdaptiveLimiter(max_in_flight)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_max_ratio = hedge_max_ratio
+        self.latencies: Dict[int, Deque[float]] = {}
+        self.waiting = 0
+        self.requests = 0
+        self.retries = 0
+        self.throttled = 0
+        self.failures = 0
+        self.hedges = 0
+        self.hedges_won = 0
+
+    def _backoff(self, attempt: int, retry_after: Optional[float]) -> float:
+        if retry_after is not None:
+            # Jitter on top of Retry-After keeps the retries of parallel requests apart
+            return min(self.max_delay, retry_after) + random.uniform(0, self.base_delay / 2)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def _observe(self, tokens: int, latency: float):
+        self.latencies.setdefault(size_bucket(tokens), deque(maxlen=HEDGE_WINDOW)).append(latency)
+
+    def hedge_delay(self, tokens: int) -> Optional[float]:
+        """Seconds after which an unanswered request of ``tokens`` is sent again, None while it is not hedged"""
+        latencies = self.latencies.get(size_bucket(tokens))
+        if not self.hedge or latencies is None or len(latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        latencies = sorted(latencies)
+        return latencies[min(len(latencies) - 1, int(len(latencies) * self.hedge_percentile / 100))]
+
+    def hedge_delays(self) -> Dict[int, float]:
+        """Current hedge delay per size group, keyed by the group's most estimated tokens"""
+        delays = {bucket: self.hedge_delay(bucket) for bucket in sorted(self.latencies)}
+        return {bucket: delay for bucket, delay in delays.items() if delay is not None}
+
+    def _take_hedge_slot(self, tokens: int) -> bool:
+        if self.hedges + 1 > self.hedge_max_ratio * self.requests:
+            return False
+        # Rate limits are the account's, a duplicate never waits for them nor goes past them
+        if not self.tokens_bucket.try_acquire(tokens) or not self.requests_bucket.try_acquire(1):
+            return False
+        # Waiting in the fair queue would make the duplicate as late as the original, the ratio bounds the overshoot
+        self.limiter.take()
+        return True
+
+    async def _send(self, call: Callable[[], Awaitable[Any]], tokens: int, hedge: bool) -> Any:
+        started = time.monotonic()
+        primary = asyncio.ensure_future(call())
+        try:
+            delay = self.hedge_delay(tokens) if hedge else None
+            if delay is not None:
+                await asyncio.wait({primary}, timeout=delay)
+                if not primary.done() and self._take_hedge_slot(tokens):
+                    return await self._race(primary, call, tokens, started)
+            result = await primary
+            self._observe(tokens, time.monotonic() - started)
+            return result
+        finally:
+            primary.cancel()
+
+    async def _race(self, primary: asyncio.Future, call: Callable[[], Awaitable[Any]], tokens: int,
+                    started: float) -> Any:
+        # The duplicate holds its own concurrency slot, taken by _take_hedge_slot
+        self.requests += 1
+        self.hedges += 1
+        hedge_started = time.monotonic()
+        hedge = asyncio.ensure_future(call())
+        try:
+            pending = {primary, hedge}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                succeeded = [task for task in done if task.exception() is None]
+                if succeeded:
+                    winner = primary if primary in succeeded else hedge
+                    if winner is hedge:
+                        self.hedges_won += 1
+                    self._observe(tokens, time.monotonic() - (hedge_started if winner is hedge else started))
+                    return winner.result()
+            # Both failed, the error of the original request decides about retrying
+            raise primary.exception()
+        finally:
+            hedge.cancel()
+            self.limiter.release()
+
+    async def run(self, call: Callable[[], Awaitable[Any]], tokens: int = 0, hedge: bool = False) -> Any:
+        """Run ``call`` under the rate limits, retrying it while the error allows
+
+        ``hedge`` allows sending ``call`` a second time while it is slow, only
+        for calls whose side effects do not matter if they happen twice.
+        Streamed calls pass on their output while it arrives and must not be
+        hedged, two streams of the same answer would interleave.
+        """
+        attempt = 0
+        while True:
+            # Requests waiting here are the queue in front of the model API
+            self.waiting += 1
+            try:
+                await self.requests_bucket.acquire(1)
+                await self.tokens_bucket.acquire(tokens)
+                await self.limiter.acquire(current_flow.get())
+            finally:
+                self.waiting -= 1
+            try:
+                self.requests += 1
+                result = await self._send(call, tokens, hedge)
+            except Exception as e:
+                status_code = getattr(e, "status_code", None)
+                # A 429 for an exhausted quota is not throttling, it fails right away below
+                if status_code == 429 and getattr(e, "retryable", False):
+                    self.throttled += 1
+                    self.limiter.on_throttled()
+                    self.requests_bucket.drain()
+                    self.tokens_bucket.drain()
+                if not getattr(e, "retryable", False) or attempt + 1 >= self.max_retries:
+                    self.failures += 1
+                    raise
+                delay = self._backoff(attempt, getattr(e, "retry_after", None))
+                logger.warning(f"Model request failed ({str(e)[:120]}), retrying in {delay:.1f}s")
+            else:
+                self.limiter.on_success()
+                return result
+            finally:
+                self.limiter.release()
+            # Wait outside the concurrency slot so healthy requests keep flowing
+            attempt += 1
+            self.retries += 1
+            await asyncio.sleep(delay)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "concurrency_limit": int(self.limiter.limit),
+            "in_flight": self.limiter.in_flight,
+            "waiting": self.waiting,
+            "flows": self.limiter.flows,
+            "requests": self.requests,
+            "retries": self.retries,
+            "throttled": self.throttled,
+            "failures": self.failures,
+            "hedge_delays": self.hedge_delays(),
+            "hedges": self.hedges,
+            "hedges_won": self.hedges_won,
+        }
+
+
+_scheduler: Optional[RequestScheduler] = None
+
+
+def get_request_scheduler() -> RequestScheduler:
+    """Return the request scheduler shared by the whole process"""
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = RequestScheduler()
+    return _scheduler
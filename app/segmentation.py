@@ -0,0 +1,96 @@
+import os
+import re
+from typing import Any, Dict, List
+
+# A line must appear on at least this many pages to be treated as boilerplate
+BOILERPLATE_MIN_PAGES = int(os.getenv("BOILERPLATE_MIN_PAGES", "2"))
+# Shorter lines are never split out on their own (page numbers, bullets, stray characters)
+BOILERPLATE_MIN_CHARS = int(os.getenv("BOILERPLATE_MIN_CHARS", "8"))
+
+
+def _line_key(line: str) -> str:
+    return re.sub(r"\s+", " ", line).strip()
+
+
+def _is_boilerplate_candidate(key: str) -> bool:
+    return len(key) >= BOILERPLATE_MIN_CHARS and not key.isdigit()
+
+
+def segment_pages(pages: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Split pages into segments so repeated boilerplate is translated only once.
+
+    Lines that appear on at least ``BOILERPLATE_MIN_PAGES`` pages (running
+    headers, footers, disclaimers, captions) are cut out as their own
+    segments, and the text between them forms the body segments. Every page
+    becomes a list of indexes into ``segments``, which holds each distinct
+    segment exactly once.
+    """
+    pages_by_line: Dict[str, set] = {}
+    for page in pages:
+        for line in page["content"].split("\n"):
+            key = _line_key(line)
+            if _is_boilerplate_candidate(key):
+                pages_by_line.setdefault(key, set()).add(page["page_number"])
+
+    repeated = {key for key, page_numbers in pages_by_line.items() if len(page_numbers) >= BOILERPLATE_MIN_PAGES}
+
+    segments: List[str] = []
+    segment_index: Dict[str, int] = {}
+    page_segments: Dict[int, List[int]] = {}
+    total_chars = 0
+
+    def add_segment(lines, page_number):
+        nonlocal total_chars
+        text = "\n".join(lines)
+        total_chars += len(text)
+        if text not in segment_index:
+            segment_index[text] = len(segments)
+            segments.append(text)
+        page_segments[page_number].append(segment_index[text])
+
+    for page in pages:
+        page_number = page["page_number"]
+        page_segments[page_number] = []
+        run: List[str] = []
+        run_is_repeated = None
+        for line in page["content"].split("\n"):
+            line_is_repeated = _line_key(line) in repeated
+            if run and line_is_repeated != run_is_repeated:
+                add_segment(run, page_number)
+                run = []
+            run.append(line)
+            run_is_repeated = line_is_repeated
+        if run:
+            add_segment(run, page_number)
+
+    unique_chars = sum(len(segment) for segment in segments)
+    return {
+        "segments": segments,
+        "page_segments": page_segments,
+        "stats": {
+            "total_segments": sum(len(indexes) for indexes in page_segments.values()),
+            "unique_segments": len(segments),
+            "total_chars": total_chars,
+            "unique_chars": unique_chars,
+            "deduplicated_chars": total_chars - unique_chars,
+            "deduplicated_ratio": ((total_chars - unique_chars) / total_chars) if total_chars else 0.0,
+        },
+    }
+
+
+def assemble_page(segment_indexes: List[int], translated_segments: Dict[int, str]) -> str:
+    """Rebuild a page from the translations of its segments"""
+    return "\n".join(translated_segments[index] for index in segment_indexes)
+
+
+def combine_stats(stats: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Add up the statistics of a document segmented in several windows of pages.
+
+    A segment repeated in different windows counts as unique in each of
+    them; its repeats are served by the translation cache instead.
+    """
+    keys = ("total_segments", "unique_segments", "total_chars", "unique_chars", "deduplicated_chars")
+    combined = {key: sum(window[key] for window in stats) for key in keys}
+    total_chars = combined["total_chars"]
+    combined["deduplicated_ratio"] = (combined["deduplicated_chars"] / total_chars) if total_chars else 0.0
+    return combined
@@ -0,0 +1,128 @@
+import os
+import time
+import asyncio
+import logging
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Warm up the worker pools and the HTTP client once the server accepts requests, 0 to skip
+STARTUP_WARMUP = os.getenv("STARTUP_WARMUP", "1") not in ("0", "false", "no")
+
+
+def _process_age() -> Optional[float]:
+    """Seconds since this process was started, from /proc where it is available"""
+    try:
+        with open("/proc/self/stat") as f:
+            # The command name may contain spaces, the fields after it do not
+            fields = f.read().rsplit(")", 1)[1].split()
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return uptime - int(fields[19]) / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class StartupProfile:
+    """Time the phases of a cold start, from process start to the first request.
+
+    Phases are timed with ``phase``; the imports of ``app.main`` are the
+    biggest ones. ``ready`` and ``first_request`` mark when the server could
+    take traffic and when it got some, both relative to the process start.
+    """
+
+    def __init__(self):
+        self.created = time.perf_counter()
+        age = _process_age()
+        # Time spent before the first module of the package was imported, e.g. the interpreter and uvicorn
+        self.before_import = age
+        self.origin = self.created - age if age is not None else self.created
+        self.phases: List[Dict[str, Any]] = []
+        self.warmup: List[Dict[str, Any]] = []
+        self.ready_at: Optional[float] = None
+        self.first_request_at: Optional[float] = None
+        self.dotenv_path: Optional[str] = None
+
+    @contextmanager
+    def phase(self, name: str, into: Optional[List[Dict[str, Any]]] = None) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            (self.phases if into is None else into).append(
+                {"name": name, "seconds": round(time.perf_counter() - started, 4)}
+            )
+
+    def ready(self):
+        self.ready_at = time.perf_counter()
+        phases = ", ".join(f"{phase['name']} {phase['seconds']:.2f}s" for phase in self.phases)
+        logger.info(f"Started in {self.ready_at - self.origin:.2f}s ({phases})")
+
+    def request_received(self):
+        if self.first_request_at is None:
+            self.first_request_at = time.perf_counter()
+
+    def report(self) -> Dict[str, Any]:
+        def since_start(moment):
+            return round(moment - self.origin, 4) if moment is not None else None
+
+        return {
+            "before_import_seconds": round(self.before_import, 4) if self.before_import is not None else None,
+            "phases": self.phases,
+            "ready_after_seconds": since_start(self.ready_at),
+            "first_request_after_seconds": since_start(self.first_request_at),
+            "warmup": self.warmup,
+        }
+
+
+startup_profile = StartupProfile()
+
+
+class FirstRequestMiddleware:
+    """ASGI middleware marking the first request in the startup profile, without wrapping responses"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] in ("http", "websocket"):
+            startup_profile.request_received()
+        await self.app(scope, receive, send)
+
+
+def load_environment():
+    """Load .env once, before any module reads its settings from the environment"""
+    from dotenv import load_dotenv, find_dotenv
+
+    with startup_profile.phase("load .env"):
+        dotenv_path = find_dotenv()
+        if dotenv_path:
+            load_dotenv(dotenv_path)
+    # Logged by app.main once logging is configured
+    startup_profile.dotenv_path = dotenv_path
+
+
+async def warm_up():
+    """Load what the first upload, translation and export would otherwise wait for"""
+    from app.extraction import warm_up_extraction
+    from app.rendering import warm_up_rendering
+    from app.translation_client import warm_up_client
+
+    # Runs once startup finished, give the server a moment to answer the request that woke it up first
+    await asyncio.sleep(0.1)
+    steps = [
+        ("extraction workers", warm_up_extraction()),
+        ("render workers", warm_up_rendering()),
+        ("http client", asyncio.to_thread(warm_up_client)),
+    ]
+
+    async def run(name, step):
+        with startup_profile.phase(name, into=startup_profile.warmup):
+            await step
+
+    results = await asyncio.gather(*[run(name, step) for name, step in steps], return_exceptions=True)
+    for (name, _), result in zip(steps, results):
+        if isinstance(result, Exception):
+            logger.warning(f"Warm-up of {name} failed: {str(result)}")
+    logger.info("Warm-up finished: " + ", ".join(f"{step['name']} {step['seconds']:.2f}s" for step in startup_profile.warmup))
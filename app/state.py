@@ -0,0 +1,321 @@
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import asyncio
+import logging
+import threading
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# "memory" for a single worker process, "sqlite" when several workers share one host
+STATE_BACKEND = os.getenv("STATE_BACKEND", "memory")
+STATE_DB_PATH = os.getenv("STATE_DB_PATH", os.path.join("data", "state.sqlite3"))
+# Seconds between two polls of the shared message log
+STATE_POLL_INTERVAL = float(os.getenv("STATE_POLL_INTERVAL", "0.05"))
+# Seconds a published message stays in the shared log
+MESSAGE_RETENTION = 60
+
+Callback = Callable[[Dict[str, Any]], Any]
+
+
+def _owner_alive(owner: str) -> bool:
+    """Whether the worker process a node id belongs to still runs, owners on other hosts are assumed to"""
+    host, pid, _ = owner.rsplit(":", 2)
+    if host != socket.gethostname():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except (OSError, ValueError):
+        pass
+    return True
+
+
+class StateBackend(ABC):
+    """State shared by every worker process of the app.
+
+    Offers pub/sub channels for progress messages, a small key-value store
+    for indexes like the active jobs and leases that let exactly one worker
+    own a job or a background task. ``publish`` and ``subscribe`` never block,
+    subscribers are called on the event loop of their own process.
+    """
+
+    def __init__(self):
+        # Identifies this worker process as the owner of leases and as the origin of messages
+        self.node_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._subscribers: Dict[str, List[Callback]] = {}
+
+    def subscribe(self, channel: str, callback: Callback) -> Callable[[], None]:
+        """Call ``callback`` with every message published on ``channel``, returns the unsubscribe function"""
+        self._subscribers.setdefault(channel, []).append(callback)
+
+        def unsubscribe():
+            callbacks = self._subscribers.get(channel, [])
+            if callback in callbacks:
+                callbacks.remove(callback)
+            if not callbacks:
+                self._subscribers.pop(channel, None)
+
+        return unsubscribe
+
+    def _deliver(self, channel: str, message: Dict[str, Any]):
+        for callback in list(self._subscribers.get(channel, ())):
+            try:
+                callback(message)
+            except Exception as e:
+                logger.error(f"Subscriber of {channel} failed: {str(e)}")
+
+    @abstractmethod
+    def publish(self, channel: str, message: Dict[str, Any]):
+        """Send a message to the subscribers of ``channel`` in every process"""
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[Any]:
+        """Return the value stored under ``key``, None if there is none"""
+
+    @abstractmethod
+    def set(self, key: str, value: Any):
+        """Store a JSON-serializable value under ``key``"""
+
+    @abstractmethod
+    def delete(self, key: str):
+        """Remove ``key`` if it is stored"""
+
+    @abstractmethod
+    def items(self, prefix: str = "") -> Dict[str, Any]:
+        """Return every entry whose key starts with ``prefix``"""
+
+    @abstractmethod
+    def acquire_lease(self, name: str, ttl: float) -> bool:
+        """Take or renew the lease ``name`` for this process, fails while another process holds it"""
+
+    @abstractmethod
+    def release_lease(self, name: str):
+        """Give up the lease ``name`` if this process holds it"""
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+
+class InProcessBackend(StateBackend):
+    """State kept in this process, for running a single worker"""
+
+    def __init__(self):
+        super().__init__()
+        self._entries: Dict[str, Any] = {}
+        self._leases: Dict[str, Tuple[str, float]] = {}
+
+    def publish(self, channel: str, message: Dict[str, Any]):
+        self._deliver(channel, message)
+
+    def get(self, key: str) -> Optional[Any]:
+        return self._entries.get(key)
+
+    def set(self, key: str, value: Any):
+        self._entries[key] = value
+
+    def delete(self, key: str):
+        self._entries.pop(key, None)
+
+    def items(self, prefix: str = "") -> Dict[str, Any]:
+        return {key: value for key, value in self._entries.items() if key.startswith(prefix)}
+
+    def acquire_lease(self, name: str, ttl: float) -> bool:
+        now = time.time()
+        owner, expires_at = self._leases.get(name, (None, 0.0))
+        if owner not in (None, self.node_id) and expires_at > now:
+            return False
+        self._leases[name] = (self.node_id, now + ttl)
+        return True
+
+    def release_lease(self, name: str):
+        if self._leases.get(name, (None, 0.0))[0] == self.node_id:
+            del self._leases[name]
+
+
+class SQLiteBackend(StateBackend):
+    """State shared through a SQLite database by the worker processes of one host.
+
+    Published messages are delivered to subscribers of this process right
+    away and appended to a message log that every process polls for the
+    channels it has subscribers on. Writes are batched per poll, and
+    consecutive text deltas of the same page are merged before they are
+    written, so a streamed translation does not turn into a row per token.
+    """
+
+    def __init__(self, path: str = STATE_DB_PATH, poll_interval: float = STATE_POLL_INTERVAL):
+        super().__init__()
+        self.path = path
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._outbox: List[Tuple[str, Dict[str, Any]]] = []
+        self._last_id = 0
+        self._task: Optional[asyncio.Task] = None
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                channel TEXT NOT NULL,
+                origin TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )"""
+        )
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            )"""
+        )
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS leases (
+                name TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )"""
+        )
+
+    def publish(self, channel: str, message: Dict[str, Any]):
+        self._deliver(channel, message)
+        if self._outbox and message.get("status") == "delta":
+            last_channel, last = self._outbox[-1]
+            if (last_channel == channel and last.get("status") == "delta"
+                    and last.get("page") == message.get("page") and last.get("language") == message.get("language")):
+                last["text"] += message["text"]
+                return
+        self._outbox.append((channel, dict(message)))
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM entries WHERE key = ?", (key,)).fetchone()
+        return json.loads(row["value"]) if row else None
+
+    def set(self, key: str, value: Any):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO entries VALUES (?, ?)", (key, json.dumps(value)))
+
+    def delete(self, key: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def items(self, prefix: str = "") -> Dict[str, Any]:
+        # Range scan on the primary key, U+FFFF sorts after every key with the prefix
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key, value FROM entries WHERE key >= ? AND key < ?", (prefix, prefix + "\uffff")
+            ).fetchall()
+        return {row["key"]: json.loads(row["value"]) for row in rows}
+
+    def acquire_lease(self, name: str, ttl: float) -> bool:
+        now = time.time()
+        with self._lock:
+            self._conn.execute("INSERT OR IGNORE INTO leases VALUES (?, ?, ?)", (name, self.node_id, now + ttl))
+            owner = self._conn.execute("SELECT owner FROM leases WHERE name = ?", (name,)).fetchone()["owner"]
+            # The lease of a worker that died on this host is taken over right away instead of once it expires
+            dead_owner = owner if owner != self.node_id and not _owner_alive(owner) else self.node_id
+            cursor = self._conn.execute(
+                "UPDATE leases SET owner = ?, expires_at = ? WHERE name = ? AND (owner IN (?, ?) OR expires_at < ?)",
+                (self.node_id, now + ttl, name, self.node_id, dead_owner, now),
+            )
+        return cursor.rowcount == 1
+
+    def release_lease(self, name: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM leases WHERE name = ? AND owner = ?", (name, self.node_id))
+
+    def _exchange(self, outbox: List[Tuple[str, Dict[str, Any]]], channels: List[str]) -> List[Tuple[str, Dict[str, Any]]]:
+        """Write the batched messages and read what other processes published, runs in a thread"""
+        now = time.time()
+        with self._lock:
+            if outbox:
+                self._conn.execute("BEGIN IMMEDIATE")
+                try:
+                    self._conn.executemany(
+                        "INSERT INTO messages (channel, origin, payload, created_at) VALUES (?, ?, ?, ?)",
+                        [(channel, self.node_id, json.dumps(message), now) for channel, message in outbox],
+                    )
+                    self._conn.execute("DELETE FROM messages WHERE created_at < ?", (now - MESSAGE_RETENTION,))
+                    self._conn.execute("COMMIT")
+                except Exception:
+                    self._conn.execute("ROLLBACK")
+                    raise
+            if not channels:
+                row = self._conn.execute("SELECT MAX(id) AS id FROM messages").fetchone()
+                self._last_id = max(self._last_id, row["id"] or 0)
+                return []
+            rows = self._conn.execute(
+                "SELECT id, channel, origin, payload FROM messages WHERE id > ? ORDER BY id", (self._last_id,)
+            ).fetchall()
+        received = []
+        for row in rows:
+            self._last_id = row["id"]
+            if row["origin"] != self.node_id and row["channel"] in channels:
+                received.append((row["channel"], json.loads(row["payload"])))
+        return received
+
+    async def _poll(self):
+        while True:
+            outbox, self._outbox = self._outbox, []
+            try:
+                received = await asyncio.to_thread(self._exchange, outbox, list(self._subscribers))
+            except Exception as e:
+                logger.error(f"Shared state poll failed: {str(e)}")
+                # Keep the batch for the next poll, newer messages stay behind it
+                self._outbox[:0] = outbox
+                received = []
+            for channel, message in received:
+                self._deliver(channel, message)
+            await asyncio.sleep(self.poll_interval)
+
+    async def start(self):
+        if self._task is None:
+            # Only messages published from now on are of interest to this process
+            with self._lock:
+                row = self._conn.execute("SELECT MAX(id) AS id FROM messages").fetchone()
+            self._last_id = row["id"] or 0
+            self._task = asyncio.create_task(self._poll())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        # Flush what was published during shutdown, e.g. the last progress of a cancelled job
+        if self._outbox:
+            outbox, self._outbox = self._outbox, []
+            try:
+                self._exchange(outbox, [])
+            except Exception as e:
+                logger.error(f"Could not flush shared state messages: {str(e)}")
+
+
+_backend: Optional[StateBackend] = None
+
+
+def get_state_backend() -> StateBackend:
+    """Return the state backend of this process, chosen by STATE_BACKEND"""
+    global _backend
+    if _backend is None:
+        if STATE_BACKEND == "sqlite":
+            _backend = SQLiteBackend()
+        elif STATE_BACKEND == "memory":
+            _backend = InProcessBackend()
+        else:
+            raise ValueError(f"Unknown STATE_BACKEND {STATE_BACKEND!r}, use 'memory' or 'sqlite'")
+        logger.info(f"Using {type(_backend).__name__} for shared state")
+    return _backend
@@ -16,6 +16,7 @@ document.addEventListener('DOMContentLoaded', function() {
     const progressPercentage = document.getElementById('progress-percentage');
     const progressBarFill = document.getElementById('progress-bar-fill');
     const progressDetails = document.getElementById('progress-details');
+    const streamPreview = document.getElementById('stream-preview');
     const translationComplete = document.getElementById('translation-complete');
     const downloadBtn = document.getElementById('download-btn');
     const downloadMdBtn = document.getElementById('download-md-btn');
@@ -34,6 +35,11 @@ document.addEventListener('DOMContentLoaded', function() {
     let languages = [];
     let websocket = null;
     let websocketReady = false;
+    let previewPage = null;
+    // Pages are fetched in windows when they are first viewed, keyed by page number
+    let originalPages = {};
+    let translatedPages = {};
+    const PAGE_WINDOW = 20;
 
     // Check API status
     checkApiStatus();
@@ -176,6 +182,9 @@ document.addEventListener('DOMContentLoaded', function() {
             const data = await response.json();
             fileId = data.file_id;
             pdfData = data;
+            originalPages = {};
+            translatedPages = {};
+            storePages(originalPages, data.pages);
 
             // Update UI
             uploadProgress.innerHTML = '<i class="fas fa-check-circle text-green-600 mr-2"></i><span>Upload complete</span>';
@@ -287,10 +296,30 @@ document.addEventListener('DOMContentLoaded', function() {
                         progressDetails.textContent = data.message;
                         break;
                         
+                    case 'delta':
+                        // Show the text of one page live as the model generates it
+                        if (previewPage === null) {
+                            previewPage = data.page;
+                            streamPreview.textContent = '';
+                            streamPreview.classList.remove('hidden');
+                        }
+                        if (data.page === previewPage) {
+                            streamPreview.textContent += data.text;
+                            streamPreview.scrollTop = streamPreview.scrollHeight;
+                        }
+                        break;
+                        
                     case 'page_completed':
                         updateProgressBar(data.progress);
                         progressStatus.textContent = 'Translating...';
                         progressDetails.textContent = data.message;
+                        if (data.page === previewPage) {
+                            // Move the preview on to whichever page streams next
+                            if (data.content !== undefined) {
+                                streamPreview.textContent = data.content;
+                            }
+                            previewPage = null;
+                        }
                         break;
                         
                     case 'completed':
@@ -361,6 +390,9 @@ document.addEventListener('DOMContentLoaded', function() {
         progressBarFill.style.width = '0%';
         progressDetails.textContent = 'Connecting to translation service...';
         progressDetails.classList.remove('text-red-600');
+        streamPreview.textContent = '';
+        streamPreview.classList.add('hidden');
+        previewPage = null;
         
         try {
             // Setup WebSocket for real-time progress first
@@ -392,6 +424,7 @@ document.addEventListener('DOMContentLoaded', function() {
         const formData = new FormData();
         formData.append('file_id', fileId);
         formData.append('target_language', selectedLanguage);
+        formData.append('stream', 'true');
         
         try {
             // Send a test message through WebSocket
@@ -411,8 +444,20 @@ document.addEventListener('DOMContentLoaded', function() {
                 throw new Error(errorData.detail || 'Translation failed');
             }
             
-            translationData = await response.json();
-            console.log('Translation completed:', translationData);
+            const job = await response.json();
+            console.log('Translation job started:', job);
+            
+            // The WebSocket reports progress, polling the jobs covers a dropped connection.
+            // Languages another job of the file was already translating are finished by that job.
+            const jobIds = [...new Set(Object.values(job.jobs || {}).concat(job.job_id))];
+            const finishedJobs = await Promise.all(jobIds.map(waitForJob));
+            const failedJob = finishedJobs.find(finished => finished.status === 'failed');
+            if (failedJob) {
+                throw new Error(failedJob.error || 'Translation failed');
+            }
+            const exportUrl = finishedJobs.map(finished => languageExportUrl(finished, selectedLanguage))
+                .find(url => url);
+            console.log('Translation completed:', finishedJobs);
             
             // If WebSocket didn't trigger completion, handle it here
             if (translationProgressContainer.classList.contains('hidden') === false) {
@@ -426,13 +471,13 @@ document.addEventListener('DOMContentLoaded', function() {
                     translationComplete.classList.remove('hidden');
                     
                     // Set download links
-                    if (translationData.export_url) {
-                        downloadBtn.href = `${translationData.export_url.replace('format=md', 'format=pdf')}`;
-                        downloadMdBtn.href = translationData.export_url;
+                    if (exportUrl) {
+                        downloadBtn.href = `${exportUrl.replace('format=md', 'format=pdf')}`;
+                        downloadMdBtn.href = exportUrl;
                     }
                     
-                    // Populate page selector
-                    populatePageSelector();
+                    // Fetch the translation data to display
+                    fetchTranslation();
                 }, 1000);
             }
             
@@ -456,19 +501,38 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
 
+    function languageExportUrl(finishedJob, language) {
+        const result = finishedJob.result || {};
+        const languages = result.languages || {};
+        const name = Object.keys(languages).find(key => key.toLowerCase() === language.toLowerCase());
+        return name ? languages[name].export_url : result.export_url;
+    }
+    
+    async function waitForJob(jobId) {
+        while (true) {
+            const response = await fetch(`/api/jobs/${jobId}`);
+            
+            if (!response.ok) {
+                throw new Error('Failed to fetch translation job status');
+            }
+            
+            const job = await response.json();
+            if (job.status === 'completed' || job.status === 'failed') {
+                return job;
+            }
+            
+            await new Promise(resolve => setTimeout(resolve, 2000));
+        }
+    }
+
     async function fetchTranslation() {
         if (!fileId || !selectedLanguage) {
             return;
         }
         
         try {
-            const response = await fetch(`/api/translate?file_id=${fileId}&target_language=${selectedLanguage}`);
-            
-            if (!response.ok) {
-                throw new Error('Failed to fetch translation data');
-            }
-            
-            translationData = await response.json();
+            translatedPages = {};
+            translationData = await fetchPageWindow(translationUrl(), 1, translatedPages);
             
             // Populate page selector
             populatePageSelector();
@@ -477,46 +541,92 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
 
+    function translationUrl() {
+        return `/api/translate?file_id=${fileId}&target_language=${encodeURIComponent(selectedLanguage)}`;
+    }
+
+    function storePages(cache, pages) {
+        pages.forEach(page => {
+            cache[page.page_number] = page.content;
+        });
+    }
+
+    async function fetchPageWindow(url, pageFrom, cache) {
+        const separator = url.includes('?') ? '&' : '?';
+        const response = await fetch(`${url}${separator}page_from=${pageFrom}&page_to=${pageFrom + PAGE_WINDOW - 1}`);
+        
+        if (!response.ok) {
+            throw new Error('Failed to fetch pages');
+        }
+        
+        const data = await response.json();
+        storePages(cache, data.pages);
+        return data;
+    }
+
+    async function loadPages(pageNumber) {
+        // Fetch the window starting at this page for whichever side is not loaded yet
+        const requests = [];
+        if (!(pageNumber in originalPages)) {
+            requests.push(fetchPageWindow(`/api/documents/${fileId}/pages`, pageNumber, originalPages));
+        }
+        if (!(pageNumber in translatedPages)) {
+            requests.push(fetchPageWindow(translationUrl(), pageNumber, translatedPages));
+        }
+        await Promise.all(requests);
+    }
+
     function populatePageSelector() {
         pageSelector.innerHTML = '';
         
-        if (!pdfData || !pdfData.pages) {
+        if (!pdfData || !pdfData.total_pages) {
             return;
         }
         
-        pdfData.pages.forEach(page => {
+        for (let pageNumber = 1; pageNumber <= pdfData.total_pages; pageNumber++) {
             const option = document.createElement('option');
-            option.value = page.page_number;
-            option.textContent = `Page ${page.page_number}`;
+            option.value = pageNumber;
+            option.textContent = `Page ${pageNumber}`;
             pageSelector.appendChild(option);
-        });
+        }
     }
 
-    function displaySelectedPage() {
+    async function displaySelectedPage() {
         const selectedPage = parseInt(pageSelector.value);
         
         if (!pdfData || !translationData) {
             return;
         }
         
-        // Find original page content
-        const originalPage = pdfData.pages.find(page => page.page_number === selectedPage);
+        try {
+            await loadPages(selectedPage);
+        } catch (error) {
+            console.error('Error loading pages:', error);
+        }
         
-        // Find translated page content
-        const translatedPage = translationData.pages.find(page => page.page_number === selectedPage);
+        // Another page may have been selected while this one was loading
+        if (parseInt(pageSelector.value) !== selectedPage) {
+            return;
+        }
         
         // Display content
-        if (originalPage) {
-            originalText.textContent = originalPage.content;
+        if (selectedPage in originalPages) {
+            originalText.textContent = originalPages[selectedPage];
         } else {
             originalText.textContent = 'No content available';
         }
         
-        if (translatedPage) {
-            translatedText.textContent = translatedPage.content;
+        if (selectedPage in translatedPages) {
+            translatedText.textContent = translatedPages[selectedPage];
         } else {
             translatedText.textContent = 'No translation available';
         }
+        
+        // Load the next window in the background before the user gets there
+        const aheadPage = selectedPage + 5;
+        if (aheadPage <= pdfData.total_pages && !(aheadPage in translatedPages && aheadPage in originalPages)) {
+            loadPages(aheadPage).catch(error => console.error('Error loading pages:', error));
+        }
     }
 
     function showError(message) {
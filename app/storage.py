@@ -0,0 +1,212 @@
+import os
+import time
+import asyncio
+import logging
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from app.documents import DocumentStore
+from app.state import StateBackend
+
+logger = logging.getLogger(__name__)
+
+# Seconds since its last access after which a document is evicted
+STORAGE_TTL = int(os.getenv("STORAGE_TTL", str(7 * 24 * 3600)))
+# Bytes of uploads and exports kept before least recently used documents are evicted
+STORAGE_QUOTA_BYTES = int(os.getenv("STORAGE_QUOTA_BYTES", str(5 * 1024 * 1024 * 1024)))
+# Seconds between background sweeps
+STORAGE_SWEEP_INTERVAL = int(os.getenv("STORAGE_SWEEP_INTERVAL", "300"))
+# Files without a document, like interrupted uploads, are removed once they are this old
+ORPHAN_GRACE_SECONDS = 3600
+
+
+class StorageManager:
+    """Evict stored documents by age and disk usage in the background.
+
+    A document is its uploaded PDF plus every export named after its file_id.
+    A sweep removes documents not accessed within ``ttl`` seconds, then the
+    least recently accessed ones while usage is above ``quota``. Files of the
+    documents returned by ``busy_files``, such as ones with a running
+    translation job, are never removed. When worker processes share
+    ``state``, only the one holding the sweep lease removes anything, the
+    others just measure the usage.
+    """
+
+    def __init__(self, documents: DocumentStore, upload_dir: str, export_dir: str,
+                 busy_files: Callable[[], Iterable[str]] = lambda: (),
+                 on_evict: Callable[[str], None] = lambda file_id: None,
+                 ttl: int = STORAGE_TTL, quota: int = STORAGE_QUOTA_BYTES,
+                 interval: int = STORAGE_SWEEP_INTERVAL, state: Optional[StateBackend] = None):
+        self.documents = documents
+        self.upload_dir = upload_dir
+        self.export_dir = export_dir
+        self.busy_files = busy_files
+        self.on_evict = on_evict
+        self.ttl = ttl
+        self.quota = quota
+        self.interval = interval
+        self.state = state
+        self.used_bytes = 0
+        self.document_count = 0
+        self.evictions = {"ttl": 0, "quota": 0}
+        self.evicted_bytes = 0
+        self.orphans_removed = 0
+        self.last_sweep: Optional[float] = None
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def _document_files(self) -> Dict[str, List[str]]:
+        """Group every stored file by the file_id it belongs to"""
+        files: Dict[str, List[str]] = {}
+        for directory in (self.upload_dir, self.export_dir):
+            if not os.path.isdir(directory):
+                continue
+            for entry in os.scandir(directory):
+                if entry.is_file():
+                    # Uploads are <file_id>.pdf, exports <file_id>_<language>.<ext>
+                    file_id = os.path.splitext(entry.name)[0].split("_", 1)[0]
+                    files.setdefault(file_id, []).append(entry.path)
+        return files
+
+    @staticmethod
+    def _size(paths: Iterable[str]) -> int:
+        total = 0
+        for path in paths:
+            try:
+                total += os.path.getsize(path)
+            except OSError:
+                pass
+        return total
+
+    @staticmethod
+    def _mtime(path: str, default: float) -> float:
+        try:
+            return os.path.getmtime(path)
+        except OSError:
+            return default
+
+    def _remove(self, paths: Iterable[str]) -> int:
+        freed = 0
+        for path in paths:
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+                freed += size
+            except OSError as e:
+                logger.error(f"Error deleting file {path}: {str(e)}")
+        return freed
+
+    def sweep(self, busy: Iterable[str] = (), evict_documents: bool = True) -> List[str]:
+        """Evict expired and over-quota documents, returns the evicted file_ids"""
+        now = time.time()
+        busy = set(busy)
+        files = self._document_files()
+        documents = self.documents.list()
+        known = {document["file_id"] for document in documents}
+
+        # Leftovers without a document, e.g. a partial upload from a crash
+        for file_id, paths in list(files.items()):
+            if file_id in known or file_id in busy:
+                continue
+            if not evict_documents:
+                files.pop(file_id)
+                continue
+            stale = [path for path in paths if now - self._mtime(path, now) > ORPHAN_GRACE_SECONDS]
+            if stale:
+                self._remove(stale)
+                self.orphans_removed += len(stale)
+                # Pages stored by an extraction that never finished
+                self.documents.delete(file_id)
+            files.pop(file_id)
+
+        sizes = {document["file_id"]: self._size(files.get(document["file_id"], [])) for document in documents}
+        used = sum(sizes.values())
+        evicted = []
+
+        def evict(document, reason):
+            nonlocal used
+            file_id = document["file_id"]
+            freed = self._remove(files.get(file_id, []))
+            self.documents.delete(file_id)
+            used -= sizes[file_id]
+            self.evicted_bytes += freed
+            self.evictions[reason] += 1
+            evicted.append(file_id)
+            logger.info(f"Evicted document {file_id} ({reason}), freed {freed} bytes")
+
+        # Documents are listed least recently accessed first
+        remaining = []
+        for document in documents:
+            if document["file_id"] in busy or not evict_documents:
+                remaining.append(document)
+            elif self.ttl and now - document["accessed_at"] > self.ttl:
+                evict(document, "ttl")
+            else:
+                remaining.append(document)
+
+        for document in list(remaining):
+            if not self.quota or used <= self.quota or not evict_documents:
+                break
+            if document["file_id"] in busy:
+                continue
+            evict(document, "quota")
+            remaining.remove(document)
+
+        if evict_documents and self.quota and used > self.quota:
+            logger.warning(f"Storage is over quota ({used} of {self.quota} bytes) but every document is in use")
+
+        self.used_bytes = used
+        self.document_count = len(remaining)
+        self.last_sweep = now
+        return evicted
+
+    async def run_sweep(self) -> List[str]:
+        """Sweep in a worker thread and notify about every evicted document"""
+        # Concurrent sweeps of several workers would evict the same documents twice
+        evict_documents = self.state is None or self.state.acquire_lease("storage-sweep", self.interval * 2)
+        evicted = await asyncio.to_thread(self.sweep, list(self.busy_files()), evict_documents)
+        for file_id in evicted:
+            self.on_evict(file_id)
+        return evicted
+
+    def request_sweep(self):
+        """Run a sweep soon, e.g. after an upload added to the used space"""
+        self._wake.set()
+        if self.state is not None:
+            # The worker holding the sweep lease may be another one
+            self.state.publish("storage", {"action": "sweep"})
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.run_sweep()
+            except Exception as e:
+                logger.error(f"Storage sweep failed: {str(e)}")
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    def start(self):
+        if self._task is None:
+            if self.state is not None:
+                self.state.subscribe("storage", lambda message: self._wake.set())
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "documents": self.document_count,
+            "used_bytes": self.used_bytes,
+            "quota_bytes": self.quota,
+            "ttl_seconds": self.ttl,
+            "evictions": dict(self.evictions),
+            "evicted_bytes": self.evicted_bytes,
+            "orphans_removed": self.orphans_removed,
+            "last_sweep": self.last_sweep,
+        }
@@ -0,0 +1,151 @@
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from typing import Any, Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+TRANSLATION_CACHE_PATH = os.getenv("TRANSLATION_CACHE_PATH", os.path.join("data", "translation_cache.sqlite3"))
+# Entries older than this many seconds are treated as misses and evicted
+TRANSLATION_CACHE_TTL = int(os.getenv("TRANSLATION_CACHE_TTL", str(30 * 24 * 3600)))
+# Least recently used entries are evicted above this many rows
+TRANSLATION_CACHE_MAX_ENTRIES = int(os.getenv("TRANSLATION_CACHE_MAX_ENTRIES", "100000"))
+# Run eviction after this many writes instead of on every write
+EVICTION_INTERVAL = 100
+
+
+def normalize_text(text: str) -> str:
+    """Collapse runs of spaces and tabs so layout-only differences map to the same cache entry.
+
+    Line breaks are kept, the translation keeps them, so texts that only
+    differ in them must not share an entry.
+    """
+    return re.sub(r"[ \t]+", " ", text).strip()
+
+
+def make_cache_key(text: str, target_language: str, model: str, prompt_version: str) -> str:
+    """Return the content address of a translation request"""
+    digest = hashlib.sha256()
+    for part in (prompt_version, model, target_language.strip().lower(), normalize_text(text)):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class TranslationCache:
+    """On-disk SQLite cache of translations with TTL and LRU eviction"""
+
+    def __init__(self, path: str = TRANSLATION_CACHE_PATH, ttl: int = TRANSLATION_CACHE_TTL,
+                 max_entries: int = TRANSLATION_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS translations (
+                key TEXT PRIMARY KEY,
+                content TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS translations_accessed_at ON translations (accessed_at)")
+
+    def get(self, key: str) -> Optional[str]:
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, str]:
+        """Return the cached translations of the keys that have one, blocking, run it in a thread"""
+        now = time.time()
+        found = {}
+        with self._lock:
+            for key in keys:
+                row = self._conn.execute(
+                    "SELECT content, created_at FROM translations WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None or (self.ttl and now - row[1] > self.ttl):
+                    self.misses += 1
+                    continue
+                self.hits += 1
+                found[key] = row[0]
+            if found:
+                self._conn.executemany(
+                    "UPDATE translations SET accessed_at = ? WHERE key = ?", [(now, key) for key in found]
+                )
+        return found
+
+    def set(self, key: str, content: str):
+        self.set_many({key: content})
+
+    def set_many(self, contents: Dict[str, str]):
+        """Store translations by key, blocking, run it in a thread"""
+        now = time.time()
+        with self._lock:
+            for key, content in contents.items():
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO translations (key, content, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                    (key, content, now, now),
+                )
+                self._writes += 1
+                if self._writes % EVICTION_INTERVAL == 0:
+                    self._evict(now)
+
+    def evict(self):
+        """Drop expired entries and trim the cache to its maximum size"""
+        with self._lock:
+            self._evict(time.time())
+
+    def _evict(self, now: float):
+        removed = 0
+        if self.ttl:
+            removed += self._conn.execute(
+                "DELETE FROM translations WHERE created_at < ?", (now - self.ttl,)
+            ).rowcount
+        count = self._conn.execute("SELECT COUNT(*) FROM translations").fetchone()[0]
+        if self.max_entries and count > self.max_entries:
+            removed += self._conn.execute(
+                "DELETE FROM translations WHERE key IN "
+                "(SELECT key FROM translations ORDER BY accessed_at ASC LIMIT ?)",
+                (count - self.max_entries,),
+            ).rowcount
+        if removed:
+            self.evictions += removed
+            logger.info(f"Translation cache evicted {removed} entries")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM translations").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            "evictions": self.evictions,
+        }
+
+
+_cache: Optional[TranslationCache] = None
+
+
+def get_translation_cache() -> TranslationCache:
+    """Return the translation cache shared by the whole process"""
+    global _cache
+    if _cache is None:
+        _cache = TranslationCache()
+    return _cache
@@ -0,0 +1,352 @@
+import os
+import json
+import asyncio
+import logging
+from typing import TYPE_CHECKING, Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Optional
+
+from app.chunking import estimate_tokens
+from app.metrics import COMPLETION_TOKENS, PROMPT_TOKENS, STAGE_SECONDS
+from app.scheduler import RETRYABLE_STATUS_CODES, RequestScheduler, get_request_scheduler, parse_retry_after
+
+if TYPE_CHECKING:
+    import aiohttp
+
+logger = logging.getLogger(__name__)
+
+# Model settings shared by every translation request
+OPENAI_API_BASE = os.getenv("OPENAI_API_BASE", "https://api.openai.com/v1")
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")
+OPENAI_TEMPERATURE = float(os.getenv("OPENAI_TEMPERATURE", "0.3"))
+OPENAI_MAX_TOKENS = int(os.getenv("OPENAI_MAX_TOKENS", "4000"))
+
+# HTTP settings for the shared connection pool
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "120"))
+OPENAI_CONNECT_TIMEOUT = float(os.getenv("OPENAI_CONNECT_TIMEOUT", "10"))
+OPENAI_POOL_SIZE = int(os.getenv("OPENAI_POOL_SIZE", "32"))
+OPENAI_KEEPALIVE_TIMEOUT = float(os.getenv("OPENAI_KEEPALIVE_TIMEOUT", "60"))
+
+# Bump whenever SYSTEM_PROMPT changes so cached translations are not reused
+PROMPT_VERSION = "1"
+SYSTEM_PROMPT = (
+    "You are a professional translator. Translate the following text to {target_language}. "
+    "Preserve the formatting and structure as much as possible."
+)
+# Used when several texts are packed into one request with marker lines
+PACKED_SYSTEM_PROMPT = SYSTEM_PROMPT + (
+    " The text is divided into sections, each starting with a marker line such as <<<SEGMENT 1>>>."
+    " Copy every marker line exactly as it is and in the same order, and translate only the text between them."
+)
+
+
+class TranslationClientError(Exception):
+    """Raised when the chat completions endpoint fails or returns an error"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None, retry_after: Optional[float] = None,
+                 retryable: Optional[bool] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+        # Throttling, server errors, timeouts and dropped connections are worth another attempt
+        if retryable is None:
+            retryable = status_code is None or status_code in RETRYABLE_STATUS_CODES
+        self.retryable = retryable
+
+
+def _error_code(detail: str) -> Optional[str]:
+    """``error.code`` of an OpenAI error body, like ``insufficient_quota``"""
+    try:
+        error = json.loads(detail).get("error") or {}
+    except (ValueError, AttributeError):
+        return None
+    return (error.get("code") or error.get("type")) if isinstance(error, dict) else None
+
+
+async def _status_error(response: "aiohttp.ClientResponse") -> TranslationClientError:
+    detail = await response.text()
+    retry_after = parse_retry_after(response.headers.get("Retry-After"))
+    if retry_after is None and response.headers.get("retry-after-ms"):
+        retry_after = parse_retry_after(response.headers["retry-after-ms"])
+        retry_after = retry_after / 1000 if retry_after is not None else None
+    # An exhausted quota is also answered with 429, but no amount of waiting fixes it
+    retryable = False if _error_code(detail) == "insufficient_quota" else None
+    return TranslationClientError(
+        f"OpenAI request failed with status {response.status}: {detail[:500]}",
+        status_code=response.status,
+        retry_after=retry_after,
+        retryable=retryable,
+    )
+
+
+class _Flight:
+    """One model call in flight and the callers waiting for it"""
+
+    def __init__(self, streaming: bool):
+        self.streaming = streaming
+        self.task: Optional[asyncio.Task] = None
+        self.listeners: List[Callable[[str], None]] = []
+        self.streamed: List[str] = []
+        self.waiters = 0
+
+    def delta(self, text: str):
+        self.streamed.append(text)
+        for listener in list(self.listeners):
+            listener(text)
+
+
+class SingleFlight:
+    """Share one in-flight model call between every caller asking for the same key.
+
+    The first caller starts the call as a task of its own; identical calls
+    arriving while it runs wait for the same result instead of sending the
+    request again. Streamed pieces go to every caller's ``on_delta``, a caller
+    that joins late first gets the text streamed so far, and one that joins a
+    call without streaming gets the whole content at the end. The call is
+    only cancelled once every caller waiting for it was cancelled.
+    """
+
+    def __init__(self):
+        self._flights: Dict[Hashable, _Flight] = {}
+        self.coalesced = 0
+
+    def _forget(self, key: Hashable, flight: _Flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    async def run(self, key: Hashable, call: Callable[[Optional[Callable[[str], None]]], Awaitable[Dict[str, Any]]],
+                  on_delta: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight(streaming=on_delta is not None)
+            flight.task = asyncio.ensure_future(call(flight.delta if flight.streaming else None))
+            flight.task.add_done_callback(lambda task: self._forget(key, flight))
+            self._flights[key] = flight
+        else:
+            self.coalesced += 1
+
+        listening = on_delta is not None and flight.streaming
+        if listening:
+            if flight.streamed:
+                on_delta("".join(flight.streamed))
+            flight.listeners.append(on_delta)
+        flight.waiters += 1
+        try:
+            result = await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            if flight.waiters == 1 and not flight.task.done():
+                # Nobody else needs the result, later callers start a new call
+                self._forget(key, flight)
+                flight.task.cancel()
+            raise
+        finally:
+            flight.waiters -= 1
+            if listening:
+                flight.listeners.remove(on_delta)
+        if on_delta is not None and not flight.streaming:
+            on_delta(result["content"])
+        return result
+
+
+class TranslationClient:
+    """Async chat completions client backed by one keep-alive connection pool"""
+
+    def __init__(
+        self,
+        api_base: str = OPENAI_API_BASE,
+        model: str = OPENAI_MODEL,
+        temperature: float = OPENAI_TEMPERATURE,
+        max_tokens: int = OPENAI_MAX_TOKENS,
+        timeout: float = OPENAI_TIMEOUT,
+        connect_timeout: float = OPENAI_CONNECT_TIMEOUT,
+        pool_size: int = OPENAI_POOL_SIZE,
+        scheduler: Optional[RequestScheduler] = None,
+    ):
+        self.api_base = api_base.rstrip("/")
+        self.model = model
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.pool_size = pool_size
+        self.scheduler = scheduler or get_request_scheduler()
+        # Identical requests in flight at the same time, e.g. from two jobs of one document, are sent once
+        self.flights = SingleFlight()
+        self._session: Optional["aiohttp.ClientSession"] = None
+
+    def _get_session(self) -> "aiohttp.ClientSession":
+        # The session is created lazily so it binds to the running event loop,
+        # and aiohttp is only imported for the first request
+        import aiohttp
+
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.pool_size,
+                keepalive_timeout=OPENAI_KEEPALIVE_TIMEOUT,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout, connect=self.connect_timeout),
+            )
+        return self._session
+
+    def _headers(self) -> Dict[str, str]:
+        # Read the key on every call so a key added to the environment is picked up
+        api_key = os.getenv("OPENAI_API_KEY")
+        if not api_key:
+            raise ValueError("OpenAI API key is not set")
+        return {"Authorization": f"Bearer {api_key}"}
+
+    async def chat(self, messages: List[Dict[str, str]], max_tokens: Optional[int] = None) -> Dict[str, Any]:
+        """Send a chat completions request and return the decoded response"""
+        payload = {
+            "model": self.model,
+            "messages": messages,
+            "temperature": self.temperature,
+            "max_tokens": max_tokens or self.max_tokens,
+        }
+        import aiohttp
+
+        session = self._get_session()
+        try:
+            async with session.post(f"{self.api_base}/chat/completions", json=payload, headers=self._headers()) as response:
+                if response.status != 200:
+                    raise await _status_error(response)
+                return await response.json()
+        except asyncio.TimeoutError:
+            raise TranslationClientError(f"OpenAI request timed out after {self.timeout} seconds")
+        except aiohttp.ClientError as e:
+            raise TranslationClientError(f"OpenAI connection error: {str(e)}")
+
+    async def stream_chat(self, messages: List[Dict[str, str]],
+                          max_tokens: Optional[int] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Send a streaming chat completions request and yield each decoded server-sent chunk"""
+        payload = {
+            "model": self.model,
+            "messages": messages,
+            "temperature": self.temperature,
+            "max_tokens": max_tokens or self.max_tokens,
+            "stream": True,
+        }
+        import aiohttp
+
+        session = self._get_session()
+        try:
+            async with session.post(f"{self.api_base}/chat/completions", json=payload, headers=self._headers()) as response:
+                if response.status != 200:
+                    raise await _status_error(response)
+                async for raw_line in response.content:
+                    line = raw_line.decode("utf-8").strip()
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        break
+                    yield json.loads(data)
+        except asyncio.TimeoutError:
+            raise TranslationClientError(f"OpenAI request timed out after {self.timeout} seconds")
+        except aiohttp.ClientError as e:
+            raise TranslationClientError(f"OpenAI connection error: {str(e)}")
+
+    async def complete_translation(self, text: str, target_language: str, packed: bool = False,
+                                   max_tokens: Optional[int] = None,
+                                   on_delta: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+        """Translate text and return the translated content together with the finish reason.
+
+        With ``on_delta`` the response is streamed and every piece of generated
+        text is passed to it as soon as it arrives. The request goes through
+        the scheduler, which keeps it within the rate limits and retries it on
+        throttling and transient errors. Concurrent calls with the same input
+        share one request.
+        """
+        system_prompt = PACKED_SYSTEM_PROMPT if packed else SYSTEM_PROMPT
+        messages = [
+            {"role": "system", "content": system_prompt.format(target_language=target_language)},
+            {"role": "user", "content": text},
+        ]
+        # Rate limits count the prompt and the completion budget
+        tokens = estimate_tokens(system_prompt) + estimate_tokens(text) + (max_tokens or self.max_tokens)
+        return await self.flights.run(
+            (target_language, packed, max_tokens, text),
+            # Streamed requests are never hedged, two streams would pass on their text twice
+            lambda delta: self.scheduler.run(
+                lambda: self._complete(messages, max_tokens, delta), tokens, hedge=delta is None
+            ),
+            on_delta
+        )
+
+    async def _complete(self, messages: List[Dict[str, str]], max_tokens: Optional[int],
+                        on_delta: Optional[Callable[[str], None]]) -> Dict[str, Any]:
+        # One round trip to the API, every retry is observed on its own
+        with STAGE_SECONDS.time(stage="model_request"):
+            result = await self._request(messages, max_tokens, on_delta)
+        # Streamed responses carry no usage, their tokens are estimated
+        usage = result.pop("usage", None) or {}
+        PROMPT_TOKENS.inc(
+            usage.get("prompt_tokens") or sum(estimate_tokens(message["content"]) for message in messages),
+            model=self.model
+        )
+        COMPLETION_TOKENS.inc(usage.get("completion_tokens") or estimate_tokens(result["content"]), model=self.model)
+        return result
+
+    async def _request(self, messages: List[Dict[str, str]], max_tokens: Optional[int],
+                       on_delta: Optional[Callable[[str], None]]) -> Dict[str, Any]:
+        if on_delta is None:
+            response = await self.chat(messages, max_tokens=max_tokens)
+            choice = response["choices"][0]
+            return {
+                "content": choice["message"]["content"],
+                "finish_reason": choice.get("finish_reason"),
+                "usage": response.get("usage"),
+            }
+
+        content = []
+        finish_reason = None
+        try:
+            async for chunk in self.stream_chat(messages, max_tokens=max_tokens):
+                if not chunk.get("choices"):
+                    continue
+                choice = chunk["choices"][0]
+                delta = choice.get("delta", {}).get("content")
+                if delta:
+                    content.append(delta)
+                    on_delta(delta)
+                finish_reason = choice.get("finish_reason") or finish_reason
+        except TranslationClientError as e:
+            # Text already passed on cannot be taken back, so a broken stream is not retried
+            if content:
+                e.retryable = False
+            raise
+        return {"content": "".join(content), "finish_reason": finish_reason}
+
+    async def translate(self, text: str, target_language: str) -> str:
+        """Translate text to the target language and return the translated text"""
+        result = await self.complete_translation(text, target_language)
+        return result["content"]
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+_client: Optional[TranslationClient] = None
+
+
+def warm_up_client():
+    """Import the HTTP client library ahead of the first translation"""
+    import aiohttp  # noqa: F401
+
+
+def get_translation_client() -> TranslationClient:
+    """Return the translation client shared by the whole process"""
+    global _client
+    if _client is None:
+        _client = TranslationClient()
+    return _client
+
+
+async def close_translation_client():
+    """Close the shared connection pool, called on application shutdown"""
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
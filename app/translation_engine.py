@@ -0,0 +1,414 @@
+import os
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from app.chunking import plan_requests, restore_whitespace
+from app.segmentation import assemble_page, segment_pages
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of model requests of a single job that may be in flight at once
+TRANSLATION_JOB_CONCURRENCY = int(os.getenv("TRANSLATION_JOB_CONCURRENCY", "4"))
+
+
+class OrderedPageWriter:
+    """Write pages to the markdown export in page order while they complete out of order"""
+
+    def __init__(self, export_file, first_page: int = 1):
+        self.export_file = export_file
+        self.next_page = first_page
+        self.pending: Dict[int, str] = {}
+
+    def add(self, page_number: int, content: str):
+        self.pending[page_number] = content
+        # Flush every page that is now contiguous with what was already written
+        while self.next_page in self.pending:
+            content = self.pending.pop(self.next_page)
+            self.export_file.write(f"## Page {self.next_page}\n\n")
+            self.export_file.write(f"{content}\n\n")
+            self.next_page += 1
+        self.export_file.flush()
+
+
+class StreamingPageWriter(OrderedPageWriter):
+    """Ordered page writer that also appends streamed text of the next page as it arrives.
+
+    Streamed text of later pages is kept until they are next in line. When a
+    page finishes, its final content replaces whatever was streamed if the two
+    differ, so the export always ends up identical to the non-streaming one.
+    """
+
+    def __init__(self, export_file, first_page: int = 1):
+        super().__init__(export_file, first_page)
+        self.streams: Dict[int, str] = {}
+        self.streaming_page = None
+        self.stream_start = None
+        self.stream_written = 0
+
+    def add_delta(self, page_number: int, text: str):
+        if page_number < self.next_page or page_number in self.pending:
+            return
+        self.streams[page_number] = self.streams.get(page_number, "") + text
+        if page_number == self.next_page:
+            self._write_stream()
+            self.export_file.flush()
+
+    def _write_stream(self):
+        text = self.streams.get(self.next_page)
+        if text is None:
+            return
+        if self.streaming_page != self.next_page:
+            self.streaming_page = self.next_page
+            self.stream_start = self.export_file.tell()
+            self.stream_written = 0
+            self.export_file.write(f"## Page {self.next_page}\n\n")
+        self.export_file.write(text[self.stream_written:])
+        self.stream_written = len(text)
+
+    def add(self, page_number: int, content: str):
+        self.pending[page_number] = content
+        while self.next_page in self.pending:
+            content = self.pending.pop(self.next_page)
+            streamed = self.streams.pop(self.next_page, None)
+            if self.streaming_page == self.next_page and streamed == content:
+                self.export_file.write("\n\n")
+            else:
+                if self.streaming_page == self.next_page:
+                    # The streamed text was superseded by a retry or fallback, rewrite the page
+                    self.export_file.seek(self.stream_start)
+                    self.export_file.truncate()
+                self.export_file.write(f"## Page {self.next_page}\n\n")
+                self.export_file.write(f"{content}\n\n")
+            self.streaming_page = None
+            self.next_page += 1
+            self._write_stream()
+        self.export_file.flush()
+
+
+class ProgressTracker:
+    """Count finished pages so progress stays correct when pages finish out of order"""
+
+    def __init__(self, total_pages: int):
+        self.total_pages = total_pages
+        self.completed_pages = 0
+
+    @property
+    def progress(self) -> float:
+        if not self.total_pages:
+            return 100
+        return (self.completed_pages / self.total_pages) * 100
+
+    def page_done(self):
+        self.completed_pages += 1
+
+
+async def run_concurrently(
+    items: List[Any],
+    worker: Callable[[Any], Awaitable[Any]],
+    on_done: Optional[Callable[[Any], Awaitable[None]]] = None,
+    concurrency: Optional[int] = None,
+) -> List[Any]:
+    """Run ``worker`` over ``items`` concurrently and return the results in input order.
+
+    At most ``concurrency`` items of this job run at once; the process-wide
+    limits are applied to every model request by the request scheduler.
+    ``on_done`` is awaited for each result in completion order. If any item
+    fails, the remaining items are cancelled and the error is re-raised.
+    """
+    job_limit = asyncio.Semaphore(max(1, concurrency or TRANSLATION_JOB_CONCURRENCY))
+
+    async def run(index, item):
+        async with job_limit:
+            return index, await worker(item)
+
+    tasks = [asyncio.create_task(run(index, item)) for index, item in enumerate(items)]
+    results: Dict[int, Any] = {}
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            index, result = await next_done
+            results[index] = result
+            if on_done is not None:
+                await on_done(result)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+    return [results[index] for index in range(len(items))]
+
+
+class PageStreamAssembler:
+    """Turn streamed deltas of out-of-order request parts into in-order text for each page.
+
+    Every page is laid out as a sequence of fixed text (blank segments and the
+    newlines between segments) and request parts. Deltas are emitted for a
+    page only up to its first unfinished part, so the text a client sees for a
+    page always grows from the front. Part output gets the same whitespace
+    treatment as ``restore_whitespace``.
+    """
+
+    def __init__(self, layouts: Dict[int, List[tuple]], parts: List[str], emit: Callable[[int, str], None]):
+        self.layouts = layouts
+        self.parts = parts
+        self.emit = emit
+        self.cursors = {page_number: (0, 0) for page_number in layouts}
+        self.output: Dict[int, str] = {}
+        self.held_whitespace: Dict[int, str] = {}
+        self.done = set()
+
+    def part_delta(self, part_id: int, delta: str, page_numbers: List[int]):
+        original = self.parts[part_id]
+        if part_id not in self.output:
+            delta = delta.lstrip()
+            if not delta:
+                return
+            self.output[part_id] = original[:len(original) - len(original.lstrip())]
+        # Trailing whitespace is held back until more text follows or the part ends
+        delta = self.held_whitespace.pop(part_id, "") + delta
+        stripped = delta.rstrip()
+        if len(stripped) < len(delta):
+            self.held_whitespace[part_id] = delta[len(stripped):]
+        self.output[part_id] += stripped
+        for page_number in page_numbers:
+            self._pump(page_number)
+
+    def part_done(self, part_id: int, content: str, page_numbers: List[int]):
+        self.output[part_id] = content
+        self.held_whitespace.pop(part_id, None)
+        self.done.add(part_id)
+        for page_number in page_numbers:
+            self._pump(page_number)
+
+    def _pump(self, page_number: int):
+        layout = self.layouts[page_number]
+        item, offset = self.cursors[page_number]
+        pieces = []
+        while item < len(layout):
+            kind, value = layout[item]
+            if kind == "text":
+                pieces.append(value)
+            else:
+                text = self.output.get(value, "")
+                if offset < len(text):
+                    pieces.append(text[offset:])
+                    offset = len(text)
+                if value not in self.done:
+                    break
+            item, offset = item + 1, 0
+        self.cursors[page_number] = (item, offset)
+        if pieces:
+            self.emit(page_number, "".join(pieces))
+
+
+class DocumentPlan:
+    """Deduplicated, token-budgeted translation plan of a document in one target language.
+
+    The plan owns the requests for the distinct non-blank segments of the
+    pages and reassembles pages as their requests finish. ``translate_request``
+    and ``request_done`` are the worker and completion callbacks for
+    ``run_concurrently``; requests of several plans can share one run.
+    """
+
+    def __init__(
+        self,
+        pages: List[Dict[str, Any]],
+        translate: Callable[[List[str], Optional[Callable[[int, str], None]]], Awaitable[List[str]]],
+        on_page_started: Optional[Callable[[int], Awaitable[None]]] = None,
+        on_page_done: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None,
+        on_page_delta: Optional[Callable[[int, str], None]] = None,
+    ):
+        self.translate = translate
+        self.on_page_started = on_page_started
+        self.on_page_done = on_page_done
+
+        plan = segment_pages(pages)
+        self.stats = plan["stats"]
+        self.segments = segments = plan["segments"]
+        self.page_segments = page_segments = plan["page_segments"]
+        logger.info(
+            f"Deduplicated {self.stats['deduplicated_chars']} of {self.stats['total_chars']} characters "
+            f"({self.stats['unique_segments']} unique of {self.stats['total_segments']} segments)"
+        )
+
+        # Blank segments are kept as they are, everything else is sent to the model
+        self.translated_segments: Dict[int, str] = {}
+        self.pending_pages: Dict[int, set] = {}
+        self.pages_by_segment: Dict[int, List[int]] = {}
+        for page_number, indexes in page_segments.items():
+            self.pending_pages[page_number] = set()
+            for index in indexes:
+                if segments[index].strip():
+                    self.pending_pages[page_number].add(index)
+                    page_numbers = self.pages_by_segment.setdefault(index, [])
+                    if page_number not in page_numbers:
+                        page_numbers.append(page_number)
+                else:
+                    self.translated_segments[index] = segments[index]
+
+        # Split oversized segments and pack small ones into token-budgeted requests
+        segment_ids = sorted(self.pages_by_segment)
+        request_plan = plan_requests([segments[index] for index in segment_ids])
+        self.requests = request_plan["requests"]
+        self.parts = request_plan["parts"]
+        self.segment_by_part: Dict[int, int] = {}
+        for position, part_ids in enumerate(request_plan["parts_by_text"]):
+            for part_id in part_ids:
+                self.segment_by_part[part_id] = segment_ids[position]
+        self.parts_by_segment = {
+            segment_ids[position]: part_ids for position, part_ids in enumerate(request_plan["parts_by_text"])
+        }
+        logger.info(f"Planned {len(self.requests)} requests for {len(self.parts)} parts of {len(segment_ids)} segments")
+
+        self.assembler = None
+        if on_page_delta is not None:
+            layouts = {}
+            for page_number, indexes in page_segments.items():
+                layout = []
+                for position, index in enumerate(indexes):
+                    if position:
+                        layout.append(("text", "\n"))
+                    if index in self.parts_by_segment:
+                        layout.extend(("part", part_id) for part_id in self.parts_by_segment[index])
+                    else:
+                        layout.append(("text", segments[index]))
+                layouts[page_number] = layout
+            self.assembler = PageStreamAssembler(layouts, self.parts, on_page_delta)
+
+        self.translated_parts: Dict[int, str] = {}
+        self.translated_pages: Dict[int, Dict[str, Any]] = {}
+        self.started_pages = set()
+
+    async def _finish_page(self, page_number: int):
+        if any(self.segments[index].strip() for index in self.page_segments[page_number]):
+            content = assemble_page(self.page_segments[page_number], self.translated_segments)
+        else:
+            content = "No content to translate."
+        self.translated_pages[page_number] = {"page_number": page_number, "content": content}
+        if self.on_page_done is not None:
+            await self.on_page_done(self.translated_pages[page_number])
+
+    async def finish_blank_pages(self):
+        """Complete the pages without any text, they need no request"""
+        for page_number, pending in self.pending_pages.items():
+            if not pending:
+                await self._finish_page(page_number)
+
+    async def translate_request(self, part_ids: List[int]):
+        for part_id in part_ids:
+            for page_number in self.pages_by_segment[self.segment_by_part[part_id]]:
+                if page_number not in self.started_pages:
+                    self.started_pages.add(page_number)
+                    if self.on_page_started is not None:
+                        await self.on_page_started(page_number)
+
+        def part_delta(position, delta):
+            part_id = part_ids[position]
+            self.assembler.part_delta(part_id, delta, self.pages_by_segment[self.segment_by_part[part_id]])
+
+        on_delta = part_delta if self.assembler is not None else None
+        translated = await self.translate([self.parts[part_id] for part_id in part_ids], on_delta)
+        return list(zip(part_ids, translated))
+
+    async def request_done(self, result):
+        for part_id, translated_text in result:
+            self.translated_parts[part_id] = restore_whitespace(self.parts[part_id], translated_text)
+            index = self.segment_by_part[part_id]
+            if self.assembler is not None:
+                self.assembler.part_done(part_id, self.translated_parts[part_id], self.pages_by_segment[index])
+            if any(other not in self.translated_parts for other in self.parts_by_segment[index]):
+                continue
+            self.translated_segments[index] = "".join(
+                self.translated_parts[other] for other in self.parts_by_segment[index]
+            )
+            for page_number in self.pages_by_segment[index]:
+                self.pending_pages[page_number].discard(index)
+                if not self.pending_pages[page_number]:
+                    await self._finish_page(page_number)
+
+    def result(self) -> Dict[str, Any]:
+        return {
+            "pages": [self.translated_pages[page_number] for page_number in sorted(self.translated_pages)],
+            "deduplication": self.stats,
+            "requests": len(self.requests),
+        }
+
+
+async def translate_pages(
+    pages: List[Dict[str, Any]],
+    translate: Callable[[List[str], Optional[Callable[[int, str], None]]], Awaitable[List[str]]],
+    on_page_started: Optional[Callable[[int], Awaitable[None]]] = None,
+    on_page_done: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None,
+    on_page_delta: Optional[Callable[[int, str], None]] = None,
+    concurrency: Optional[int] = None,
+) -> Dict[str, Any]:
+    """Translate the distinct segments of a document once and reassemble its pages.
+
+    Unique non-blank segments are planned into token-budgeted requests:
+    oversized segments are split and small ones packed together, and
+    ``translate`` is called once per request with the texts it carries. A page
+    is reported through ``on_page_done`` as soon as all of its segments are
+    translated, so pages still complete out of order. With ``on_page_delta``
+    the requests are streamed and each page's text is reported as it is
+    generated; the content passed to ``on_page_done`` stays authoritative.
+    Returns the translated pages in page order together with the
+    deduplication statistics.
+    """
+    plan = DocumentPlan(pages, translate, on_page_started, on_page_done, on_page_delta)
+    await plan.finish_blank_pages()
+    await run_concurrently(plan.requests, plan.translate_request, plan.request_done, concurrency)
+    return plan.result()
+
+
+async def translate_languages(
+    pages_by_language: Dict[str, List[Dict[str, Any]]],
+    translate: Callable[[str, List[str], Optional[Callable[[int, str], None]]], Awaitable[List[str]]],
+    on_page_started: Optional[Callable[[str, int], Awaitable[None]]] = None,
+    on_page_done: Optional[Callable[[str, Dict[str, Any]], Awaitable[None]]] = None,
+    on_page_delta: Optional[Callable[[str, int, str], None]] = None,
+    concurrency: Optional[int] = None,
+) -> Dict[str, Dict[str, Any]]:
+    """Translate a document into several languages through one concurrency-limited run.
+
+    Each language gets its own plan as in ``translate_pages``, and the requests
+    of all languages are interleaved so every language makes progress at the
+    same pace. The callbacks receive the language as their first argument.
+    Returns the result of ``translate_pages`` for every language.
+    """
+    def bind(callback, language):
+        if callback is None:
+            return None
+        return lambda *args: callback(language, *args)
+
+    plans = {
+        language: DocumentPlan(
+            pages,
+            bind(translate, language),
+            bind(on_page_started, language),
+            bind(on_page_done, language),
+            bind(on_page_delta, language),
+        )
+        for language, pages in pages_by_language.items()
+    }
+    for plan in plans.values():
+        await plan.finish_blank_pages()
+
+    # Round-robin over the languages: first request of each, then the second of each, ...
+    items = []
+    longest = max((len(plan.requests) for plan in plans.values()), default=0)
+    for position in range(longest):
+        for language, plan in plans.items():
+            if position < len(plan.requests):
+                items.append((language, plan.requests[position]))
+
+    async def translate_request(item):
+        language, part_ids = item
+        return language, await plans[language].translate_request(part_ids)
+
+    async def request_done(result):
+        language, translated = result
+        await plans[language].request_done(translated)
+
+    await run_concurrently(items, translate_request, request_done, concurrency)
+    return {language: plan.result() for language, plan in plans.items()}
@@ -0,0 +1,114 @@
+import os
+import time
+import sqlite3
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+TRANSLATIONS_DB_PATH = os.getenv("TRANSLATIONS_DB_PATH", os.path.join("data", "translations.sqlite3"))
+
+
+class TranslationStore:
+    """SQLite store of translated documents, one row per translated page.
+
+    Pages are keyed by (file_id, language, page_number), so any page or page
+    range is read straight from the index. Every new translation run of a
+    document bumps its ``version`` and the run is marked completed once all
+    of its pages are in. Markdown and PDF exports are rendered from here.
+    """
+
+    def __init__(self, path: str = TRANSLATIONS_DB_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS translations (
+                file_id TEXT NOT NULL,
+                language TEXT NOT NULL,
+                status TEXT NOT NULL,
+                version INTEGER NOT NULL,
+                total_pages INTEGER,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (file_id, language)
+            )"""
+        )
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS translated_pages (
+                file_id TEXT NOT NULL,
+                language TEXT NOT NULL,
+                page_number INTEGER NOT NULL,
+                content TEXT NOT NULL,
+                PRIMARY KEY (file_id, language, page_number)
+            )"""
+        )
+
+    def start(self, file_id: str, language: str, total_pages: int) -> int:
+        """Mark a translation as in progress and return its new version"""
+        language = language.lower()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT version FROM translations WHERE file_id = ? AND language = ?", (file_id, language)
+            ).fetchone()
+            version = (row["version"] if row else 0) + 1
+            self._conn.execute(
+                "INSERT OR REPLACE INTO translations VALUES (?, ?, 'translating', ?, ?, ?)",
+                (file_id, language, version, total_pages, time.time()),
+            )
+        return version
+
+    def put_page(self, file_id: str, language: str, page_number: int, content: str):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO translated_pages VALUES (?, ?, ?, ?)",
+                (file_id, language.lower(), page_number, content),
+            )
+
+    def complete(self, file_id: str, language: str):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE translations SET status = 'completed', updated_at = ? WHERE file_id = ? AND language = ?",
+                (time.time(), file_id, language.lower()),
+            )
+
+    def get(self, file_id: str, language: str) -> Optional[Dict[str, Any]]:
+        """Return the status, version and page count of a translation"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM translations WHERE file_id = ? AND language = ?", (file_id, language.lower())
+            ).fetchone()
+        return dict(row) if row else None
+
+    def get_pages(self, file_id: str, language: str, page_from: int = 1,
+                  page_to: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Return the translated pages from ``page_from`` to ``page_to``, both inclusive"""
+        with self._lock:
+            rows = self._conn.execute(
+                """SELECT page_number, content FROM translated_pages
+                   WHERE file_id = ? AND language = ? AND page_number BETWEEN ? AND ?
+                   ORDER BY page_number""",
+                (file_id, language.lower(), page_from, page_to if page_to is not None else 2 ** 31),
+            ).fetchall()
+        return [{"page_number": row["page_number"], "content": row["content"]} for row in rows]
+
+    def languages(self, file_id: str) -> List[str]:
+        """Return the languages a document has a completed translation in"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT language FROM translations WHERE file_id = ? AND status = 'completed' ORDER BY updated_at DESC",
+                (file_id,),
+            ).fetchall()
+        return [row["language"] for row in rows]
+
+    def delete(self, file_id: str):
+        """Remove every translation of a document"""
+        with self._lock:
+            self._conn.execute("DELETE FROM translated_pages WHERE file_id = ?", (file_id,))
+            self._conn.execute("DELETE FROM translations WHERE file_id = ?", (file_id,))
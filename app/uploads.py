@@ -0,0 +1,147 @@
+import os
+import uuid
+import hashlib
+import logging
+from typing import Any, Dict, List
+
+from fastapi import HTTPException, Request
+from multipart.exceptions import MultipartParseError
+from multipart.multipart import MultipartParser, parse_options_header
+
+logger = logging.getLogger(__name__)
+
+# Largest accepted upload in bytes, enforced while the body is still streaming in
+MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE", str(100 * 1024 * 1024)))
+# Form fields other than files are small, anything larger is rejected
+MAX_FIELD_SIZE = 64 * 1024
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+async def receive_upload(request: Request, upload_dir: str, max_size: int = MAX_UPLOAD_SIZE) -> Dict[str, Any]:
+    """Stream a multipart/form-data body straight to disk.
+
+    Every file part is written to a temporary file in ``upload_dir`` while its
+    SHA-256 is computed, so the upload is never held in memory. The request
+    is rejected with 413 as soon as more than ``max_size`` bytes have arrived.
+    Returns the plain form fields and, per file, its field name, filename,
+    temporary path, size and hash. The caller owns the temporary files.
+    """
+    content_type, options = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in options:
+        raise HTTPException(status_code=400, detail="Expected a multipart/form-data upload")
+
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > max_size + MAX_FIELD_SIZE:
+        raise HTTPException(status_code=413, detail=f"Upload exceeds the {max_size} byte limit")
+
+    fields: Dict[str, str] = {}
+    files: List[Dict[str, Any]] = []
+    state: Dict[str, Any] = {"header_name": b"", "header_value": b"", "headers": {}, "part": None}
+    received = 0
+
+    def on_part_begin():
+        state["headers"] = {}
+        state["part"] = None
+
+    def on_header_field(data, start, end):
+        state["header_name"] += data[start:end]
+
+    def on_header_value(data, start, end):
+        state["header_value"] += data[start:end]
+
+    def on_header_end():
+        state["headers"][state["header_name"].lower()] = state["header_value"]
+        state["header_name"] = b""
+        state["header_value"] = b""
+
+    def on_headers_finished():
+        _, disposition = parse_options_header(state["headers"].get(b"content-disposition", b""))
+        name = disposition.get(b"name", b"").decode("utf-8", "replace")
+        part = {"name": name, "data": b""}
+        if b"filename" in disposition:
+            path = os.path.join(upload_dir, f".{uuid.uuid4()}.part")
+            part.update({
+                "filename": os.path.basename(disposition[b"filename"].decode("utf-8", "replace")),
+                "path": path,
+                "size": 0,
+                "hash": hashlib.sha256(),
+                "file": open(path, "wb"),
+            })
+            files.append(part)
+        state["part"] = part
+
+    def on_part_data(data, start, end):
+        part = state["part"]
+        chunk = data[start:end]
+        if "file" in part:
+            part["file"].write(chunk)
+            part["hash"].update(chunk)
+            part["size"] += len(chunk)
+            if part["size"] > max_size:
+                raise HTTPException(status_code=413, detail=f"Upload exceeds the {max_size} byte limit")
+        else:
+            part["data"] += chunk
+            if len(part["data"]) > MAX_FIELD_SIZE:
+                raise HTTPException(status_code=413, detail=f"Form field {part['name']} is too large")
+
+    def on_part_end():
+        part = state["part"]
+        if "file" in part:
+            part["file"].close()
+        else:
+            fields[part["name"]] = part["data"].decode("utf-8", "replace")
+
+    parser = MultipartParser(options[b"boundary"], {
+        "on_part_begin": on_part_begin,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+    })
+
+    try:
+        try:
+            async for chunk in request.stream():
+                received += len(chunk)
+                if received > max_size + MAX_FIELD_SIZE:
+                    raise HTTPException(status_code=413, detail=f"Upload exceeds the {max_size} byte limit")
+                parser.write(chunk)
+            parser.finalize()
+        except MultipartParseError as e:
+            raise HTTPException(status_code=400, detail=f"Malformed upload: {str(e)}")
+    except BaseException:
+        # Never leave partial files behind
+        for part in files:
+            part["file"].close()
+            if os.path.exists(part["path"]):
+                os.remove(part["path"])
+        raise
+
+    return {
+        "fields": fields,
+        "files": [
+            {
+                "field": part["name"],
+                "filename": part["filename"],
+                "path": part["path"],
+                "size": part["size"],
+                "sha256": part["hash"].hexdigest(),
+            }
+            for part in files
+        ],
+    }
+
+
+def file_sha256(path: str) -> str:
+    """SHA-256 of a stored file, for files that were not hashed while they were received"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(HASH_CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
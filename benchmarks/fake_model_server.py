@@ -0,0 +1,107 @@
+"""Local stand-in for the chat completions endpoint, for benchmarks without network access.
+
+    python -m benchmarks.fake_model_server --port 8765 --latency 0.5 --error-rate 0.05
+
+The "translation" upper-cases the user message, which keeps the segment
+markers of packed requests intact. Responses are delayed by ``latency``
+seconds plus up to ``jitter`` seconds; streamed responses spread the same
+delay over their chunks. A share of ``slow_rate`` responses takes
+``slow_latency`` seconds longer, the tail that hedged requests cut. A share of
+``error_rate`` requests is answered with 429 and Retry-After, and a share of
+``server_error_rate`` with 500.
+"""
+import json
+import random
+import asyncio
+import argparse
+
+from aiohttp import web
+
+
+def translate(text: str) -> str:
+    return text.upper()
+
+
+def make_app(latency: float = 0.5, jitter: float = 0.2, error_rate: float = 0.0,
+             server_error_rate: float = 0.0, retry_after: float = 0.5,
+             tokens_per_second: float = 0.0, slow_rate: float = 0.0, slow_latency: float = 5.0) -> web.Application:
+    stats = {"requests": 0, "throttled": 0, "server_errors": 0, "streamed": 0, "slow": 0, "cancelled": 0}
+
+    async def chat(request: web.Request) -> web.StreamResponse:
+        stats["requests"] += 1
+        body = await request.json()
+        roll = random.random()
+        if roll < error_rate:
+            stats["throttled"] += 1
+            return web.json_response(
+                {"error": {"message": "Rate limit reached", "type": "requests"}},
+                status=429, headers={"Retry-After": f"{retry_after:g}"}
+            )
+        if roll < error_rate + server_error_rate:
+            stats["server_errors"] += 1
+            return web.json_response({"error": {"message": "Internal server error"}}, status=500)
+
+        text = body["messages"][-1]["content"]
+        content = translate(text)
+        prompt_tokens = sum(len(message["content"]) for message in body["messages"]) // 4
+        completion_tokens = len(content) // 4
+        delay = latency + random.uniform(0, jitter)
+        if tokens_per_second > 0:
+            delay += completion_tokens / tokens_per_second
+        if random.random() < slow_rate:
+            stats["slow"] += 1
+            delay += slow_latency
+
+        if not body.get("stream"):
+            try:
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                # The client gave up on the request, e.g. a hedged request that lost
+                stats["cancelled"] += 1
+                raise
+            return web.json_response({
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens},
+            })
+
+        stats["streamed"] += 1
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        pieces = [content[i:i + 16] for i in range(0, len(content), 16)] or [""]
+        for piece in pieces:
+            await asyncio.sleep(delay / len(pieces))
+            chunk = {"choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+        final = {"choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+        await response.write(f"data: {json.dumps(final)}\n\n".encode("utf-8"))
+        await response.write(b"data: [DONE]\n\n")
+        return response
+
+    async def get_stats(request: web.Request) -> web.Response:
+        return web.json_response(stats)
+
+    app = web.Application(client_max_size=64 * 1024 * 1024)
+    app.router.add_post("/v1/chat/completions", chat)
+    app.router.add_get("/stats", get_stats)
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake chat completions server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.5, help="Seconds every response takes at least")
+    parser.add_argument("--jitter", type=float, default=0.2, help="Random extra seconds on top of the latency")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0,
+                        help="Generation speed added to the latency, 0 to ignore the response length")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="Share of responses that are much slower")
+    parser.add_argument("--slow-latency", type=float, default=5.0, help="Extra seconds of the slow responses")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with 429")
+    parser.add_argument("--server-error-rate", type=float, default=0.0, help="Share of requests answered with 500")
+    parser.add_argument("--retry-after", type=float, default=0.5, help="Retry-After of the 429 responses")
+    args = parser.parse_args()
+    web.run_app(
+        make_app(args.latency, args.jitter, args.error_rate, args.server_error_rate, args.retry_after,
+                 args.tokens_per_second, args.slow_rate, args.slow_latency),
+        host=args.host, port=args.port, print=None
+    )
@@ -0,0 +1,85 @@
+"""Peak memory of the app against the length of the document.
+
+    python -m benchmarks.memory --pages 200 1000 2000
+
+Runs ``benchmarks.run`` once per page count and scenario with a single
+document and compares the peak RSS of the server with its worker processes:
+
+- ``translate``: translate the document, then download its exports
+- ``download``: the same, but the PDF export is rendered again by the download
+- ``resume``: the app is killed halfway through the job and restarted, the
+  job resumes from its checkpoint
+
+Documents are extracted, translated, rendered and exported
+``PIPELINE_WINDOW_PAGES`` pages at a time, so the peak should grow far
+slower than the page count in every scenario. The growth per added page
+is printed at the end.
+"""
+import os
+import sys
+import json
+import asyncio
+import argparse
+import tempfile
+from typing import Any, Dict, List
+
+from benchmarks import run
+
+SCENARIOS = {
+    "translate": [],
+    "download": ["--cold-pdf"],
+    "resume": ["--restart-at", "50"],
+}
+
+
+async def main(args) -> int:
+    if args.window:
+        os.environ["PIPELINE_WINDOW_PAGES"] = str(args.window)
+    reports: Dict[str, List[Dict[str, Any]]] = {scenario: [] for scenario in args.scenarios}
+    status = 0
+    for scenario in args.scenarios:
+        for pages in args.pages:
+            with tempfile.NamedTemporaryFile(suffix=".json") as report_file:
+                run_args = run.parse_args([
+                    "--documents", "1", "--concurrency", "1", "--pages", str(pages), "--lines", str(args.lines),
+                    "--latency", str(args.latency), "--jitter", str(args.jitter), "--json", report_file.name,
+                ] + SCENARIOS[scenario])
+                status = max(status, await run.main(run_args))
+                with open(report_file.name, encoding="utf-8") as f:
+                    reports[scenario].append(json.load(f))
+
+    print(f"\n{'scenario':<10}{'pages':>8}{'peak RSS MiB':>14}{'pages/s':>10}")
+    for scenario, runs in reports.items():
+        for pages, report in zip(args.pages, runs):
+            print(f"{scenario:<10}{pages:>8}{report['peak_rss_bytes'] / 1024 / 1024:>14.1f}"
+                  f"{report['pages_per_second']:>10.2f}")
+    if len(args.pages) > 1:
+        print()
+        added = args.pages[-1] - args.pages[0]
+        for scenario, runs in reports.items():
+            grown = runs[-1]["peak_rss_bytes"] - runs[0]["peak_rss_bytes"]
+            print(f"{scenario}: peak RSS grew {grown / 1024 / 1024:.1f} MiB for {added} more pages "
+                  f"({grown / 1024 / max(1, added):.1f} KiB per page)")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"window": args.window, "runs": reports}, f, indent=2)
+    return status
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the peak memory of documents of different lengths")
+    parser.add_argument("--pages", type=int, nargs="+", default=[200, 2000], help="Page counts to compare")
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS),
+                        help="Scenarios to run for every page count")
+    parser.add_argument("--lines", type=int, default=30, help="Lines of text per page")
+    parser.add_argument("--window", type=int, default=0, help="PIPELINE_WINDOW_PAGES of the app, its default if 0")
+    parser.add_argument("--latency", type=float, default=0.05, help="Fake model response time in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Random extra fake model response time")
+    parser.add_argument("--json", help="Also write the reports to this JSON file")
+    args = parser.parse_args(argv)
+    args.pages = sorted(args.pages)
+    return args
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(parse_args())))
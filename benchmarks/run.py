@@ -0,0 +1,443 @@
+"""End-to-end benchmark of the app against the fake model server, without network access.
+
+    python -m benchmarks.run --documents 8 --pages 50 --latency 0.5 --error-rate 0.05
+
+Generates synthetic PDFs, starts the fake model server and the app in a
+scratch directory, then uploads, translates and downloads every document
+with ``--concurrency`` clients at a time. Reports translated pages per
+second, p50/p95/p99 latencies per phase, the peak RSS of the server with
+its worker processes and the event loop lag measured inside the app.
+
+``--restart-at`` kills the app while the jobs run and starts it again, so
+they resume from their checkpoints, and ``--cold-pdf`` deletes the PDF
+exports the jobs rendered so the downloads render them again.
+"""
+import os
+import sys
+import glob
+import json
+import time
+import shutil
+import signal
+import socket
+import asyncio
+import argparse
+import tempfile
+import threading
+import subprocess
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import aiohttp
+
+from benchmarks.synthetic_pdf import make_pdf
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Seconds between the metric snapshots the app's workers share, short so the final scrape is complete
+METRICS_SHARE_INTERVAL = 1.0
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered) + 0.5)) - 1))]
+
+
+def histogram_quantile(q: float, buckets: List[tuple]) -> Optional[float]:
+    """Estimate a quantile from cumulative (upper bound, count) buckets like Prometheus does"""
+    if not buckets or buckets[-1][1] == 0:
+        return None
+    rank = q * buckets[-1][1]
+    previous_bound, previous_count = 0.0, 0
+    for bound, count in buckets:
+        if count >= rank:
+            if bound == float("inf"):
+                return previous_bound
+            if count == previous_count:
+                return bound
+            return previous_bound + (bound - previous_bound) * (rank - previous_count) / (count - previous_count)
+        previous_bound, previous_count = bound, count
+    return previous_bound
+
+
+def parse_metrics(text: str) -> Dict[str, List[tuple]]:
+    """Read the samples of a Prometheus text exposition into name -> [(labels, value)]"""
+    samples: Dict[str, List[tuple]] = {}
+    for line in text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        name_labels, value = line.rsplit(" ", 1)
+        labels = {}
+        if "{" in name_labels:
+            name, raw = name_labels[:-1].split("{", 1)
+            for pair in raw.split('",'):
+                key, _, val = pair.partition('="')
+                labels[key] = val.rstrip('"')
+        else:
+            name = name_labels
+        samples.setdefault(name, []).append((labels, float(value.replace("+Inf", "inf"))))
+    return samples
+
+
+class RssSampler(threading.Thread):
+    """Sample the summed RSS of a process and all of its descendants (Linux only)"""
+
+    def __init__(self, pid: int, interval: float = 0.2):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.peak = 0
+        self.stopped = threading.Event()
+
+    def _tree(self) -> List[int]:
+        parents: Dict[int, int] = {}
+        for entry in os.listdir("/proc"):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    # The command name may contain spaces, the fields after it do not
+                    fields = f.read().rsplit(")", 1)[1].split()
+                parents[int(entry)] = int(fields[1])
+            except (OSError, IndexError, ValueError):
+                continue
+        tree, frontier = [self.pid], [self.pid]
+        while frontier:
+            frontier = [pid for pid, parent in parents.items() if parent in frontier]
+            tree.extend(frontier)
+        return tree
+
+    @staticmethod
+    def _rss(pid: int) -> int:
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            pass
+        return 0
+
+    def run(self):
+        if not os.path.isdir("/proc"):
+            return
+        while not self.stopped.wait(self.interval):
+            self.peak = max(self.peak, sum(self._rss(pid) for pid in self._tree()))
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+async def wait_until_up(session: aiohttp.ClientSession, url: str, process: subprocess.Popen, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{url} exited with code {process.returncode}")
+        try:
+            async with session.get(url) as response:
+                if response.status < 500:
+                    return
+        except aiohttp.ClientError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+async def run_documents(args, base_url: str, documents: List[str], export_dir: str,
+                        restart: Optional[Callable[[], Awaitable[None]]] = None) -> Dict[str, Any]:
+    timings: Dict[str, List[float]] = {"upload": [], "translate": [], "download_md": [], "download_pdf": []}
+    failures: List[str] = []
+    pages = 0
+    semaphore = asyncio.Semaphore(args.concurrency)
+    timeout = aiohttp.ClientTimeout(total=None)
+
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        async def one(path: str):
+            nonlocal pages, restart
+            async with semaphore:
+                with open(path, "rb") as f:
+                    content = f.read()
+                started = time.perf_counter()
+                form = aiohttp.FormData()
+                form.add_field("file", content, filename=os.path.basename(path), content_type="application/pdf")
+                async with session.post(f"{base_url}/api/upload", data=form) as response:
+                    upload = await response.json()
+                    if response.status != 200:
+                        failures.append(f"upload {path}: {upload}")
+                        return
+                timings["upload"].append(time.perf_counter() - started)
+                file_id = upload["file_id"]
+
+                started = time.perf_counter()
+                form = aiohttp.FormData()
+                form.add_field("file_id", file_id)
+                for language in args.languages:
+                    form.add_field("target_languages", language)
+                form.add_field("stream", "true" if args.stream else "false")
+                async with session.post(f"{base_url}/api/translate", data=form) as response:
+                    job = await response.json()
+                    if response.status != 202:
+                        failures.append(f"translate {path}: {job}")
+                        return
+                while job["status"] not in ("completed", "failed"):
+                    await asyncio.sleep(args.poll_interval)
+                    if restart is not None and job["progress"] >= args.restart_at:
+                        # Only the first job to get there restarts the app, the others keep polling
+                        pending_restart, restart = restart, None
+                        await pending_restart()
+                    try:
+                        async with session.get(f"{base_url}{job['status_url']}") as response:
+                            job = await response.json()
+                    except aiohttp.ClientError:
+                        # The app is being restarted
+                        continue
+                if job["status"] == "failed":
+                    failures.append(f"job {job['job_id']}: {job['error']}")
+                    return
+                timings["translate"].append(time.perf_counter() - started)
+                pages += upload["total_pages"] * len(args.languages)
+                if args.cold_pdf:
+                    for export_path in glob.glob(os.path.join(glob.escape(export_dir), f"{file_id}_*.pdf")):
+                        os.remove(export_path)
+
+                for export_format in ("md", "pdf"):
+                    for language in args.languages:
+                        started = time.perf_counter()
+                        async with session.get(f"{base_url}/api/download/{file_id}",
+                                               params={"format": export_format, "target_language": language}) as response:
+                            await response.read()
+                            if response.status != 200:
+                                failures.append(f"download {export_format} {file_id}: {response.status}")
+                                continue
+                        timings[f"download_{export_format}"].append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*[one(path) for path in documents])
+        elapsed = time.perf_counter() - started
+
+        # The scraped worker reports the others from their last shared snapshot
+        if args.workers > 1:
+            await asyncio.sleep(METRICS_SHARE_INTERVAL * 1.5)
+        async with session.get(f"{base_url}/metrics") as response:
+            metrics = parse_metrics(await response.text())
+
+    return {"timings": timings, "failures": failures, "pages": pages, "elapsed": elapsed, "metrics": metrics}
+
+
+def summarize(args, result: Dict[str, Any], peak_rss: int, model_stats: Dict[str, Any]) -> Dict[str, Any]:
+    metrics = result["metrics"]
+    lag_buckets = [
+        (float(labels["le"]), value) for labels, value in metrics.get("pdf_translator_event_loop_lag_seconds_bucket", [])
+    ]
+    lag_count = sum(value for _, value in metrics.get("pdf_translator_event_loop_lag_seconds_count", []))
+    lag_sum = sum(value for _, value in metrics.get("pdf_translator_event_loop_lag_seconds_sum", []))
+    stage_seconds = {
+        labels["stage"]: value for labels, value in metrics.get("pdf_translator_stage_seconds_sum", [])
+    }
+
+    def metric_total(name):
+        return sum(value for _, value in metrics.get(name, []))
+
+    return {
+        "config": {
+            "documents": args.documents, "pages": args.pages, "lines": args.lines, "languages": args.languages,
+            "concurrency": args.concurrency, "workers": args.workers, "stream": args.stream,
+            "latency": args.latency, "jitter": args.jitter, "error_rate": args.error_rate,
+            "slow_rate": args.slow_rate, "slow_latency": args.slow_latency, "hedge": args.hedge,
+            "restart_at": args.restart_at, "cold_pdf": args.cold_pdf,
+        },
+        "elapsed_seconds": result["elapsed"],
+        "translated_pages": result["pages"],
+        "pages_per_second": result["pages"] / result["elapsed"] if result["elapsed"] else 0.0,
+        "latency_seconds": {
+            phase: {
+                "count": len(values),
+                "p50": percentile(values, 50),
+                "p95": percentile(values, 95),
+                "p99": percentile(values, 99),
+                "max": max(values) if values else None,
+            }
+            for phase, values in result["timings"].items()
+        },
+        "peak_rss_bytes": peak_rss,
+        "event_loop_lag_seconds": {
+            "mean": lag_sum / lag_count if lag_count else None,
+            "p50": histogram_quantile(0.50, lag_buckets),
+            "p95": histogram_quantile(0.95, lag_buckets),
+            "p99": histogram_quantile(0.99, lag_buckets),
+        },
+        "stage_seconds_total": stage_seconds,
+        "model": {
+            "requests": metric_total("pdf_translator_model_requests_total"),
+            "retries": metric_total("pdf_translator_model_retries_total"),
+            "throttled": metric_total("pdf_translator_model_throttled_total"),
+            "failures": metric_total("pdf_translator_model_failures_total"),
+            "hedges": metric_total("pdf_translator_model_hedges_total"),
+            "hedges_won": metric_total("pdf_translator_model_hedges_won_total"),
+            "prompt_tokens": metric_total("pdf_translator_prompt_tokens_total"),
+            "completion_tokens": metric_total("pdf_translator_completion_tokens_total"),
+            "server": model_stats,
+        },
+        "failures": result["failures"],
+    }
+
+
+def print_report(report: Dict[str, Any]):
+    def ms(value):
+        return f"{value * 1000:9.1f}" if value is not None else "      n/a"
+
+    config = report["config"]
+    print(f"\n{config['documents']} documents x {config['pages']} pages, languages {', '.join(config['languages'])}, "
+          f"{config['concurrency']} clients, {config['workers']} worker(s), model latency {config['latency']}s")
+    print(f"Translated {report['translated_pages']} pages in {report['elapsed_seconds']:.1f}s: "
+          f"{report['pages_per_second']:.2f} pages/s")
+    print(f"\n{'phase':<14}{'count':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for phase, stats in report["latency_seconds"].items():
+        print(f"{phase:<14}{stats['count']:>6}{ms(stats['p50'])} {ms(stats['p95'])} {ms(stats['p99'])} {ms(stats['max'])}")
+    lag = report["event_loop_lag_seconds"]
+    print(f"\nEvent loop lag  mean {ms(lag['mean']).strip()} ms, p50 {ms(lag['p50']).strip()} ms, "
+          f"p95 {ms(lag['p95']).strip()} ms, p99 {ms(lag['p99']).strip()} ms")
+    print(f"Peak RSS        {report['peak_rss_bytes'] / 1024 / 1024:.1f} MiB (server and its worker processes)")
+    model = report["model"]
+    print(f"Model requests  {model['requests']:.0f} sent, {model['retries']:.0f} retried, "
+          f"{model['throttled']:.0f} throttled, {model['failures']:.0f} failed; "
+          f"{model['prompt_tokens']:.0f} prompt / {model['completion_tokens']:.0f} completion tokens")
+    if report["config"]["hedge"]:
+        print(f"Hedged requests {model['hedges']:.0f} sent, {model['hedges_won']:.0f} answered first")
+    print("Stage seconds   " + ", ".join(f"{stage} {seconds:.2f}" for stage, seconds in report["stage_seconds_total"].items()))
+    if report["failures"]:
+        print(f"\n{len(report['failures'])} failures:")
+        for failure in report["failures"][:10]:
+            print(f"  {failure}")
+
+
+async def main(args) -> int:
+    workdir = tempfile.mkdtemp(prefix="pdf-translator-bench-")
+    processes: List[subprocess.Popen] = []
+    try:
+        # The app serves app/static and app/templates relative to its working directory
+        os.symlink(os.path.join(REPO_DIR, "app"), os.path.join(workdir, "app"))
+        input_dir = os.path.join(workdir, "input")
+        os.makedirs(input_dir)
+        documents = []
+        for i in range(args.documents):
+            path = os.path.join(input_dir, f"doc{i}.pdf")
+            make_pdf(path, args.pages, args.lines, args.words, seed=f"{args.seed}-{i}")
+            documents.append(path)
+
+        model_port = args.model_port or free_port()
+        app_port = args.port or free_port()
+        logs = open(os.path.join(workdir, "server.log"), "w")
+        processes.append(subprocess.Popen(
+            [sys.executable, "-m", "benchmarks.fake_model_server", "--port", str(model_port),
+             "--latency", str(args.latency), "--jitter", str(args.jitter), "--error-rate", str(args.error_rate),
+             "--server-error-rate", str(args.server_error_rate), "--retry-after", str(args.retry_after),
+             "--slow-rate", str(args.slow_rate), "--slow-latency", str(args.slow_latency)],
+            cwd=REPO_DIR, stdout=logs, stderr=subprocess.STDOUT
+        ))
+        env = dict(os.environ, OPENAI_API_KEY="sk-benchmark", OPENAI_API_BASE=f"http://127.0.0.1:{model_port}/v1",
+                   METRICS_SHARE_INTERVAL=str(METRICS_SHARE_INTERVAL))
+        if args.workers > 1:
+            env.setdefault("STATE_BACKEND", "sqlite")
+        if args.hedge:
+            env["HEDGE_REQUESTS"] = "1"
+
+        def start_app() -> subprocess.Popen:
+            # A session of its own, so a restart can kill the render workers along with the app
+            process = subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(app_port),
+                 "--workers", str(args.workers), "--log-level", "warning"],
+                cwd=workdir, env=env, stdout=logs, stderr=subprocess.STDOUT, start_new_session=True
+            )
+            processes.append(process)
+            return process
+
+        app_process = start_app()
+        base_url = f"http://127.0.0.1:{app_port}"
+        async with aiohttp.ClientSession() as session:
+            await wait_until_up(session, f"http://127.0.0.1:{model_port}/stats", processes[0])
+            await wait_until_up(session, f"{base_url}/api/status", app_process)
+
+        sampler = RssSampler(app_process.pid)
+
+        async def restart():
+            # Killed like a crash, the jobs resume from their checkpoints on the next start
+            os.killpg(app_process.pid, signal.SIGKILL)
+            app_process.wait()
+            process = start_app()
+            sampler.pid = process.pid
+            async with aiohttp.ClientSession() as session:
+                await wait_until_up(session, f"{base_url}/api/status", process)
+
+        sampler.start()
+        try:
+            result = await run_documents(
+                args, base_url, documents, os.path.join(workdir, "exports"), restart if args.restart_at else None
+            )
+        finally:
+            sampler.stop()
+        async with aiohttp.ClientSession() as session:
+            async with session.get(f"http://127.0.0.1:{model_port}/stats") as response:
+                model_stats = await response.json()
+
+        report = summarize(args, result, sampler.peak, model_stats)
+        print_report(report)
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+        if args.keep:
+            print(f"\nScratch directory kept at {workdir}")
+        return 1 if report["failures"] else 0
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark upload, translation and download end to end")
+    parser.add_argument("--documents", type=int, default=4, help="Synthetic PDFs to process")
+    parser.add_argument("--pages", type=int, default=20, help="Pages per PDF")
+    parser.add_argument("--lines", type=int, default=30, help="Lines of text per page")
+    parser.add_argument("--words", type=int, default=12, help="Words per line")
+    parser.add_argument("--seed", default="bench", help="Changes the generated text, and so the cache keys")
+    parser.add_argument("--languages", nargs="+", default=["French"], help="Target languages of every job")
+    parser.add_argument("--stream", action="store_true", help="Translate with streamed responses")
+    parser.add_argument("--concurrency", type=int, default=4, help="Documents processed at the same time")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--latency", type=float, default=0.5, help="Fake model response time in seconds")
+    parser.add_argument("--jitter", type=float, default=0.2, help="Random extra fake model response time")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of model requests answered with 429")
+    parser.add_argument("--server-error-rate", type=float, default=0.0, help="Share answered with 500")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="Share of fake model responses that are much slower")
+    parser.add_argument("--slow-latency", type=float, default=5.0, help="Extra seconds of the slow responses")
+    parser.add_argument("--hedge", action="store_true", help="Send duplicates of slow model requests (HEDGE_REQUESTS)")
+    parser.add_argument("--retry-after", type=float, default=0.5, help="Retry-After of the fake 429 responses")
+    parser.add_argument("--restart-at", type=float, default=0,
+                        help="Kill and restart the app once a job passed this progress in percent, 0 never")
+    parser.add_argument("--cold-pdf", action="store_true",
+                        help="Delete the PDF exports rendered by the jobs so the downloads render them again")
+    parser.add_argument("--poll-interval", type=float, default=0.2, help="Seconds between job status polls")
+    parser.add_argument("--port", type=int, default=0, help="Port of the app, a free one by default")
+    parser.add_argument("--model-port", type=int, default=0, help="Port of the fake model server")
+    parser.add_argument("--json", help="Also write the report to this JSON file")
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch directory with data and logs")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(parse_args())))
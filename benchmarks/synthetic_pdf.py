@@ -0,0 +1,51 @@
+"""Generate synthetic PDFs for the benchmarks.
+
+    python -m benchmarks.synthetic_pdf out.pdf --pages 200 --lines 40
+"""
+import random
+import argparse
+
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfgen import canvas
+
+WORDS = (
+    "report revenue quarter market customer product service contract annual growth risk policy "
+    "employee operation strategy investment board meeting review result forecast budget analysis "
+    "region supplier delivery quality safety compliance audit account balance statement period"
+).split()
+
+
+def make_pdf(path: str, pages: int, lines: int = 30, words: int = 12, seed: str = "",
+             boilerplate: bool = True):
+    """Write a PDF of ``pages`` pages with ``lines`` lines of ``words`` random words each.
+
+    Text depends on ``seed``, so documents with different seeds never share
+    translations in the cache. With ``boilerplate`` every page gets the same
+    header and footer, like most real reports.
+    """
+    rng = random.Random(f"{seed}:{pages}:{lines}:{words}")
+    pdf = canvas.Canvas(path, pagesize=letter)
+    width, height = letter
+    line_height = max(6, min(14, (height - 144) / max(1, lines)))
+    pdf.setFont("Helvetica", min(10, line_height - 2))
+    for page in range(pages):
+        if boilerplate:
+            pdf.drawString(72, height - 48, "Synthetic Corp - Confidential Benchmark Report")
+            pdf.drawString(72, 36, "Copyright Synthetic Corp. All rights reserved.")
+        for line in range(lines):
+            text = " ".join(rng.choice(WORDS) for _ in range(words))
+            pdf.drawString(72, height - 72 - line * line_height, f"{page + 1}.{line + 1} {text}")
+        pdf.showPage()
+    pdf.save()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic PDF")
+    parser.add_argument("path")
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--lines", type=int, default=30, help="Lines of text per page")
+    parser.add_argument("--words", type=int, default=12, help="Words per line")
+    parser.add_argument("--seed", default="")
+    parser.add_argument("--no-boilerplate", action="store_true", help="Leave out the repeated header and footer")
+    args = parser.parse_args()
+    make_pdf(args.path, args.pages, args.lines, args.words, args.seed, not args.no_boilerplate)
@@ -2,5 +2,11 @@
 # Create necessary directories
 mkdir -p uploads exports
 
+# Several workers have to share their state through SQLite instead of process memory
+WORKERS=${WEB_CONCURRENCY:-1}
+if [ "$WORKERS" -gt 1 ]; then
+    export STATE_BACKEND=${STATE_BACKEND:-sqlite}
+fi
+
 # Start the application
-uvicorn app.main:app --host 0.0.0.0 --port ${PORT:-8000}
+uvicorn app.main:app --host 0.0.0.0 --port ${PORT:-8000} --workers $WORKERS
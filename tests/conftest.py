@@ -0,0 +1,54 @@
+import os
+import sys
+import importlib
+import socket
+import subprocess
+from contextlib import asynccontextmanager
+
+import pytest
+
+# The tests import the app package from the repository root, wherever pytest is started
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="module")
+def router(tmp_path_factory):
+    """The API router, with the uploads, exports and stores it keeps in the working directory in a temporary one"""
+    with pytest.MonkeyPatch.context() as patch:
+        patch.chdir(tmp_path_factory.mktemp("server"))
+        yield importlib.import_module("app.routers.pdf_router")
+
+
+@pytest.fixture
+def dead_owner():
+    """Node id of a worker process on this host that has exited"""
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return f"{socket.gethostname()}:{process.pid}:deadbeef"
+
+
+@pytest.fixture
+def fake_model_server(monkeypatch):
+    """Serve ``benchmarks.fake_model_server`` on a free port from inside the running event loop.
+
+    ``async with fake_model_server(latency=0.01) as url`` yields the server's
+    root URL, the API is under ``url + "/v1"`` and its counters under
+    ``url + "/stats"``.
+    """
+    from aiohttp import web
+    from benchmarks.fake_model_server import make_app
+
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+
+    @asynccontextmanager
+    async def serve(**options):
+        runner = web.AppRunner(make_app(**options))
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        try:
+            yield f"http://127.0.0.1:{runner.addresses[0][1]}"
+        finally:
+            await runner.cleanup()
+
+    return serve
@@ -0,0 +1,133 @@
+import os
+import hashlib
+import zipfile
+
+import pytest
+from fastapi import HTTPException
+
+from app.batches import BatchStore, batch_status, expand_zip, summarize_batch
+
+
+def make_zip(path, members):
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, data in members.items():
+            archive.writestr(name, data)
+    return str(path)
+
+
+def test_every_pdf_of_an_archive_is_copied_with_its_hash(tmp_path):
+    upload_dir = tmp_path / "uploads"
+    upload_dir.mkdir()
+    path = make_zip(tmp_path / "batch.zip", {
+        "reports/a.pdf": b"%PDF a",
+        "B.PDF": b"%PDF b",
+        "notes.txt": b"not a pdf",
+        "__MACOSX/reports/._a.pdf": b"resource fork",
+        "empty/": b"",
+    })
+
+    files = expand_zip(path, str(upload_dir), max_size=1024, max_documents=10)
+    assert [entry["filename"] for entry in files] == ["a.pdf", "B.PDF"]
+    for entry, data in zip(files, (b"%PDF a", b"%PDF b")):
+        assert entry["size"] == len(data)
+        assert entry["sha256"] == hashlib.sha256(data).hexdigest()
+        with open(entry["path"], "rb") as f:
+            assert f.read() == data
+    assert len(os.listdir(upload_dir)) == 2
+
+
+@pytest.mark.parametrize("max_size, max_documents, status", [(1024, 1, 413), (10, 10, 413)])
+def test_an_archive_over_the_limits_is_rejected_and_cleaned_up(tmp_path, max_size, max_documents, status):
+    upload_dir = tmp_path / "uploads"
+    upload_dir.mkdir()
+    # Compresses to a few bytes, the size is only known once it is decompressed
+    path = make_zip(tmp_path / "batch.zip", {"a.pdf": b"%PDF", "b.pdf": b"0" * 10_000})
+
+    with pytest.raises(HTTPException) as error:
+        expand_zip(path, str(upload_dir), max_size=max_size, max_documents=max_documents)
+    assert error.value.status_code == status
+    assert os.listdir(upload_dir) == []
+
+
+def test_a_corrupt_archive_is_a_bad_request(tmp_path):
+    path = tmp_path / "batch.zip"
+    path.write_bytes(b"PK\x03\x04 not really a zip")
+    with pytest.raises(HTTPException) as error:
+        expand_zip(str(path), str(tmp_path), max_size=1024, max_documents=10)
+    assert error.value.status_code == 400
+
+
+def test_batches_are_stored_by_uuid(tmp_path):
+    store = BatchStore(str(tmp_path))
+    batch = store.create(["French"], [{"file_id": "a", "filename": "a.pdf", "job_id": "j1"}])
+    assert BatchStore(str(tmp_path)).get(batch["batch_id"]) == batch
+    assert store.get("../../etc/passwd") is None
+    assert store.get("00000000-0000-0000-0000-000000000000") is None
+
+
+@pytest.mark.parametrize("statuses, expected", [
+    (["completed", "running"], "running"),
+    (["completed", "completed"], "completed"),
+    (["completed", "failed"], "partially_failed"),
+    (["failed", "failed"], "failed"),
+    ([], "completed"),
+])
+def test_batch_status(statuses, expected):
+    assert batch_status(statuses) == expected
+
+
+def test_batch_progress_is_the_mean_of_its_documents():
+    batch = {
+        "batch_id": "b",
+        "target_languages": ["French"],
+        "created_at": 0,
+        "documents": [
+            {"file_id": "a", "filename": "a.pdf", "job_id": "j1"},
+            {"file_id": "b", "filename": "b.pdf", "job_id": "j2"},
+            {"file_id": "c", "filename": "c.pdf", "job_id": "j3"},
+        ],
+    }
+    jobs = {
+        "j1": {"status": "completed", "progress": 100, "completed_pages": 10, "total_pages": 10, "error": None},
+        "j2": {"status": "running", "progress": 50, "completed_pages": 1, "total_pages": None, "error": None},
+        "j3": None,
+    }
+
+    summary = summarize_batch(batch, jobs)
+    assert summary["status"] == "running"
+    assert summary["progress"] == 50
+    assert (summary["completed_documents"], summary["failed_documents"], summary["total_documents"]) == (1, 1, 3)
+    assert summary["completed_pages"] == 11
+    # Not every document has been extracted yet
+    assert summary["total_pages"] is None
+    assert summary["documents"][2]["error"] == "Job not found"
+
+
+def test_languages_of_a_document_are_read_from_the_job_translating_each():
+    batch = {
+        "batch_id": "b",
+        "target_languages": ["French", "German"],
+        "created_at": 0,
+        "documents": [
+            # French was already being translated by another job when the batch started
+            {"file_id": "a", "filename": "a.pdf", "jobs": {"French": "earlier", "German": "batch"}},
+            # Recorded before documents had a job per language
+            {"file_id": "b", "filename": "b.pdf", "job_id": "old"},
+        ],
+    }
+    jobs = {
+        "earlier": {"status": "completed", "progress": 100, "completed_pages": 4, "total_pages": 4,
+                    "target_languages": ["French"], "error": None},
+        "batch": {"status": "running", "progress": 50, "completed_pages": 2, "total_pages": 4,
+                  "target_languages": ["German"], "languages": {"German": {"progress": 50, "completed_pages": 2, "total_pages": 4}},
+                  "error": None},
+        "old": {"status": "completed", "progress": 100, "completed_pages": 6, "total_pages": 6,
+                "target_languages": ["French", "German"], "error": None},
+    }
+
+    summary = summarize_batch(batch, jobs)
+    first, second = summary["documents"]
+    assert (first["status"], first["progress"], first["completed_pages"], first["total_pages"]) == ("running", 75, 6, 8)
+    assert (second["status"], second["progress"], second["completed_pages"], second["total_pages"]) == ("completed", 100, 6, 6)
+    assert summary["status"] == "running"
+    assert summary["total_pages"] == 14
@@ -0,0 +1,89 @@
+import random
+
+from app.chunking import (
+    PackedStreamSplitter, estimate_tokens, pack_texts, plan_requests, split_text, unpack_texts
+)
+
+TEXTS = ["First text.\nSecond line.", "", "Third\n\nwith a paragraph", "  padded  \n"]
+
+
+def test_split_text_keeps_short_text_whole():
+    assert split_text("Short text.", budget=100) == ["Short text."]
+
+
+def test_split_text_rejoins_to_the_original_under_budget():
+    paragraph = "A sentence of several words. Another one follows it here!\n"
+    text = "\n".join(paragraph * 3 for _ in range(10))
+    parts = split_text(text, budget=40)
+    assert len(parts) > 1
+    assert "".join(parts) == text
+    assert all(estimate_tokens(part) <= 40 for part in parts)
+
+
+def test_split_text_cuts_text_without_boundaries():
+    text = "x" * 100
+    parts = split_text(text, budget=5)
+    assert "".join(parts) == text
+    assert all(len(part) <= 20 for part in parts)
+
+
+def test_plan_requests_rebuilds_every_text():
+    texts = ["word " * 200, "short", "another short one"]
+    plan = plan_requests(texts, budget=50)
+    assert sorted(part_id for request in plan["requests"] for part_id in request) == list(range(len(plan["parts"])))
+    for text, part_ids in zip(texts, plan["parts_by_text"]):
+        assert "".join(plan["parts"][part_id] for part_id in part_ids) == text
+    # The two short texts share a request
+    assert plan["parts_by_text"][1][0] in plan["requests"][-1]
+    assert plan["parts_by_text"][2][0] in plan["requests"][-1]
+
+
+def test_pack_and_unpack_round_trip():
+    assert unpack_texts(pack_texts(TEXTS), len(TEXTS)) == TEXTS
+
+
+def test_unpack_rejects_lost_or_extra_markers():
+    packed = pack_texts(TEXTS)
+    assert unpack_texts(packed, len(TEXTS) + 1) is None
+    assert unpack_texts(packed.replace("<<<SEGMENT 2>>>", ""), len(TEXTS)) is None
+    assert unpack_texts("Preamble\n" + packed, len(TEXTS)) is None
+
+
+
+def split_stream(packed, count, sizes):
+    splitter = PackedStreamSplitter(count)
+    texts = [""] * count
+    position = 0
+    for size in sizes:
+        for index, delta in splitter.feed(packed[position:position + size]):
+            texts[index] += delta
+        position += size
+    for index, delta in splitter.flush():
+        texts[index] += delta
+    return texts
+
+
+def test_stream_splitter_matches_unpack_for_any_chunking():
+    packed = pack_texts(TEXTS)
+    expected = unpack_texts(packed, len(TEXTS))
+    rng = random.Random(0)
+    for _ in range(50):
+        sizes = [rng.randint(1, 12) for _ in range(len(packed))]
+        assert split_stream(packed, len(TEXTS), sizes) == expected
+    assert split_stream(packed, len(TEXTS), [1] * len(packed)) == expected
+
+
+def test_stream_splitter_holds_back_a_possible_marker():
+    splitter = PackedStreamSplitter(2)
+    assert splitter.feed("<<<SEGMENT 1>>>\nHello\n<<<SEG") == [(0, "Hello")]
+    assert splitter.feed("MENT 2>>>\nWorld") == [(1, "World")]
+    assert splitter.flush() == []
+
+
+def test_stream_splitter_ignores_a_marker_in_the_middle_of_a_line():
+    packed = "<<<SEGMENT 1>>>\nsee <<<SEGMENT 2>>>\nfor details"
+    expected = unpack_texts(packed, 1)
+    assert expected == ["see <<<SEGMENT 2>>>\nfor details"]
+    # Split right before the marker, the line it continues was already passed on
+    assert split_stream(packed, 1, [20, len(packed)]) == expected
+    assert split_stream(packed, 1, [1] * len(packed)) == expected
@@ -0,0 +1,131 @@
+import os
+import time
+import asyncio
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfgen import canvas
+
+from app import extraction
+from app.extraction import PageTimeout, iter_page_windows, iter_pages
+
+
+@pytest.fixture(autouse=True)
+def extraction_pool():
+    yield
+    extraction.close_extraction_pool()
+
+
+def make_pdf(path, count):
+    pdf = canvas.Canvas(str(path), pagesize=letter)
+    for n in range(1, count + 1):
+        pdf.drawString(72, 720, f"Text of page {n}")
+        pdf.showPage()
+    pdf.save()
+    return str(path)
+
+
+def crash_once(marker):
+    # Kills its worker the first time, like a worker running out of memory, and succeeds when run again
+    if not os.path.exists(marker):
+        open(marker, "w").close()
+        os._exit(1)
+    return "done"
+
+
+def test_pages_are_extracted_in_order_across_chunks(tmp_path):
+    path = make_pdf(tmp_path / "doc.pdf", 7)
+
+    async def main():
+        return [page async for page in iter_pages(path, chunk_pages=2)]
+
+    pages = asyncio.run(main())
+    assert [page["page_number"] for page in pages] == list(range(1, 8))
+    assert all(page["content"].strip() == f"Text of page {page['page_number']}" for page in pages)
+    assert not any("error" in page for page in pages)
+
+
+def test_long_pdfs_are_extracted_in_bounded_chunks_a_few_at_a_time(tmp_path, monkeypatch):
+    path = make_pdf(tmp_path / "doc.pdf", 40)
+    monkeypatch.setattr(extraction, "EXTRACTION_MAX_CHUNK_PAGES", 3)
+    chunks = []
+    run_in_pool = extraction._run_in_pool
+
+    async def recording_run_in_pool(function, *args):
+        if function is extraction._extract_range:
+            chunks.append(args[2] - args[1])
+        return await run_in_pool(function, *args)
+
+    monkeypatch.setattr(extraction, "_run_in_pool", recording_run_in_pool)
+
+    async def main():
+        pages = iter_pages(path, chunk_pages=1)
+        first = await pages.__anext__()
+        # Only two chunks per worker are extracted ahead of the consumer
+        started = len(chunks)
+        rest = [page async for page in pages]
+        return started, [first] + rest
+
+    started, pages = asyncio.run(main())
+    assert max(chunks) == 3
+    assert started <= extraction.EXTRACTION_WORKERS * 2 + 1
+    assert [page["page_number"] for page in pages] == list(range(1, 41))
+
+
+def test_pages_are_grouped_in_windows(tmp_path):
+    path = make_pdf(tmp_path / "doc.pdf", 7)
+
+    async def main():
+        return [[page["page_number"] for page in window] async for window in iter_page_windows(path, 3)]
+
+    assert asyncio.run(main()) == [[1, 2, 3], [4, 5, 6], [7]]
+
+
+def test_time_limit_interrupts_a_stuck_parser():
+    started = time.monotonic()
+    with pytest.raises(PageTimeout):
+        with extraction._time_limit(0.05):
+            time.sleep(2)
+    assert time.monotonic() - started < 1
+
+
+def slow_reader(*args, **kwargs):
+    time.sleep(2)
+
+
+def test_reading_the_pdf_is_timed_out(tmp_path, monkeypatch):
+    path = make_pdf(tmp_path / "doc.pdf", 3)
+    monkeypatch.setattr("PyPDF2.PdfReader", slow_reader)
+
+    pages = extraction._extract_range(path, 0, 3, 0.05)
+    assert [page["page_number"] for page in pages] == [1, 2, 3]
+    assert all(page["content"] == "" and "timed out" in page["error"] for page in pages)
+
+    with pytest.raises(PageTimeout, match="page count timed out"):
+        extraction._count_pages(path, 0.05)
+
+
+def test_a_broken_pool_is_replaced_and_the_task_run_again(tmp_path):
+    marker = str(tmp_path / "crashed")
+
+    async def main():
+        return await asyncio.gather(
+            extraction._run_in_pool(crash_once, marker),
+            extraction._run_in_pool(os.getpid),
+        )
+
+    result, pid = asyncio.run(main())
+    assert result == "done"
+    assert pid != os.getpid()
+    assert os.path.exists(marker)
+
+
+def test_a_task_that_keeps_killing_its_worker_fails():
+    async def main():
+        await extraction._run_in_pool(os._exit, 1)
+
+    with pytest.raises(BrokenProcessPool):
+        asyncio.run(main())
+    # The next task gets a working pool
+    assert asyncio.run(extraction._run_in_pool(os.getpid)) != os.getpid()
@@ -0,0 +1,255 @@
+import json
+import asyncio
+
+import pytest
+
+from app import jobs
+from app.jobs import CheckpointWriter, JobBusyError, JobManager
+from app.state import SQLiteBackend
+
+
+def read_lines(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_checkpoint_writer_saves_a_burst_of_pages_in_order(tmp_path):
+    async def main():
+        writer = CheckpointWriter(str(tmp_path))
+        for n in range(1, 6):
+            writer.add({"page_number": n, "content": f"page {n}"}, {"job_id": "job", "completed_pages": n})
+        await writer.flush()
+
+    asyncio.run(main())
+    assert [page["page_number"] for page in read_lines(tmp_path / "pages.jsonl")] == [1, 2, 3, 4, 5]
+    # job.json holds the state of the last page added
+    assert json.loads((tmp_path / "job.json").read_text())["completed_pages"] == 5
+    assert not (tmp_path / "job.json.tmp").exists()
+
+
+def test_checkpoint_writer_discard_drops_queued_pages(tmp_path):
+    async def main():
+        writer = CheckpointWriter(str(tmp_path))
+        writer.add({"page_number": 1, "content": "one"}, {"job_id": "job"})
+        writer.discard()
+        await asyncio.sleep(0.05)
+
+    asyncio.run(main())
+    assert not (tmp_path / "pages.jsonl").exists()
+
+
+def test_job_checkpoints_every_page_and_completes(tmp_path):
+    async def runner(job, completed_pages, checkpoint):
+        for completed, n in enumerate((2, 1, 3), start=1):
+            checkpoint({"page_number": n, "content": f"page {n}"}, completed, 3)
+        return {"pages": 3}
+
+    async def main():
+        manager = JobManager(runner, jobs_dir=str(tmp_path))
+        job = manager.create("doc", ["French"])
+        assert job["status"] == "queued"
+        await asyncio.gather(*manager.tasks.values())
+        return job
+
+    job = asyncio.run(main())
+    assert job["status"] == "completed"
+    assert job["result"] == {"pages": 3}
+    assert (job["progress"], job["completed_pages"], job["total_pages"]) == (100, 3, 3)
+    job_dir = tmp_path / job["job_id"]
+    assert json.loads((job_dir / "job.json").read_text())["status"] == "completed"
+    assert [page["page_number"] for page in read_lines(job_dir / "pages.jsonl")] == [2, 1, 3]
+
+
+def test_failed_job_records_its_error(tmp_path):
+    async def runner(job, completed_pages, checkpoint):
+        raise RuntimeError("model unavailable")
+
+    async def main():
+        manager = JobManager(runner, jobs_dir=str(tmp_path))
+        job = manager.create("doc", ["French"])
+        await asyncio.gather(*manager.tasks.values())
+        # A second manager reads the job back from disk
+        return JobManager(runner, jobs_dir=str(tmp_path)).get(job["job_id"])
+
+    job = asyncio.run(main())
+    assert job["status"] == "failed"
+    assert job["error"] == "model unavailable"
+
+
+def test_interrupted_job_resumes_after_its_checkpoint(tmp_path):
+    async def main():
+        first_pages_done = asyncio.Event()
+
+        async def interrupted(job, completed_pages, checkpoint):
+            checkpoint({"page_number": 1, "content": "un", "language": "French"}, 1, 6)
+            checkpoint({"page_number": 2, "content": "eins", "language": "German"}, 2, 6)
+            first_pages_done.set()
+            await asyncio.sleep(10)
+
+        manager = JobManager(interrupted, jobs_dir=str(tmp_path))
+        job = manager.create("doc", ["French", "German"])
+        assert manager.find_active("doc", "german") is job
+        assert manager.find_active("doc", "Spanish") is None
+        await first_pages_done.wait()
+        # Let the checkpoint reach the disk before the process "stops"
+        await asyncio.sleep(0.05)
+        await manager.shutdown()
+        return job["job_id"]
+
+    job_id = asyncio.run(main())
+    with open(tmp_path / job_id / "pages.jsonl", "a", encoding="utf-8") as f:
+        # Written before jobs had several languages, it belongs to the first one
+        f.write('{"page_number": 3, "content": "trois"}\n')
+        # The last line was torn by a crash mid-write
+        f.write('{"page_number": 2, "cont')
+
+    resumed_with = {}
+
+    async def resumed(job, completed_pages, checkpoint):
+        for language in job["target_languages"]:
+            resumed_with[language] = completed_pages.load(language, 1, 6)
+        return {}
+
+    async def restart():
+        manager = JobManager(resumed, jobs_dir=str(tmp_path))
+        assert manager.resume_incomplete() == [job_id]
+        await asyncio.gather(*manager.tasks.values())
+        return manager.get(job_id)
+
+    job = asyncio.run(restart())
+    assert resumed_with == {"French": {1: "un", 3: "trois"}, "German": {2: "eins"}}
+    assert job["status"] == "completed"
+
+
+def test_the_job_of_a_dead_worker_is_resumed_by_another(tmp_path, dead_owner):
+    path = str(tmp_path / "state.sqlite3")
+    jobs_dir = str(tmp_path / "jobs")
+
+    async def stuck(job, completed_pages, checkpoint):
+        await asyncio.sleep(10)
+
+    async def finish(job, completed_pages, checkpoint):
+        return {"resumed": True}
+
+    async def main():
+        dead_state = SQLiteBackend(path)
+        dead_state.node_id = dead_owner
+        dead = JobManager(stuck, jobs_dir=jobs_dir, state=dead_state, lease_ttl=3600)
+        job = dead.create("doc", ["French"])
+        await asyncio.sleep(0)
+
+        alive = JobManager(finish, jobs_dir=jobs_dir, state=SQLiteBackend(path), lease_ttl=3600)
+        assert alive.active_file_ids() == ["doc"]
+        # The lease has not expired, but its holder is gone
+        assert alive._resume(sorted(alive._active_index()), indexed=True) == [job["job_id"]]
+        await asyncio.gather(*alive.tasks.values())
+        for task in dead.tasks.values():
+            task.cancel()
+        return alive.get(job["job_id"]), alive.active_file_ids()
+
+    job, active = asyncio.run(main())
+    assert job["status"] == "completed"
+    assert job["result"] == {"resumed": True}
+    assert active == []
+
+
+def test_overlapping_requests_share_languages(tmp_path):
+    writers = {}
+    peak = {}
+
+    async def main():
+        release = asyncio.Event()
+
+        async def runner(job, completed_pages, checkpoint):
+            # Stands in for translate_pdf, which opens one export per language
+            keys = [(job["file_id"], language.lower()) for language in job["target_languages"]]
+            for key in keys:
+                writers[key] = writers.get(key, 0) + 1
+                peak[key] = max(peak.get(key, 0), writers[key])
+            try:
+                await release.wait()
+            finally:
+                for key in keys:
+                    writers[key] -= 1
+            return {}
+
+        manager = JobManager(runner, jobs_dir=str(tmp_path))
+        first, attached, jobs = await manager.create_or_attach("doc", ["French"])
+        assert not attached
+        assert jobs == {"French": first["job_id"]}
+
+        second, attached, jobs = await manager.create_or_attach("doc", ["french", "German"])
+        assert not attached
+        assert second["target_languages"] == ["German"]
+        assert jobs == {"french": first["job_id"], "German": second["job_id"]}
+
+        third, attached, jobs = await manager.create_or_attach("doc", ["German", "French"])
+        assert attached
+        assert third["job_id"] == second["job_id"]
+        assert jobs == {"German": second["job_id"], "French": first["job_id"]}
+
+        await asyncio.sleep(0.05)
+        release.set()
+        await asyncio.gather(*manager.tasks.values())
+
+    asyncio.run(main())
+    assert peak == {("doc", "french"): 1, ("doc", "german"): 1}
+
+
+def test_other_files_get_their_own_job(tmp_path):
+    async def runner(job, completed_pages, checkpoint):
+        return {}
+
+    async def main():
+        manager = JobManager(runner, jobs_dir=str(tmp_path))
+        first, _, _ = await manager.create_or_attach("a", ["French"])
+        second, attached, _ = await manager.create_or_attach("b", ["French"])
+        assert not attached
+        assert second["job_id"] != first["job_id"]
+        await asyncio.gather(*manager.tasks.values())
+
+    asyncio.run(main())
+
+
+def test_a_job_is_not_created_while_another_worker_creates_one(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, "CREATE_LEASE_ATTEMPTS", 2)
+    path = str(tmp_path / "state.sqlite3")
+
+    async def runner(job, completed_pages, checkpoint):
+        return {}
+
+    async def main():
+        other = SQLiteBackend(path)
+        assert other.acquire_lease("create:doc", 30)
+        manager = JobManager(runner, jobs_dir=str(tmp_path / "jobs"), state=SQLiteBackend(path))
+        with pytest.raises(JobBusyError):
+            await manager.create_or_attach("doc", ["French"])
+        assert manager.tasks == {}
+        other.release_lease("create:doc")
+        job, attached, _ = await manager.create_or_attach("doc", ["French"])
+        await asyncio.gather(*manager.tasks.values())
+        return job, attached
+
+    job, attached = asyncio.run(main())
+    assert job["status"] == "completed" and not attached
+
+
+def test_checkpoint_is_read_back_one_window_at_a_time(tmp_path):
+    async def runner(job, completed_pages, checkpoint):
+        return {}
+
+    manager = JobManager(runner, jobs_dir=str(tmp_path))
+    job = {"job_id": "job", "target_language": "French"}
+    job_dir = tmp_path / "job"
+    job_dir.mkdir()
+    lines = [json.dumps({"page_number": n, "content": f"page {n}", "language": "French"}) for n in (3, 1, 2)]
+    # The last line was torn by a crash mid-write
+    (job_dir / "pages.jsonl").write_text("\n".join(lines) + '\n{"page_number": 4, "cont', encoding="utf-8")
+
+    completed_pages = manager.load_checkpoint(job)
+    assert len(completed_pages) == 3
+    assert completed_pages.count("French") == 3
+    assert completed_pages.count("German") == 0
+    assert completed_pages.load("French", 2, 3) == {2: "page 2", 3: "page 3"}
+    assert completed_pages.load("French", 4, 10) == {}
+    assert not manager.load_checkpoint({"job_id": "new", "target_language": "French"})
@@ -0,0 +1,108 @@
+import time
+import asyncio
+
+import pytest
+
+from app.metrics import Gauge, Registry, SharedMetrics, merge_snapshots, render
+from app.state import InProcessBackend
+
+
+def make_registry():
+    registry = Registry()
+    requests = registry.counter("requests_total", "Requests", ["route"])
+    limit = registry.gauge("limit", "Concurrency limit", merge="max")
+    in_flight = registry.gauge("in_flight", "Requests in flight")
+    latency = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1))
+    return registry, requests, limit, in_flight, latency
+
+
+def test_metrics_render_in_the_prometheus_text_format():
+    registry, requests, limit, in_flight, latency = make_registry()
+    requests.inc(route="/upload")
+    requests.inc(2, route='/say "hi"')
+    limit.set(16)
+    for value in (0.05, 0.5, 5):
+        latency.observe(value)
+
+    assert render(registry.snapshot()).splitlines() == [
+        "# HELP requests_total Requests",
+        "# TYPE requests_total counter",
+        'requests_total{route="/upload"} 1',
+        'requests_total{route="/say \\"hi\\""} 2',
+        "# HELP limit Concurrency limit",
+        "# TYPE limit gauge",
+        "limit 16",
+        "# HELP in_flight Requests in flight",
+        "# TYPE in_flight gauge",
+        "# HELP latency_seconds Latency",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{le="0.1"} 1',
+        'latency_seconds_bucket{le="1"} 2',
+        'latency_seconds_bucket{le="+Inf"} 3',
+        "latency_seconds_sum 5.55",
+        "latency_seconds_count 3",
+    ]
+
+
+def test_labels_must_match_the_declared_ones():
+    registry, requests, *_ = make_registry()
+    with pytest.raises(ValueError):
+        requests.inc(path="/upload")
+    with pytest.raises(ValueError):
+        registry.counter("requests_total", "Registered twice")
+
+
+def test_workers_are_added_up_but_max_gauges_take_the_highest():
+    snapshots = []
+    for n in (1, 2):
+        registry, requests, limit, in_flight, latency = make_registry()
+        requests.inc(n, route="/upload")
+        limit.set(8 * n)
+        in_flight.set(n)
+        latency.observe(0.5)
+        snapshots.append(registry.snapshot())
+
+    merged = merge_snapshots(snapshots)
+    assert merged["requests_total"]["samples"] == {'["/upload"]': 3}
+    assert merged["limit"]["samples"] == {"[]": 16}
+    assert merged["in_flight"]["samples"] == {"[]": 3}
+    assert merged["latency_seconds"]["samples"] == {"[]": [0, 2, 0, 1.0, 2]}
+    # The snapshots themselves are left as they were
+    assert snapshots[0]["in_flight"]["samples"] == {"[]": 1}
+
+
+def test_gauges_merge_only_with_sum_or_max():
+    with pytest.raises(ValueError):
+        Gauge("limit", "Concurrency limit", merge="avg")
+
+
+def test_a_scrape_includes_other_workers_until_they_go_quiet(monkeypatch):
+    state = InProcessBackend()
+    registry, requests, *_ = make_registry()
+    requests.inc(route="/upload")
+    other, other_requests, *_ = make_registry()
+    other_requests.inc(4, route="/upload")
+    now = time.time()
+    state.set("metrics:other", {"updated_at": now, "metrics": other.snapshot()})
+
+    shared = SharedMetrics(state, registry, interval=5)
+    assert 'requests_total{route="/upload"} 5' in shared.render()
+
+    monkeypatch.setattr(time, "time", lambda: now + 60)
+    assert 'requests_total{route="/upload"} 1' in shared.render()
+    assert state.get("metrics:other") is None
+
+
+def test_shared_metrics_publish_and_withdraw_their_snapshot():
+    state = InProcessBackend()
+    registry, requests, *_ = make_registry()
+
+    async def main():
+        shared = SharedMetrics(state, registry, interval=5)
+        shared.start()
+        await asyncio.sleep(0)
+        assert state.get(shared.key)["metrics"] == registry.snapshot()
+        await shared.stop()
+
+    asyncio.run(main())
+    assert state.items("metrics:") == {}
@@ -0,0 +1,75 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from app.documents import DocumentStore
+from app.translation_store import TranslationStore
+
+
+@pytest.fixture
+def stores(router, tmp_path, monkeypatch):
+    documents = DocumentStore(str(tmp_path / "documents.sqlite3"))
+    translations = TranslationStore(str(tmp_path / "translations.sqlite3"))
+    monkeypatch.setattr(router, "document_store", documents)
+    monkeypatch.setattr(router, "translation_store", translations)
+    monkeypatch.setattr(router, "MAX_PAGES_PER_REQUEST", 3)
+    pages = [{"page_number": n, "content": f"page {n}"} for n in range(1, 8)]
+    documents.add_pages("doc", pages)
+    documents.register("doc", "sha", "doc.pdf", 100, len(pages))
+    translations.start("doc", "French", len(pages))
+    for page in pages:
+        translations.put_page("doc", "French", page["page_number"], page["content"].upper())
+    translations.complete("doc", "French")
+    return documents, translations
+
+
+def status_of(call):
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(call)
+    return error.value.status_code
+
+
+def test_page_range_is_clamped_to_the_document_and_the_limit(router, monkeypatch):
+    monkeypatch.setattr(router, "MAX_PAGES_PER_REQUEST", 50)
+    assert router.page_range(1, None, 120) == (1, 50)
+    assert router.page_range(101, None, 120) == (101, 120)
+    assert router.page_range(3, 5, 120) == (3, 5)
+    assert router.page_range(1, 200, 10) == (1, 10)
+    # Page 1 of an empty document is an empty window, not an error
+    assert router.page_range(1, None, 0) == (1, 0)
+
+
+def test_invalid_page_ranges_are_rejected(router):
+    with pytest.raises(HTTPException) as error:
+        router.page_range(5, 4, 10)
+    assert error.value.status_code == 400
+    with pytest.raises(HTTPException) as error:
+        router.page_range(11, None, 10)
+    assert error.value.status_code == 416
+
+
+def test_document_pages_are_served_a_window_at_a_time(router, stores):
+    response = asyncio.run(router.get_document_pages("doc", page_from=1, page_to=None))
+    assert [page["page_number"] for page in response["pages"]] == [1, 2, 3]
+    assert (response["page_to"], response["total_pages"], response["next_page"]) == (3, 7, 4)
+
+    response = asyncio.run(router.get_document_pages("doc", page_from=response["next_page"], page_to=None))
+    assert [page["page_number"] for page in response["pages"]] == [4, 5, 6]
+
+    response = asyncio.run(router.get_document_pages("doc", page_from=7, page_to=None))
+    assert [page["page_number"] for page in response["pages"]] == [7]
+    assert response["next_page"] is None
+
+    assert status_of(router.get_document_pages("doc", page_from=8, page_to=None)) == 416
+    assert status_of(router.get_document_pages("missing", page_from=1, page_to=None)) == 404
+
+
+def test_translated_pages_are_served_a_window_at_a_time(router, stores):
+    response = asyncio.run(router.get_translation("doc", "French", page_from=5, page_to=6))
+    assert response["pages"] == [{"page_number": 5, "content": "PAGE 5"}, {"page_number": 6, "content": "PAGE 6"}]
+    assert response["next_page"] == 7
+
+    assert status_of(router.get_translation("doc", "French", page_from=8, page_to=None)) == 416
+    assert status_of(router.get_translation("doc", "French", page_from=4, page_to=2)) == 400
+    assert status_of(router.get_translation("doc", "German", page_from=1, page_to=None)) == 404
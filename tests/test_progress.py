@@ -0,0 +1,118 @@
+import asyncio
+
+from app.progress import ProgressBroadcaster, ProgressSender, coalesce_key
+from app.state import InProcessBackend
+
+
+class FakeWebSocket:
+    """Records what was sent; ``gate`` holds every send until it is set"""
+
+    def __init__(self, blocked=False):
+        self.sent = []
+        self.closed = False
+        self.gate = asyncio.Event()
+        if not blocked:
+            self.gate.set()
+
+    async def send_json(self, message):
+        await self.gate.wait()
+        self.sent.append(message)
+
+    async def close(self):
+        self.closed = True
+
+
+def test_coalesce_keys_are_per_language_and_page():
+    assert coalesce_key({"status": "translating", "language": "French"}) == ("translating", "French")
+    assert coalesce_key({"status": "translating", "language": "French"}) != \
+        coalesce_key({"status": "translating", "language": "German"})
+    assert coalesce_key({"status": "delta", "language": "French", "page": 2, "text": "x"}) == ("delta", "French", 2)
+    assert coalesce_key({"status": "page_completed", "language": "French"}) == ("page_completed", "French")
+    # Pages with their content, completions and errors are always sent
+    assert coalesce_key({"status": "page_completed", "language": "French", "content": "x"}) is None
+    assert coalesce_key({"status": "completed"}) is None
+    assert coalesce_key({"status": "error", "message": "failed"}) is None
+
+
+def test_bursts_are_coalesced_while_the_client_is_busy():
+    async def main():
+        websocket = FakeWebSocket(blocked=True)
+        sender = ProgressSender(websocket, max_queue=100, max_rate=0)
+        sender.send({"status": "translating", "language": "French", "progress": 0})
+        await asyncio.sleep(0)
+        # The first message is being sent, the following ones wait and are merged
+        for progress in (10, 20, 30):
+            sender.send({"status": "translating", "language": "French", "progress": progress})
+            sender.send({"status": "translating", "language": "German", "progress": progress})
+        for text in ("Bon", "jour"):
+            sender.send({"status": "delta", "language": "French", "page": 1, "text": text})
+        sender.send({"status": "completed"})
+        websocket.gate.set()
+        for _ in range(10):
+            await asyncio.sleep(0)
+        await sender.close()
+        return websocket.sent, sender
+
+    sent, sender = asyncio.run(main())
+    assert sent == [
+        {"status": "translating", "language": "French", "progress": 0},
+        {"status": "translating", "language": "French", "progress": 30},
+        {"status": "translating", "language": "German", "progress": 30},
+        {"status": "delta", "language": "French", "page": 1, "text": "Bonjour"},
+        {"status": "completed"},
+    ]
+    assert (sender.sent, sender.coalesced) == (5, 5)
+
+
+def test_merging_does_not_change_the_message_of_other_subscribers():
+    async def main():
+        first = ProgressSender(FakeWebSocket(blocked=True), max_rate=0)
+        second = ProgressSender(FakeWebSocket(blocked=True), max_rate=0)
+        message = {"status": "delta", "language": "French", "page": 1, "text": "Bon"}
+        first.send(message)
+        second.send(message)
+        first.send({"status": "delta", "language": "French", "page": 1, "text": "jour"})
+        await first.close()
+        await second.close()
+        return message, list(second.queue)
+
+    message, queued = asyncio.run(main())
+    assert message["text"] == "Bon"
+    assert [m["text"] for m in queued] == ["Bon"]
+
+
+def test_a_slow_client_is_dropped_without_holding_up_the_others():
+    async def main():
+        state = InProcessBackend()
+        broadcaster = ProgressBroadcaster(state, lambda ws: ProgressSender(ws, max_queue=4, max_rate=0))
+        slow, fast = FakeWebSocket(blocked=True), FakeWebSocket()
+        broadcaster.subscribe("doc", slow)
+        broadcaster.subscribe("doc", fast)
+        assert broadcaster.subscriber_count() == 2
+        await asyncio.sleep(0)
+        for n in range(1, 8):
+            broadcaster.publish("doc", {"status": "page_completed", "page": n, "content": f"page {n}"})
+            await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        return broadcaster, slow, fast
+
+    broadcaster, slow, fast = asyncio.run(main())
+    assert [message["page"] for message in fast.sent] == list(range(1, 8))
+    assert slow.closed and slow.sent == []
+    assert broadcaster.stats() == {"documents": 1, "subscribers": 1, "dropped": 1}
+
+
+def test_the_last_unsubscribe_leaves_the_channel():
+    async def main():
+        state = InProcessBackend()
+        broadcaster = ProgressBroadcaster(state)
+        websocket = FakeWebSocket()
+        sender = broadcaster.subscribe("doc", websocket)
+        assert list(state._subscribers) == ["progress:doc"]
+        await broadcaster.unsubscribe("doc", sender)
+        broadcaster.publish("doc", {"status": "completed"})
+        return state, websocket
+
+    state, websocket = asyncio.run(main())
+    assert state._subscribers == {}
+    assert websocket.closed and websocket.sent == []
@@ -0,0 +1,97 @@
+import os
+import asyncio
+
+import pytest
+from PyPDF2 import PdfReader
+
+from app import rendering
+from app.rendering import PdfRenderer
+
+
+@pytest.fixture(autouse=True)
+def render_pool():
+    yield
+    rendering.close_render_pool()
+
+
+def page_titles(path):
+    return [page.extract_text().split("\n")[0] for page in PdfReader(path).pages]
+
+
+def test_pages_added_out_of_order_are_merged_in_order(tmp_path):
+    renderer = PdfRenderer(str(tmp_path))
+
+    async def main():
+        for page_number in (3, 1, 2):
+            await renderer.add_page("doc", "French", 1, page_number, f"Contenu de la page {page_number}\n\n<b>&</b>")
+        return await renderer.finish("doc", "French", 1)
+
+    path = asyncio.run(main())
+    assert path == renderer.pdf_path("doc", "french", 1)
+    assert page_titles(path) == ["Page 1", "Page 2", "Page 3"]
+    assert "Contenu de la page 2" in PdfReader(path).pages[1].extract_text()
+    # Only the export is left, the rendered pages are merged into it
+    assert os.listdir(tmp_path) == [os.path.basename(path)]
+
+
+def test_a_new_version_replaces_the_old_export(tmp_path):
+    renderer = PdfRenderer(str(tmp_path))
+
+    async def main():
+        await renderer.add_page("doc", "French", 1, 1, "old")
+        await renderer.finish("doc", "French", 1)
+        await renderer.add_page("doc", "French", 2, 1, "new")
+        # Two downloads waiting for the same export share one merge
+        return await asyncio.gather(renderer.finish("doc", "French", 2), renderer.finish("doc", "French", 2))
+
+    first, second = asyncio.run(main())
+    assert first == second == renderer.pdf_path("doc", "French", 2)
+    assert os.listdir(tmp_path) == [os.path.basename(first)]
+
+
+def test_render_reuses_a_finished_export(tmp_path):
+    renderer = PdfRenderer(str(tmp_path))
+    loads = []
+
+    def load_pages():
+        loads.append(1)
+        return [{"page_number": 1, "content": "one"}, {"page_number": 2, "content": "two"}]
+
+    async def main():
+        first = await renderer.render("doc", "German", 1, load_pages)
+        second = await renderer.render("doc", "German", 1, load_pages)
+        return first, second
+
+    first, second = asyncio.run(main())
+    assert first == second
+    assert loads == [1]
+    assert page_titles(first) == ["Page 1", "Page 2"]
+
+
+def test_discarded_pages_are_removed(tmp_path):
+    renderer = PdfRenderer(str(tmp_path))
+
+    async def main():
+        await renderer.add_page("doc", "French", 1, 1, "one")
+        renderer.discard("doc", "French", 1)
+        assert not renderer.pending
+        # The file is removed once the page has rendered
+        await asyncio.gather(*(task for task in asyncio.all_tasks() if task is not asyncio.current_task()))
+
+    asyncio.run(main())
+    assert os.listdir(tmp_path) == []
+
+
+def test_only_a_window_of_pages_renders_at_once(tmp_path):
+    renderer = PdfRenderer(str(tmp_path), window_pages=2)
+    rendering = []
+
+    async def main():
+        for page_number in range(1, 7):
+            await renderer.add_page("doc", "French", 1, page_number, f"Contenu de la page {page_number}")
+            rendering.append(len(renderer.pending[("doc", "french", 1)].rendering))
+        return await renderer.finish("doc", "French", 1)
+
+    path = asyncio.run(main())
+    assert max(rendering) <= 2
+    assert page_titles(path) == [f"Page {n}" for n in range(1, 7)]
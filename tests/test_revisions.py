@@ -0,0 +1,113 @@
+import io
+import asyncio
+
+import pytest
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfgen import canvas
+
+from app import extraction
+from app.documents import DocumentStore
+from app.revisions import diff_pages, renumber, reuse_translations
+from app.translation_store import TranslationStore
+from test_uploads import make_request, multipart_body
+
+
+def pages(*contents):
+    return [{"page_number": n, "content": content} for n, content in enumerate(contents, start=1)]
+
+
+INTRO = "Introduction to the product and its many uses in the field."
+SETUP = "Setting up the device takes about ten minutes with the tools provided."
+USAGE = "Using the device every day keeps the battery in good condition over time."
+
+
+def test_inserted_page_only_shifts_the_others():
+    result = diff_pages(pages(INTRO, SETUP, USAGE), pages(INTRO, "A brand new page.", SETUP, USAGE))
+    assert result["pages"][1]["status"] == "unchanged"
+    assert result["pages"][2] == {"status": "added", "previous_page": None, "similarity": 0.0}
+    assert (result["pages"][3]["status"], result["pages"][3]["previous_page"]) == ("unchanged", 2)
+    assert (result["pages"][4]["status"], result["pages"][4]["previous_page"]) == ("unchanged", 3)
+    assert result["removed"] == []
+    assert result["stats"] == {"unchanged": 3, "renumbered": 0, "changed": 0, "added": 1, "removed": 0}
+
+
+def test_whitespace_changes_and_moves_are_unchanged():
+    result = diff_pages(pages(INTRO, SETUP, USAGE), pages(USAGE, INTRO.replace(" ", "\n  "), SETUP))
+    assert {n: match["previous_page"] for n, match in result["pages"].items()} == {1: 3, 2: 1, 3: 2}
+    assert result["stats"]["unchanged"] == 3
+
+
+def test_renumbered_edited_and_removed_pages():
+    previous = pages(f"{INTRO} Page 1 of 3", SETUP, USAGE)
+    revised = pages(f"{INTRO} Page 1 of 2", SETUP.replace("ten", "fifteen"))
+    result = diff_pages(previous, revised)
+    assert result["pages"][1]["status"] == "renumbered"
+    assert result["pages"][1]["numbers"] == ["1", "2"]
+    assert result["pages"][1]["previous_numbers"] == ["1", "3"]
+    assert result["pages"][2]["status"] == "changed"
+    assert result["pages"][2]["previous_page"] == 2
+    assert 0.5 <= result["pages"][2]["similarity"] < 1
+    assert result["removed"] == [3]
+
+
+def test_renumber_replaces_numbers_in_order():
+    assert renumber("Seite 1 von 3", ["1", "3"], ["2", "4"]) == "Seite 2 von 4"
+    # The translation dropped or reordered a number, the page must be translated again
+    assert renumber("Seite eins von 3", ["1", "3"], ["2", "4"]) is None
+
+
+def test_reuse_translations_skips_changed_pages():
+    revision = diff_pages(pages(f"Page 1 {INTRO}", SETUP, USAGE), pages(f"Page 2 {INTRO}", SETUP + " Extra.", USAGE))
+    reused = reuse_translations(revision, {1: "Seite 1 Einleitung", 2: "Einrichtung", 3: "Nutzung"})
+    assert reused == {1: "Seite 2 Einleitung", 3: "Nutzung"}
+
+
+def make_pdf(*contents):
+    out = io.BytesIO()
+    # invariant=1 leaves out the creation date and random id, so the same pages give the same file
+    pdf = canvas.Canvas(out, pagesize=letter, invariant=1)
+    for content in contents:
+        pdf.drawString(72, 720, content)
+        pdf.showPage()
+    pdf.save()
+    return out.getvalue()
+
+
+@pytest.fixture
+def upload(router, tmp_path, monkeypatch):
+    monkeypatch.setattr(router, "document_store", DocumentStore(str(tmp_path / "documents.sqlite3")))
+    monkeypatch.setattr(router, "translation_store", TranslationStore(str(tmp_path / "translations.sqlite3")))
+
+    def upload(data, previous_file_id=None):
+        fields = {"previous_file_id": previous_file_id} if previous_file_id else {}
+        body = multipart_body(fields, [("file", "manual.pdf", data)])
+        return asyncio.run(router.upload_pdf(make_request(body)))
+
+    yield upload
+    extraction.close_extraction_pool()
+
+
+def test_a_duplicate_upload_keeps_the_revision_link_of_the_stored_document(upload):
+    first = upload(make_pdf(INTRO, SETUP, USAGE))
+    other = upload(make_pdf(USAGE))
+    assert first["revision"] is None
+
+    revised = upload(make_pdf(INTRO, "A brand new page.", SETUP, USAGE), previous_file_id=first["file_id"])
+    assert not revised["duplicate"]
+    assert revised["revision"] == {"unchanged": 3, "renumbered": 0, "changed": 0, "added": 1, "removed": 0,
+                                   "previous_file_id": first["file_id"]}
+
+    # Someone else uploads the same file, as a revision of another document or of none
+    for previous_file_id in (other["file_id"], None):
+        again = upload(make_pdf(INTRO, "A brand new page.", SETUP, USAGE), previous_file_id=previous_file_id)
+        assert again["duplicate"] and again["file_id"] == revised["file_id"]
+        assert again["revision"] == revised["revision"]
+
+
+def test_a_duplicate_without_a_link_is_linked_on_request(upload):
+    first = upload(make_pdf(INTRO, SETUP))
+    second = upload(make_pdf(INTRO, SETUP, USAGE))
+    assert second["revision"] is None
+    again = upload(make_pdf(INTRO, SETUP, USAGE), previous_file_id=first["file_id"])
+    assert again["duplicate"]
+    assert (again["revision"]["unchanged"], again["revision"]["added"]) == (2, 1)
@@ -0,0 +1,194 @@
+import asyncio
+
+import pytest
+
+from app.scheduler import AdaptiveLimiter, FairLimiter, RequestScheduler, TokenBucket, parse_retry_after, size_bucket
+from app.translation_client import TranslationClientError
+
+
+def test_fair_limiter_serves_flows_in_turn():
+    async def main():
+        limiter = FairLimiter(1)
+        order = []
+        await limiter.acquire("held")
+
+        async def worker(flow, name):
+            await limiter.acquire(flow)
+            order.append(name)
+            limiter.release()
+
+        tasks = [asyncio.create_task(worker("a", f"a{i}")) for i in range(3)]
+        tasks.append(asyncio.create_task(worker("b", "b0")))
+        await asyncio.sleep(0)
+        assert (limiter.waiting, limiter.flows) == (4, 2)
+        limiter.release()
+        await asyncio.gather(*tasks)
+        assert limiter.in_flight == 0
+        return order
+
+    # Flow a queued three waiters first, flow b still gets the second slot
+    assert asyncio.run(main()) == ["a0", "b0", "a1", "a2"]
+
+
+def test_fair_limiter_cancelled_waiters_give_up_their_slot():
+    async def main():
+        limiter = FairLimiter(1)
+        await limiter.acquire()
+        queued = asyncio.create_task(limiter.acquire("a"))
+        granted = asyncio.create_task(limiter.acquire("b"))
+        last = asyncio.create_task(limiter.acquire("c"))
+        await asyncio.sleep(0)
+        queued.cancel()
+        await asyncio.gather(queued, return_exceptions=True)
+        assert limiter.waiting == 2
+        # b is granted the slot but cancelled before it runs, the slot goes on to c
+        limiter.release()
+        granted.cancel()
+        await asyncio.gather(granted, return_exceptions=True)
+        await asyncio.wait_for(last, 1)
+        assert (limiter.in_flight, limiter.waiting) == (1, 0)
+
+    asyncio.run(main())
+
+
+def test_adaptive_limiter_halves_on_throttling_and_grows_back():
+    async def main():
+        limiter = AdaptiveLimiter(8)
+        limiter.on_throttled()
+        assert limiter.limit == 4
+        # Once per second at most, one burst of 429s halves the limit once
+        limiter.on_throttled()
+        assert limiter.limit == 4
+        for _ in range(4):
+            limiter.on_success()
+        assert 4.9 < limiter.limit < 5
+
+    asyncio.run(main())
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("2.5") == 2.5
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0
+    assert parse_retry_after("soon") is None
+    assert parse_retry_after(None) is None
+
+
+def test_token_bucket_allows_a_burst_then_waits_for_the_refill():
+    async def main():
+        bucket = TokenBucket(6000)
+        await bucket.acquire(6000)
+        started = asyncio.get_running_loop().time()
+        # 100 units a second, 5 units take about 50 ms
+        await bucket.acquire(5)
+        waited = asyncio.get_running_loop().time() - started
+        bucket.drain()
+        return waited, bucket.tokens
+
+    waited, tokens = asyncio.run(main())
+    assert 0.03 < waited < 0.5
+    assert tokens == 0
+
+
+def test_a_disabled_bucket_never_waits():
+    asyncio.run(asyncio.wait_for(TokenBucket(0).acquire(10 ** 6), 0.1))
+
+
+def test_size_bucket_groups_by_power_of_two():
+    assert [size_bucket(tokens) for tokens in (0, 1, 2, 3, 1000, 1024, 1025)] == [1, 1, 2, 4, 1024, 1024, 2048]
+
+
+def failing_call(*errors, result="ok"):
+    attempts = []
+
+    async def call():
+        attempts.append(len(attempts))
+        if len(attempts) <= len(errors):
+            raise errors[len(attempts) - 1]
+        return result
+
+    return call, attempts
+
+
+def test_retryable_errors_are_retried():
+    call, attempts = failing_call(TranslationClientError("busy", status_code=503),
+                                  TranslationClientError("timed out"))
+    scheduler = RequestScheduler(base_delay=0.001, max_delay=0.01)
+    assert asyncio.run(scheduler.run(call)) == "ok"
+    assert len(attempts) == 3
+    assert (scheduler.requests, scheduler.retries, scheduler.failures) == (3, 2, 0)
+
+
+@pytest.mark.parametrize("error", [
+    TranslationClientError("bad request", status_code=400),
+    TranslationClientError("conflict", status_code=409),
+    TranslationClientError("quota", status_code=429, retryable=False),
+])
+def test_other_errors_fail_right_away(error):
+    call, attempts = failing_call(error)
+    scheduler = RequestScheduler(base_delay=0.001)
+    with pytest.raises(TranslationClientError):
+        asyncio.run(scheduler.run(call))
+    assert len(attempts) == 1
+    # An exhausted quota is not throttling, the concurrency limit stays as it is
+    assert (scheduler.failures, scheduler.throttled) == (1, 0)
+    assert scheduler.limiter.limit == scheduler.limiter.max_limit
+
+
+def test_retries_stop_after_max_retries():
+    call, attempts = failing_call(*[TranslationClientError("slow down", status_code=429, retry_after=0)] * 5)
+    scheduler = RequestScheduler(max_retries=3, base_delay=0.001)
+    with pytest.raises(TranslationClientError):
+        asyncio.run(scheduler.run(call))
+    assert len(attempts) == 3
+    assert scheduler.throttled == 3
+    assert scheduler.limiter.limit < scheduler.limiter.max_limit
+
+
+def test_hedge_delay_is_kept_per_request_size():
+    scheduler = RequestScheduler(hedge=True)
+    for i in range(20):
+        scheduler._observe(100, 0.1 + i / 1000)
+        scheduler._observe(3000, 2.0)
+    assert scheduler.hedge_delay(120) == pytest.approx(0.119)
+    assert scheduler.hedge_delay(4000) == 2.0
+    # Not enough samples of this size yet
+    assert scheduler.hedge_delay(10) is None
+    assert RequestScheduler(hedge=False).hedge_delay(100) is None
+    assert sorted(scheduler.hedge_delays()) == [128, 4096]
+
+
+def test_hedge_skips_the_queue_within_its_budget():
+    async def main():
+        scheduler = RequestScheduler(max_in_flight=1, hedge=True, hedge_max_ratio=0.5)
+        for _ in range(20):
+            scheduler._observe(100, 0.01)
+        scheduler.requests = 20
+        attempts = []
+
+        async def slow_first():
+            attempts.append(len(attempts))
+            await asyncio.sleep(5 if len(attempts) == 1 else 0.01)
+            return len(attempts)
+
+        async def queued():
+            return "queued"
+
+        hedged = asyncio.create_task(scheduler.run(slow_first, 100, hedge=True))
+        await asyncio.sleep(0)
+        waiting = asyncio.create_task(scheduler.run(queued, 100))
+        await asyncio.sleep(0)
+        assert scheduler.limiter.waiting == 1
+        assert await asyncio.wait_for(hedged, 1) == 2
+        assert await waiting == "queued"
+        assert (scheduler.hedges, scheduler.hedges_won, scheduler.limiter.in_flight) == (1, 1, 0)
+
+        # With the budget spent the slow request is waited for
+        scheduler.hedge_max_ratio = 0
+        attempts.clear()
+        slow = asyncio.create_task(scheduler.run(slow_first, 100, hedge=True))
+        await asyncio.sleep(0.1)
+        assert not slow.done() and scheduler.hedges == 1
+        slow.cancel()
+        await asyncio.gather(slow, return_exceptions=True)
+
+    asyncio.run(main())
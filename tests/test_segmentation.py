@@ -0,0 +1,48 @@
+from app.segmentation import assemble_page, combine_stats, segment_pages
+
+HEADER = "ACME Corp. Quarterly Report"
+FOOTER = "Confidential, do not distribute"
+
+
+def make_pages(count):
+    return [
+        {"page_number": n, "content": f"{HEADER}\nBody of page {n}.\nMore text on page {n}.\n{FOOTER}\n{n}"}
+        for n in range(1, count + 1)
+    ]
+
+
+def test_repeated_lines_are_segments_of_their_own():
+    pages = make_pages(3)
+    result = segment_pages(pages)
+    segments = result["segments"]
+    assert segments.count(HEADER) == 1
+    # The page number is too short to be boilerplate and stays with the footer's run
+    assert [segments[index] for index in result["page_segments"][2]] == [
+        HEADER, "Body of page 2.\nMore text on page 2.", FOOTER, "2"
+    ]
+    assert result["stats"]["total_segments"] == 12
+    assert result["stats"]["unique_segments"] == 2 + 3 + 3
+
+
+def test_pages_are_rebuilt_from_their_segments():
+    pages = make_pages(4)
+    result = segment_pages(pages)
+    translated = dict(enumerate(result["segments"]))
+    for page in pages:
+        assert assemble_page(result["page_segments"][page["page_number"]], translated) == page["content"]
+
+
+def test_lines_on_a_single_page_are_not_boilerplate():
+    result = segment_pages([{"page_number": 1, "content": f"{HEADER}\nText"}, {"page_number": 2, "content": "Other"}])
+    assert result["segments"] == [f"{HEADER}\nText", "Other"]
+    assert result["stats"]["deduplicated_chars"] == 0
+
+
+def test_combine_stats_adds_up_windows():
+    first = segment_pages(make_pages(2))["stats"]
+    second = segment_pages(make_pages(3))["stats"]
+    combined = combine_stats([first, second])
+    assert combined["total_chars"] == first["total_chars"] + second["total_chars"]
+    assert combined["unique_segments"] == first["unique_segments"] + second["unique_segments"]
+    assert combined["deduplicated_ratio"] == combined["deduplicated_chars"] / combined["total_chars"]
+    assert combine_stats([])["deduplicated_ratio"] == 0.0
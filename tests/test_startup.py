@@ -0,0 +1,75 @@
+import os
+import sys
+import json
+import asyncio
+import subprocess
+
+import pytest
+
+from app import extraction, startup
+from app.startup import FirstRequestMiddleware, StartupProfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_phases_are_timed_relative_to_the_process_start():
+    profile = StartupProfile()
+    with profile.phase("import app.main"):
+        pass
+    with pytest.raises(RuntimeError):
+        # A phase that fails is still recorded
+        with profile.phase("load .env"):
+            raise RuntimeError("unreadable")
+    with profile.phase("render workers", into=profile.warmup):
+        pass
+
+    report = profile.report()
+    assert [phase["name"] for phase in report["phases"]] == ["import app.main", "load .env"]
+    assert [phase["name"] for phase in report["warmup"]] == ["render workers"]
+    assert report["ready_after_seconds"] is None and report["first_request_after_seconds"] is None
+
+    profile.ready()
+    profile.request_received()
+    first = profile.report()["first_request_after_seconds"]
+    profile.request_received()
+    report = profile.report()
+    # Only the first request counts
+    assert report["first_request_after_seconds"] == first
+    assert 0 <= report["ready_after_seconds"] <= first
+    if report["before_import_seconds"] is not None:
+        assert report["ready_after_seconds"] >= report["before_import_seconds"]
+
+
+def test_the_first_request_is_marked_without_touching_lifespan_events(monkeypatch):
+    profile = StartupProfile()
+    monkeypatch.setattr(startup, "startup_profile", profile)
+    calls = []
+
+    async def app(scope, receive, send):
+        calls.append(scope["type"])
+
+    middleware = FirstRequestMiddleware(app)
+    asyncio.run(middleware({"type": "lifespan"}, None, None))
+    assert profile.first_request_at is None
+    asyncio.run(middleware({"type": "http"}, None, None))
+    assert profile.first_request_at is not None
+    assert calls == ["lifespan", "http"]
+
+
+def test_importing_the_app_leaves_heavy_libraries_unloaded():
+    # A fresh interpreter, the test process has loaded them already
+    code = (
+        "import sys, json; import app.main; "
+        "print(json.dumps([m for m in ('PyPDF2', 'aiohttp', 'openai', 'markdown2', 'reportlab') if m in sys.modules]))"
+    )
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    assert json.loads(result.stdout.splitlines()[-1]) == []
+
+
+def test_warm_up_starts_the_extraction_workers():
+    try:
+        asyncio.run(extraction.warm_up_extraction())
+        assert len(extraction.get_extraction_pool()._processes) == extraction.EXTRACTION_WORKERS
+    finally:
+        extraction.close_extraction_pool()
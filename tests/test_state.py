@@ -0,0 +1,89 @@
+import asyncio
+
+from app.state import InProcessBackend, SQLiteBackend, _owner_alive
+
+
+def test_in_process_backend_delivers_until_unsubscribed():
+    backend = InProcessBackend()
+    received = []
+    unsubscribe = backend.subscribe("file:doc", received.append)
+    backend.publish("file:doc", {"status": "translating"})
+    backend.publish("file:other", {"status": "translating"})
+    unsubscribe()
+    backend.publish("file:doc", {"status": "completed"})
+    assert received == [{"status": "translating"}]
+
+
+def test_a_failing_subscriber_does_not_stop_the_others():
+    backend = InProcessBackend()
+    received = []
+    backend.subscribe("file:doc", lambda message: 1 / 0)
+    backend.subscribe("file:doc", received.append)
+    backend.publish("file:doc", {"status": "completed"})
+    assert received == [{"status": "completed"}]
+
+
+def test_entries_are_shared_between_processes(tmp_path):
+    path = str(tmp_path / "state.sqlite3")
+    first, second = SQLiteBackend(path), SQLiteBackend(path)
+    first.set("job:1", {"file_id": "a"})
+    first.set("job:2", {"file_id": "b"})
+    first.set("sweep", 1)
+    assert second.get("job:1") == {"file_id": "a"}
+    assert second.items("job:") == {"job:1": {"file_id": "a"}, "job:2": {"file_id": "b"}}
+    second.delete("job:1")
+    assert first.get("job:1") is None
+
+
+def test_a_lease_has_one_holder_until_it_expires_or_is_released(tmp_path):
+    path = str(tmp_path / "state.sqlite3")
+    first, second = SQLiteBackend(path), SQLiteBackend(path)
+    assert first.acquire_lease("job:1", 30)
+    # Renewing a held lease succeeds, taking it from a live holder does not
+    assert first.acquire_lease("job:1", 30)
+    assert not second.acquire_lease("job:1", 30)
+    first.release_lease("job:1")
+    assert second.acquire_lease("job:1", 0)
+    # An expired lease is free for the next process
+    assert first.acquire_lease("job:1", 30)
+
+
+def test_the_lease_of_a_dead_worker_is_taken_over_right_away(tmp_path, dead_owner):
+    path = str(tmp_path / "state.sqlite3")
+    assert not _owner_alive(dead_owner)
+    assert _owner_alive("some-other-host:1:abc")
+
+    dead = SQLiteBackend(path)
+    dead.node_id = dead_owner
+    assert dead.acquire_lease("job:1", 3600)
+    assert SQLiteBackend(path).acquire_lease("job:1", 3600)
+
+
+def test_messages_reach_the_subscribers_of_other_processes(tmp_path):
+    path = str(tmp_path / "state.sqlite3")
+
+    async def main():
+        sender, receiver = SQLiteBackend(path, poll_interval=0.01), SQLiteBackend(path, poll_interval=0.01)
+        local, remote = [], []
+        sender.subscribe("file:doc", local.append)
+        receiver.subscribe("file:doc", remote.append)
+        await sender.start()
+        await receiver.start()
+        for text in ("Bon", "jour", " !"):
+            sender.publish("file:doc", {"status": "delta", "page": 1, "language": "French", "text": text})
+        sender.publish("file:doc", {"status": "completed"})
+        for _ in range(100):
+            if len(remote) == 2:
+                break
+            await asyncio.sleep(0.01)
+        await sender.close()
+        await receiver.close()
+        return local, remote
+
+    local, remote = asyncio.run(main())
+    # Subscribers in the publishing process get every delta, others get them merged
+    assert [message.get("text") for message in local] == ["Bon", "jour", " !", None]
+    assert remote == [
+        {"status": "delta", "page": 1, "language": "French", "text": "Bonjour !"},
+        {"status": "completed"},
+    ]
@@ -0,0 +1,103 @@
+import os
+import time
+import asyncio
+
+import pytest
+
+from app.documents import DocumentStore
+from app.storage import ORPHAN_GRACE_SECONDS, StorageManager
+
+DAY = 24 * 3600
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(time, "time", lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def storage(tmp_path):
+    documents = DocumentStore(str(tmp_path / "documents.sqlite3"))
+    upload_dir = tmp_path / "uploads"
+    export_dir = tmp_path / "exports"
+    upload_dir.mkdir()
+    export_dir.mkdir()
+    return documents, str(upload_dir), str(export_dir)
+
+
+def store_document(storage, file_id, size):
+    documents, upload_dir, export_dir = storage
+    documents.add_pages(file_id, [{"page_number": 1, "content": "text"}])
+    documents.register(file_id, f"sha-{file_id}", f"{file_id}.pdf", size, 1)
+    with open(os.path.join(upload_dir, f"{file_id}.pdf"), "wb") as f:
+        f.write(b"x" * size)
+    with open(os.path.join(export_dir, f"{file_id}_french.md"), "wb") as f:
+        f.write(b"y" * 10)
+
+
+def stored_ids(storage):
+    return sorted(document["file_id"] for document in storage[0].list())
+
+
+def test_documents_past_their_ttl_are_evicted(storage, clock):
+    documents, upload_dir, export_dir = storage
+    store_document(storage, "old", 100)
+    store_document(storage, "busy", 100)
+    clock[0] += 3 * DAY
+    store_document(storage, "new", 100)
+    clock[0] += 5 * DAY
+
+    manager = StorageManager(documents, upload_dir, export_dir, ttl=7 * DAY, quota=0)
+    assert manager.sweep(busy=["busy"]) == ["old"]
+
+    assert stored_ids(storage) == ["busy", "new"]
+    assert sorted(os.listdir(upload_dir)) == ["busy.pdf", "new.pdf"]
+    assert sorted(os.listdir(export_dir)) == ["busy_french.md", "new_french.md"]
+    assert manager.stats()["evictions"] == {"ttl": 1, "quota": 0}
+    assert manager.evicted_bytes == 110
+
+
+def test_least_recently_used_documents_go_first_over_quota(storage, clock):
+    documents, upload_dir, export_dir = storage
+    for file_id in ("a", "b", "c", "d"):
+        store_document(storage, file_id, 100)
+        clock[0] += 60
+    # Reading a document makes it recent again
+    documents.touch("a")
+
+    manager = StorageManager(documents, upload_dir, export_dir, ttl=0, quota=250)
+    # "b" is the least recently used but has a running job
+    assert manager.sweep(busy=["b"]) == ["c", "d"]
+
+    assert stored_ids(storage) == ["a", "b"]
+    assert manager.used_bytes == 220
+    assert manager.stats()["documents"] == 2
+
+
+def test_only_old_orphaned_files_are_removed(storage, clock):
+    documents, upload_dir, export_dir = storage
+    for name in ("crashed.pdf", "uploading.pdf"):
+        open(os.path.join(upload_dir, name), "wb").close()
+    old = clock[0] - ORPHAN_GRACE_SECONDS - 1
+    os.utime(os.path.join(upload_dir, "crashed.pdf"), (old, old))
+
+    manager = StorageManager(documents, upload_dir, export_dir)
+    assert manager.sweep() == []
+    assert os.listdir(upload_dir) == ["uploading.pdf"]
+    assert manager.orphans_removed == 1
+
+
+def test_run_sweep_skips_busy_files_and_reports_evictions(storage, clock):
+    documents, upload_dir, export_dir = storage
+    store_document(storage, "idle", 100)
+    store_document(storage, "running", 100)
+    clock[0] += 30 * DAY
+    evicted = []
+
+    manager = StorageManager(documents, upload_dir, export_dir, busy_files=lambda: ["running"],
+                             on_evict=evicted.append, ttl=DAY)
+    assert asyncio.run(manager.run_sweep()) == ["idle"]
+    assert evicted == ["idle"]
+    assert stored_ids(storage) == ["running"]
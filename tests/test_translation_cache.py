@@ -0,0 +1,84 @@
+from app import translation_cache
+from app.translation_cache import TranslationCache, make_cache_key
+
+
+def key(text, language="French", model="gpt-4o-mini", prompt_version="1"):
+    return make_cache_key(text, language, model, prompt_version)
+
+
+def test_key_ignores_spacing_and_language_case():
+    assert key("Hello   world\t!") == key("  Hello world ! ")
+    assert key("Hello", "French") == key("Hello", " french ")
+
+
+def test_key_keeps_line_breaks():
+    # The translation keeps the line breaks of its source, so they are part of the address
+    assert key("Hello\nworld") != key("Hello world")
+    assert key("Hello\n\nworld") != key("Hello\nworld")
+
+
+def test_key_changes_with_language_model_and_prompt():
+    base = key("Hello")
+    assert key("Hello", language="German") != base
+    assert key("Hello", model="gpt-4o") != base
+    assert key("Hello", prompt_version="2") != base
+
+
+def test_hits_and_misses_are_counted(tmp_path):
+    cache = TranslationCache(str(tmp_path / "cache.sqlite3"))
+    assert cache.get("a") is None
+    cache.set_many({"a": "A", "b": "B"})
+    assert cache.get("a") == "A"
+    assert cache.get_many(["a", "b", "c"]) == {"a": "A", "b": "B"}
+
+    stats = cache.stats()
+    assert stats["entries"] == 2
+    assert (stats["hits"], stats["misses"]) == (3, 2)
+    assert stats["hit_rate"] == 0.6
+
+
+def test_entries_survive_a_restart(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    TranslationCache(path).set("a", "A")
+    assert TranslationCache(path).get("a") == "A"
+
+
+def test_expired_entries_are_misses_and_evicted(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(translation_cache.time, "time", lambda: now[0])
+    cache = TranslationCache(str(tmp_path / "cache.sqlite3"), ttl=60)
+    cache.set("old", "Old")
+    now[0] += 30
+    cache.set("new", "New")
+    now[0] += 40
+
+    assert cache.get("old") is None
+    assert cache.get("new") == "New"
+    cache.evict()
+    assert cache.stats()["entries"] == 1
+    assert cache.evictions == 1
+
+
+def test_least_recently_used_entries_are_evicted_first(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(translation_cache.time, "time", lambda: now[0])
+    cache = TranslationCache(str(tmp_path / "cache.sqlite3"), ttl=0, max_entries=2)
+    for name in ("a", "b", "c"):
+        cache.set(name, name.upper())
+        now[0] += 1
+    # Reading an entry makes it recent again
+    cache.get("a")
+    now[0] += 1
+    cache.evict()
+
+    assert cache.get_many(["a", "b", "c"]) == {"a": "A", "c": "C"}
+    assert cache.evictions == 1
+
+
+def test_eviction_runs_every_few_writes(tmp_path, monkeypatch):
+    monkeypatch.setattr(translation_cache, "EVICTION_INTERVAL", 5)
+    cache = TranslationCache(str(tmp_path / "cache.sqlite3"), max_entries=3)
+    cache.set_many({str(n): str(n) for n in range(4)})
+    assert cache.stats()["entries"] == 4
+    cache.set("4", "4")
+    assert cache.stats()["entries"] == 3
@@ -0,0 +1,202 @@
+import asyncio
+
+import aiohttp
+import pytest
+
+from app.scheduler import RequestScheduler
+from app.translation_client import SingleFlight, TranslationClient, TranslationClientError
+from benchmarks import fake_model_server
+
+
+def test_single_flight_shares_one_call():
+    async def main():
+        flights = SingleFlight()
+        calls = []
+        release = asyncio.Event()
+
+        async def call(on_delta):
+            calls.append(on_delta is not None)
+            on_delta("Hel")
+            await release.wait()
+            on_delta("lo")
+            return {"content": "Hello"}
+
+        first_deltas, late_deltas, whole = [], [], []
+        first = asyncio.create_task(flights.run("key", call, first_deltas.append))
+        await asyncio.sleep(0)
+        # A late listener first gets what was streamed so far, a caller without streaming only the result
+        late = asyncio.create_task(flights.run("key", call, late_deltas.append))
+        quiet = asyncio.create_task(flights.run("key", call))
+        await asyncio.sleep(0)
+        release.set()
+        results = await asyncio.gather(first, late, quiet)
+        assert calls == [True]
+        assert flights.coalesced == 2
+        assert results == [{"content": "Hello"}] * 3
+        assert "".join(first_deltas) == "".join(late_deltas) == "Hello"
+
+        # Joining a call that does not stream passes the whole content at the end
+        async def plain(on_delta):
+            assert on_delta is None
+            await asyncio.sleep(0)
+            return {"content": "Bye"}
+
+        plain_first = asyncio.create_task(flights.run("other", plain))
+        await asyncio.sleep(0)
+        await asyncio.gather(plain_first, flights.run("other", plain, whole.append))
+        assert whole == ["Bye"]
+
+    asyncio.run(main())
+
+
+def test_single_flight_cancels_the_call_with_its_last_waiter():
+    async def main():
+        flights = SingleFlight()
+        started, cancelled = [], []
+
+        async def call(on_delta):
+            started.append(1)
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(1)
+                raise
+
+        first = asyncio.create_task(flights.run("key", call))
+        second = asyncio.create_task(flights.run("key", call))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.gather(first, return_exceptions=True)
+        await asyncio.sleep(0)
+        # The other caller still waits, the call keeps running
+        assert cancelled == [] and not second.done()
+        second.cancel()
+        await asyncio.gather(second, return_exceptions=True)
+        await asyncio.sleep(0)
+        assert cancelled == [1]
+
+        # Callers after the cancellation start a new call
+        third = asyncio.create_task(flights.run("key", call))
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        assert len(started) == 2
+        third.cancel()
+        await asyncio.gather(third, return_exceptions=True)
+
+    asyncio.run(main())
+
+
+@pytest.fixture
+def rolls(monkeypatch):
+    """Outcomes of the fake server's random draws, in order; 0.99 (no error, not slow) once they run out"""
+    values = []
+    monkeypatch.setattr(fake_model_server.random, "random", lambda: values.pop(0) if values else 0.99)
+    return values
+
+
+async def server_stats(url):
+    async with aiohttp.ClientSession() as session:
+        async with session.get(f"{url}/stats") as response:
+            return await response.json()
+
+
+def make_client(url, **scheduler_options):
+    scheduler = RequestScheduler(**dict({"base_delay": 0.01, "max_delay": 0.05}, **scheduler_options))
+    return TranslationClient(api_base=f"{url}/v1", scheduler=scheduler)
+
+
+async def warm_up(client, count=20):
+    # Enough answers of this size for the scheduler to know its usual latency
+    for _ in range(count):
+        await client.complete_translation("Hello world", "French")
+
+
+def test_complete_translation_plain_and_streamed(fake_model_server, rolls):
+    async def main():
+        async with fake_model_server(latency=0.01, jitter=0) as url:
+            client = make_client(url)
+            try:
+                result = await client.complete_translation("Hello world", "French")
+                deltas = []
+                streamed = await client.complete_translation("A longer text to stream in pieces", "French",
+                                                             on_delta=deltas.append)
+            finally:
+                await client.close()
+            stats = await server_stats(url)
+        assert result == {"content": "HELLO WORLD", "finish_reason": "stop"}
+        assert streamed["content"] == "A LONGER TEXT TO STREAM IN PIECES"
+        assert len(deltas) > 1 and "".join(deltas) == streamed["content"]
+        assert (stats["requests"], stats["streamed"]) == (2, 1)
+
+    asyncio.run(main())
+
+
+def test_throttled_request_is_retried(fake_model_server, rolls):
+    async def main():
+        rolls.extend([0.0, 0.0])
+        async with fake_model_server(latency=0.01, jitter=0, error_rate=0.5, retry_after=0.01) as url:
+            client = make_client(url)
+            try:
+                result = await client.complete_translation("Hello world", "French")
+            finally:
+                await client.close()
+            stats = await server_stats(url)
+        assert result["content"] == "HELLO WORLD"
+        assert (client.scheduler.throttled, client.scheduler.retries) == (2, 2)
+        assert stats["throttled"] == 2
+
+    asyncio.run(main())
+
+
+def test_server_errors_give_up_after_max_retries(fake_model_server, rolls):
+    async def main():
+        async with fake_model_server(latency=0.01, jitter=0, server_error_rate=1) as url:
+            client = make_client(url, max_retries=3)
+            try:
+                with pytest.raises(TranslationClientError) as error:
+                    await client.complete_translation("Hello world", "French")
+            finally:
+                await client.close()
+            stats = await server_stats(url)
+        assert error.value.status_code == 500
+        assert (stats["requests"], stats["server_errors"]) == (3, 3)
+        # Server errors are retried but are not throttling
+        assert client.scheduler.throttled == 0
+
+    asyncio.run(main())
+
+
+def test_slow_request_is_hedged(fake_model_server, rolls):
+    async def main():
+        async with fake_model_server(latency=0.01, jitter=0, slow_rate=0.5, slow_latency=1) as url:
+            client = make_client(url, hedge=True, hedge_max_ratio=0.5)
+            try:
+                await warm_up(client)
+                # The next request is slow, its duplicate is not
+                rolls.extend([0.99, 0.0])
+                result = await asyncio.wait_for(client.complete_translation("Hello world", "French"), 0.5)
+            finally:
+                await client.close()
+            stats = await server_stats(url)
+        assert result["content"] == "HELLO WORLD"
+        assert (client.scheduler.hedges, client.scheduler.hedges_won) == (1, 1)
+        assert (stats["requests"], stats["slow"]) == (22, 1)
+
+    asyncio.run(main())
+
+
+def test_streamed_request_is_not_hedged(fake_model_server, rolls):
+    async def main():
+        async with fake_model_server(latency=0.01, jitter=0, slow_rate=0.5, slow_latency=0.3) as url:
+            client = make_client(url, hedge=True, hedge_max_ratio=0.5)
+            try:
+                await warm_up(client)
+                rolls.extend([0.99, 0.0])
+                deltas = []
+                result = await client.complete_translation("Hello world", "French", on_delta=deltas.append)
+            finally:
+                await client.close()
+        assert "".join(deltas) == result["content"] == "HELLO WORLD"
+        assert client.scheduler.hedges == 0
+
+    asyncio.run(main())
@@ -0,0 +1,191 @@
+import io
+import asyncio
+
+import pytest
+
+from app.translation_engine import (
+    OrderedPageWriter, ProgressTracker, StreamingPageWriter, run_concurrently, translate_languages, translate_pages
+)
+
+
+def ordered_export(pages):
+    out = io.StringIO()
+    writer = OrderedPageWriter(out)
+    for page_number, content in pages.items():
+        writer.add(page_number, content)
+    return out.getvalue()
+
+
+def test_ordered_writer_waits_for_earlier_pages():
+    out = io.StringIO()
+    writer = OrderedPageWriter(out)
+    writer.add(2, "two")
+    assert out.getvalue() == ""
+    writer.add(1, "one")
+    assert out.getvalue() == "## Page 1\n\none\n\n## Page 2\n\ntwo\n\n"
+
+
+def test_streaming_writer_appends_the_next_page_as_it_arrives():
+    out = io.StringIO()
+    writer = StreamingPageWriter(out)
+    writer.add_delta(1, "Hel")
+    writer.add_delta(1, "lo")
+    assert out.getvalue() == "## Page 1\n\nHello"
+    # Deltas of a later page wait until it is next in line
+    writer.add_delta(2, "Wor")
+    assert out.getvalue() == "## Page 1\n\nHello"
+    writer.add(1, "Hello")
+    assert out.getvalue() == "## Page 1\n\nHello\n\n## Page 2\n\nWor"
+    writer.add_delta(2, "ld")
+    writer.add(2, "World")
+    assert out.getvalue() == ordered_export({1: "Hello", 2: "World"})
+
+
+def test_streaming_writer_replaces_superseded_text():
+    out = io.StringIO()
+    writer = StreamingPageWriter(out)
+    writer.add(1, "One")
+    writer.add_delta(2, "Half a stream that broke")
+    # A retry produced different text, the export must not keep the broken stream
+    writer.add(2, "Two")
+    writer.add_delta(3, "late delta of a page that is pending")
+    writer.add(4, "Four")
+    writer.add_delta(4, "ignored, the page is already final")
+    writer.add(3, "Three")
+    assert out.getvalue() == ordered_export({1: "One", 2: "Two", 3: "Three", 4: "Four"})
+
+
+def test_progress_counts_pages_in_any_order():
+    tracker = ProgressTracker(4)
+    assert tracker.progress == 0
+    tracker.page_done()
+    tracker.page_done()
+    assert tracker.progress == 50
+    assert ProgressTracker(0).progress == 100
+
+
+def test_run_concurrently_limits_concurrency_and_keeps_input_order():
+    running = 0
+    peak = 0
+    done_order = []
+
+    async def worker(n):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        # Later items finish first
+        await asyncio.sleep(0.01 * (6 - n))
+        running -= 1
+        return n * 10
+
+    async def on_done(result):
+        done_order.append(result)
+
+    results = asyncio.run(run_concurrently([1, 2, 3, 4, 5], worker, on_done, concurrency=2))
+
+    assert results == [10, 20, 30, 40, 50]
+    assert peak == 2
+    assert sorted(done_order) == results
+    assert done_order != results
+
+
+def test_run_concurrently_cancels_the_rest_when_one_fails():
+    cancelled = []
+
+    async def worker(n):
+        if n == 1:
+            raise RuntimeError("model unavailable")
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(n)
+            raise
+
+    with pytest.raises(RuntimeError, match="model unavailable"):
+        asyncio.run(run_concurrently([1, 2, 3], worker, concurrency=3))
+    assert sorted(cancelled) == [2, 3]
+
+
+def test_translate_pages_sends_repeated_segments_once():
+    header = "ACME Corp. Quarterly Report"
+    pages = [
+        {"page_number": 1, "content": f"{header}\nFirst page."},
+        {"page_number": 2, "content": f"{header}\nSecond page."},
+        {"page_number": 3, "content": "  "},
+    ]
+    requests = []
+    done = []
+
+    async def translate(texts, on_delta):
+        requests.append(texts)
+        return [text.upper() for text in texts]
+
+    async def on_page_done(page):
+        done.append(page["page_number"])
+
+    result = asyncio.run(translate_pages(pages, translate, on_page_done=on_page_done))
+
+    # The small segments are packed into one request
+    assert len(requests) == 1
+    assert sorted(requests[0]) == sorted([header, "First page.", "Second page."])
+    assert result["pages"] == [
+        {"page_number": 1, "content": f"{header.upper()}\nFIRST PAGE."},
+        {"page_number": 2, "content": f"{header.upper()}\nSECOND PAGE."},
+        {"page_number": 3, "content": "No content to translate."},
+    ]
+    # The blank page is done before any request goes out
+    assert done[0] == 3 and sorted(done) == [1, 2, 3]
+    assert result["deduplication"]["unique_segments"] == 4
+
+
+def test_streamed_page_text_adds_up_to_the_final_content():
+    pages = [
+        {"page_number": 1, "content": "Header line here\nFirst page body."},
+        {"page_number": 2, "content": "Header line here\n\nSecond page body."},
+    ]
+    streamed = {}
+    final = {}
+
+    async def translate(texts, on_delta):
+        translated = [text.upper() for text in texts]
+        for position, text in enumerate(translated):
+            for start in range(0, len(text), 3):
+                on_delta(position, text[start:start + 3])
+                await asyncio.sleep(0)
+        return translated
+
+    def on_page_delta(page_number, text):
+        streamed[page_number] = streamed.get(page_number, "") + text
+
+    async def on_page_done(page):
+        final[page["page_number"]] = page["content"]
+
+    asyncio.run(translate_pages(pages, translate, on_page_done=on_page_done, on_page_delta=on_page_delta))
+
+    assert final == {1: "HEADER LINE HERE\nFIRST PAGE BODY.", 2: "HEADER LINE HERE\n\nSECOND PAGE BODY."}
+    assert streamed == final
+
+
+def test_languages_share_one_run_and_take_turns():
+    # Every page is about 1000 tokens, so each one is a request of its own
+    pages = [{"page_number": n, "content": f"Page {n}. " + "word " * 800} for n in range(1, 4)]
+    calls = []
+    done = []
+
+    async def translate(language, texts, on_delta):
+        calls.append(language)
+        return [f"[{language}] {text}" for text in texts]
+
+    async def on_page_done(language, page):
+        done.append((language, page["page_number"]))
+
+    results = asyncio.run(translate_languages(
+        {"French": pages, "German": pages}, translate, on_page_done=on_page_done, concurrency=1
+    ))
+
+    assert calls == ["French", "German"] * 3
+    assert sorted(done) == [(language, n) for language in ("French", "German") for n in (1, 2, 3)]
+    for language in ("French", "German"):
+        assert [page["page_number"] for page in results[language]["pages"]] == [1, 2, 3]
+        assert results[language]["pages"][0]["content"].startswith(f"[{language}] Page 1.")
+        assert results[language]["requests"] == 3
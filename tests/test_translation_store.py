@@ -0,0 +1,61 @@
+from app.translation_store import TranslationStore
+
+
+def make_store(tmp_path):
+    return TranslationStore(str(tmp_path / "translations.sqlite3"))
+
+
+def test_every_run_gets_a_new_version(tmp_path):
+    store = make_store(tmp_path)
+    assert store.get("doc", "French") is None
+    assert store.start("doc", "French", 3) == 1
+    assert store.get("doc", "french")["status"] == "translating"
+    store.complete("doc", "FRENCH")
+    assert store.get("doc", "French")["status"] == "completed"
+
+    assert store.start("doc", "french", 3) == 2
+    translation = store.get("doc", "French")
+    assert (translation["status"], translation["version"], translation["total_pages"]) == ("translating", 2, 3)
+    # Other documents and languages count their own versions
+    assert store.start("doc", "German", 3) == 1
+    assert store.start("other", "French", 1) == 1
+
+
+def test_pages_are_looked_up_by_range(tmp_path):
+    store = make_store(tmp_path)
+    store.start("doc", "French", 5)
+    for page_number in (4, 1, 5, 2, 3):
+        store.put_page("doc", "French", page_number, f"page {page_number}")
+    # A page translated again replaces the earlier text
+    store.put_page("doc", "french", 2, "page 2 again")
+
+    assert [page["page_number"] for page in store.get_pages("doc", "French")] == [1, 2, 3, 4, 5]
+    assert store.get_pages("doc", "French", 2, 3) == [
+        {"page_number": 2, "content": "page 2 again"},
+        {"page_number": 3, "content": "page 3"},
+    ]
+    assert store.get_pages("doc", "French", 5) == [{"page_number": 5, "content": "page 5"}]
+    assert store.get_pages("doc", "French", 6, 10) == []
+    assert store.get_pages("doc", "German") == []
+
+
+def test_only_completed_languages_are_listed(tmp_path):
+    store = make_store(tmp_path)
+    store.start("doc", "French", 1)
+    store.complete("doc", "French")
+    store.start("doc", "German", 1)
+    assert store.languages("doc") == ["french"]
+
+
+def test_translations_survive_a_restart_until_deleted(tmp_path):
+    store = make_store(tmp_path)
+    store.start("doc", "French", 1)
+    store.put_page("doc", "French", 1, "Bonjour")
+    store.complete("doc", "French")
+
+    store = make_store(tmp_path)
+    assert store.get_pages("doc", "French") == [{"page_number": 1, "content": "Bonjour"}]
+    store.delete("doc")
+    assert store.get("doc", "French") is None
+    assert store.get_pages("doc", "French") == []
+    assert make_store(tmp_path).languages("doc") == []
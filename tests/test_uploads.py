@@ -0,0 +1,120 @@
+import os
+import asyncio
+import hashlib
+
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from app.documents import DocumentStore
+from app.uploads import receive_upload
+
+BOUNDARY = "test-boundary"
+
+
+def multipart_body(fields, files):
+    body = b""
+    for name, value in fields.items():
+        body += (
+            f"--{BOUNDARY}\r\nContent-Disposition: form-data; name=\"{name}\"\r\n\r\n{value}\r\n"
+        ).encode()
+    for name, filename, data in files:
+        body += (
+            f"--{BOUNDARY}\r\nContent-Disposition: form-data; name=\"{name}\"; filename=\"{filename}\"\r\n"
+            "Content-Type: application/pdf\r\n\r\n"
+        ).encode() + data + b"\r\n"
+    return body + f"--{BOUNDARY}--\r\n".encode()
+
+
+def make_request(body, chunk_size=1000, content_type=f"multipart/form-data; boundary={BOUNDARY}",
+                 content_length=True):
+    """A request whose body arrives in chunks, like a slow client's"""
+    chunks = [body[start:start + chunk_size] for start in range(0, len(body), chunk_size)] or [b""]
+    headers = [(b"content-type", content_type.encode())]
+    if content_length:
+        headers.append((b"content-length", str(len(body)).encode()))
+    scope = {"type": "http", "method": "POST", "path": "/api/upload", "headers": headers}
+
+    async def receive():
+        data = chunks.pop(0)
+        return {"type": "http.request", "body": data, "more_body": bool(chunks)}
+
+    return Request(scope, receive)
+
+
+def test_files_are_streamed_to_disk_with_their_hash(tmp_path):
+    data = os.urandom(50_000)
+    body = multipart_body({"target_language": "French"}, [("file", "../report.pdf", data)])
+
+    upload = asyncio.run(receive_upload(make_request(body), str(tmp_path)))
+
+    assert upload["fields"] == {"target_language": "French"}
+    [stored] = upload["files"]
+    assert stored["field"] == "file"
+    # The client's path is never trusted
+    assert stored["filename"] == "report.pdf"
+    assert stored["size"] == len(data)
+    assert stored["sha256"] == hashlib.sha256(data).hexdigest()
+    assert os.path.dirname(stored["path"]) == str(tmp_path)
+    with open(stored["path"], "rb") as f:
+        assert f.read() == data
+
+
+def test_identical_uploads_have_the_same_hash(tmp_path):
+    data = b"%PDF-1.4 same content"
+    hashes = set()
+    for filename in ("a.pdf", "b.pdf"):
+        body = multipart_body({}, [("file", filename, data)])
+        upload = asyncio.run(receive_upload(make_request(body, chunk_size=7), str(tmp_path)))
+        hashes.add(upload["files"][0]["sha256"])
+    assert len(hashes) == 1
+
+
+def test_oversized_upload_is_rejected_while_streaming(tmp_path):
+    body = multipart_body({}, [("file", "big.pdf", b"x" * 5000)])
+    # Without a Content-Length the limit is only noticed once the bytes arrive
+    request = make_request(body, chunk_size=512, content_length=False)
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(receive_upload(request, str(tmp_path), max_size=1000))
+
+    assert error.value.status_code == 413
+    # The partial file is removed
+    assert os.listdir(tmp_path) == []
+
+
+def test_oversized_content_length_is_rejected_up_front(tmp_path):
+    body = multipart_body({}, [("file", "big.pdf", b"x" * 200_000)])
+    request = make_request(body)
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(receive_upload(request, str(tmp_path), max_size=1000))
+    assert error.value.status_code == 413
+
+
+def test_other_content_types_are_rejected(tmp_path):
+    request = make_request(b"{}", content_type="application/json")
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(receive_upload(request, str(tmp_path)))
+    assert error.value.status_code == 400
+
+
+def test_documents_are_found_by_content_hash(tmp_path):
+    store = DocumentStore(str(tmp_path / "documents.sqlite3"))
+    pages = [{"page_number": 1, "content": "one"}, {"page_number": 2, "content": "two"}]
+    # Pages are stored window by window while the document is extracted
+    store.add_pages("doc", pages[:1])
+    store.add_pages("doc", pages[1:])
+    # Until it is registered an identical upload does not find it
+    assert store.find_by_hash("abc123") is None
+    store.register("doc", "abc123", "report.pdf", 1000, len(pages))
+
+    found = store.find_by_hash("abc123")
+    assert found["file_id"] == "doc"
+    assert found["total_pages"] == 2
+    assert store.get_pages("doc") == pages
+    assert store.find_by_hash("other") is None
+
+    store.delete("doc")
+    assert store.find_by_hash("abc123") is None
+    assert store.get_pages("doc") == []